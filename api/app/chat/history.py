@@ -0,0 +1,123 @@
+import os
+from collections.abc import Sequence
+
+from sqlalchemy import Engine
+from sqlmodel import select
+
+from api.app.database.database import fetch_all
+from api.app.models import ChatLog
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# AI に渡す会話履歴の上限 (デプロイごとに環境変数で調整する)
+# CHAT_HISTORY_MAX_TURNS: 直近何往復分を読み込むか (0 の場合は全件)
+# CHAT_HISTORY_MAX_TOKENS: 読み込んだ履歴のうち、推定トークン数がこの値に収まる分だけを使う (0 の場合は無制限)
+HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS") or 20)
+HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS") or 0)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算。
+    日本語は UTF-8 で 1 文字 3 バイト・約 1 トークン、英語は約 3〜4 文字で 1 トークンのため、バイト数 / 3 で近似する。
+    """
+    return -(-len(text.encode("utf-8")) // 3)
+
+
+def to_tagged_conversations(chats: Sequence[ChatLog]) -> list[tuple[str, str]]:
+    """古い順に並んだ ChatLog を SC_AI.Chat に渡す (role, text) のリストに変換する。"""
+    tagged_conversations: list[tuple[str, str]] = []
+    for chat in chats:
+        if chat.message:
+            tagged_conversations.append(("human", chat.message))
+        if chat.bot_reply:
+            tagged_conversations.append(("ai", chat.bot_reply))
+    return tagged_conversations
+
+
+def trim_to_token_budget(chats: Sequence[ChatLog], max_tokens: int) -> Sequence[ChatLog]:
+    """新しい往復から順に、推定トークン数が max_tokens に収まる分だけを残す。"""
+    if max_tokens <= 0:
+        return chats
+    used = 0
+    start = len(chats)
+    for i in range(len(chats) - 1, -1, -1):
+        used += estimate_tokens(chats[i].message or "") + estimate_tokens(chats[i].bot_reply or "")
+        if used > max_tokens:
+            break
+        start = i
+    return chats[start:]
+
+
+def trim_conversations(
+    tagged_conversations: list[tuple[str, str]],
+    max_turns: int | None = None,
+    max_tokens: int | None = None,
+) -> list[tuple[str, str]]:
+    """
+    (role, text) のリストを load_recent_history と同じ窓 (往復数・推定トークン数) に切り詰める。
+    キャッシュに追記した履歴が上限を超えて伸び続けないようにするために使う。
+    """
+    max_turns = HISTORY_MAX_TURNS if max_turns is None else max_turns
+    max_tokens = HISTORY_MAX_TOKENS if max_tokens is None else max_tokens
+
+    # human の発話を起点に往復単位へまとめる
+    turns: list[list[tuple[str, str]]] = []
+    for role, text in tagged_conversations:
+        if role == "human" or not turns:
+            turns.append([])
+        turns[-1].append((role, text))
+
+    if max_turns > 0:
+        turns = turns[-max_turns:]
+    if max_tokens > 0:
+        used = 0
+        start = len(turns)
+        for i in range(len(turns) - 1, -1, -1):
+            used += sum(estimate_tokens(text) for _, text in turns[i])
+            if used > max_tokens:
+                break
+            start = i
+        turns = turns[start:]
+    return [entry for turn in turns for entry in turn]
+
+
+async def load_recent_history(
+    engine: Engine,
+    session_id: int,
+    max_turns: int | None = None,
+    max_tokens: int | None = None,
+) -> list[tuple[str, str]]:
+    """
+    セッションの直近の会話履歴を読み込む。
+
+    ORDER BY pub_data DESC LIMIT で末尾の max_turns 往復のみを取得するため、
+    セッションが長くなってもクエリ・メモリ・プロンプトの大きさは一定に保たれる。
+    (session_id, pub_data) の複合インデックスを前提とする。
+
+    Args:
+        engine (Engine): データベースエンジン。
+        session_id (int): セッションID。
+        max_turns (int | None): 読み込む往復数の上限。None の場合は CHAT_HISTORY_MAX_TURNS。
+        max_tokens (int | None): 推定トークン数の上限。None の場合は CHAT_HISTORY_MAX_TOKENS。
+
+    Returns:
+        list[tuple[str, str]]: 古い順に並んだ (role, text) のリスト。
+    """
+    max_turns = HISTORY_MAX_TURNS if max_turns is None else max_turns
+    max_tokens = HISTORY_MAX_TOKENS if max_tokens is None else max_tokens
+
+    stmt = (
+        select(ChatLog)
+        .where(ChatLog.session_id == session_id)
+        .order_by(ChatLog.pub_data.desc(), ChatLog.id.desc())  # type: ignore[union-attr]
+    )
+    if max_turns > 0:
+        stmt = stmt.limit(max_turns)
+
+    # 新しい順に取得したものを古い順に戻す
+    recent_chats = list(reversed(await fetch_all(engine, stmt)))
+    recent_chats = list(trim_to_token_budget(recent_chats, max_tokens))
+    logger.debug("Loaded %d turns of history for session %s", len(recent_chats), session_id)
+    return to_tagged_conversations(recent_chats)
@@ -0,0 +1,216 @@
+import itertools
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any
+
+from api.app.cache import (  # noqa: F401 (FakeKeyValueClient は再エクスポート)
+    FakeKeyValueClient,
+    KeyValueClient,
+    TTLCache,
+)
+from api.app.chat.history import trim_conversations
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+Conversations = list[tuple[str, str]]
+
+# 会話履歴キャッシュの設定
+# CHAT_HISTORY_CACHE: local (プロセス内 LRU), shared (Redis 互換の共有キャッシュ), none (無効)
+CACHE_BACKEND = os.getenv("CHAT_HISTORY_CACHE") or "local"
+CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE") or 1024)
+CACHE_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL") or 600)
+CACHE_URL = os.getenv("CHAT_HISTORY_CACHE_URL")
+
+
+class HistoryCache(ABC):
+    """
+    セッションIDをキーに tagged_conversations を保持するキャッシュのインターフェース。
+    共有バックエンドはネットワーク越しになるため、操作はすべて非同期とする。
+
+    ミスした履歴を DB から読み込んで set するまでの間に append (別のリクエストの往復の追記) が行われると、
+    古い履歴で上書きしてしまう。これを防ぐため、読み込む前に generation を取得して set に渡し、
+    その間に append・invalidate が行われていた場合は set しない。
+    """
+
+    @abstractmethod
+    async def get(self, session_id: int) -> Conversations | None: ...
+
+    @abstractmethod
+    async def generation(self, session_id: int) -> Any:
+        """履歴の世代を返す。append・invalidate のたびに変わる。"""
+
+    @abstractmethod
+    async def set(self, session_id: int, conversations: Conversations, generation: Any = None) -> bool:
+        """
+        履歴を保存する。
+
+        Args:
+            generation (Any): 読み込む前に取得した generation の戻り値。
+                指定した場合は、その後に append・invalidate が行われていれば保存しない。
+
+        Returns:
+            bool: 保存した場合は True。
+        """
+
+    @abstractmethod
+    async def append(self, session_id: int, entries: Conversations) -> None:
+        """キャッシュ済みの履歴の末尾に追記する。キャッシュされていない場合は何もしない。"""
+
+    @abstractmethod
+    async def invalidate(self, session_id: int) -> None: ...
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+class NullHistoryCache(HistoryCache):
+    """キャッシュを無効にする場合の実装。常にミスする。"""
+
+    async def get(self, session_id: int) -> Conversations | None:
+        return None
+
+    async def generation(self, session_id: int) -> Any:
+        return None
+
+    async def set(self, session_id: int, conversations: Conversations, generation: Any = None) -> bool:
+        return False
+
+    async def append(self, session_id: int, entries: Conversations) -> None:
+        return None
+
+    async def invalidate(self, session_id: int) -> None:
+        return None
+
+
+class LocalHistoryCache(HistoryCache):
+    """プロセス内の LRU キャッシュ。"""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL) -> None:
+        self._cache: TTLCache[int, Conversations] = TTLCache(maxsize, ttl)
+        # セッションID -> 最後に append・invalidate した際の通し番号
+        self._generations: TTLCache[int, int] = TTLCache(maxsize, ttl)
+        self._counter = itertools.count(1)
+
+    async def get(self, session_id: int) -> Conversations | None:
+        conversations = self._cache.get(session_id)
+        # 呼び出し側で変更されてもキャッシュに影響しないようコピーを返す
+        return list(conversations) if conversations is not None else None
+
+    async def generation(self, session_id: int) -> Any:
+        return self._generations.get(session_id) or 0
+
+    async def set(self, session_id: int, conversations: Conversations, generation: Any = None) -> bool:
+        # イベントループ上でのみ操作するため、確認と保存の間に append は割り込まない
+        if generation is not None and (self._generations.get(session_id) or 0) != generation:
+            return False
+        self._cache.set(session_id, list(conversations))
+        return True
+
+    async def append(self, session_id: int, entries: Conversations) -> None:
+        self._generations.set(session_id, next(self._counter))
+        self._cache.update(session_id, lambda current: trim_conversations(current + entries))
+
+    async def invalidate(self, session_id: int) -> None:
+        self._generations.set(session_id, next(self._counter))
+        self._cache.pop(session_id)
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": type(self).__name__, **self._cache.stats()}
+
+
+class SharedHistoryCache(HistoryCache):
+    """
+    複数の Azure Functions インスタンス間で共有するキャッシュ。
+    値は JSON で保存し、有効期限はバックエンド側の TTL に任せる。
+    """
+
+    def __init__(self, client: KeyValueClient, ttl: int = CACHE_TTL, prefix: str = "chat_history:") -> None:
+        self._client = client
+        self._ttl = ttl
+        self._prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, session_id: int) -> str:
+        return f"{self._prefix}{session_id}"
+
+    def _generation_key(self, session_id: int) -> str:
+        return f"{self._prefix}generation:{session_id}"
+
+    async def _bump_generation(self, session_id: int) -> None:
+        await self._client.set(self._generation_key(session_id), uuid.uuid4().hex, ex=self._ttl)
+
+    async def get(self, session_id: int) -> Conversations | None:
+        raw = await self._client.get(self._key(session_id))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [(role, text) for role, text in json.loads(raw)]
+
+    async def generation(self, session_id: int) -> Any:
+        # まだ append・invalidate されていない場合は空文字列 (None は「確認しない」を意味するため使わない)
+        return await self._client.get(self._generation_key(session_id)) or ""
+
+    async def set(self, session_id: int, conversations: Conversations, generation: Any = None) -> bool:
+        # 確認と保存の間は原子的ではないが、DB の読み込み中に行われた append は確実に検出できる
+        if generation is not None and await self.generation(session_id) != generation:
+            return False
+        await self._client.set(self._key(session_id), json.dumps(conversations, ensure_ascii=False), ex=self._ttl)
+        return True
+
+    async def append(self, session_id: int, entries: Conversations) -> None:
+        await self._bump_generation(session_id)
+        # 読み込み→書き込みのため厳密な原子性はないが、同一セッションへの同時書き込みは稀なため許容する
+        current = await self.get(session_id)
+        if current is None:
+            return
+        await self.set(session_id, trim_conversations(current + entries))
+
+    async def invalidate(self, session_id: int) -> None:
+        await self._bump_generation(session_id)
+        await self._client.delete(self._key(session_id))
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+def create_history_cache() -> HistoryCache:
+    """環境変数の設定から会話履歴キャッシュを作成する。"""
+    if CACHE_BACKEND == "none":
+        return NullHistoryCache()
+    if CACHE_BACKEND == "shared":
+        if not CACHE_URL:
+            raise ValueError("CHAT_HISTORY_CACHE_URL is required when CHAT_HISTORY_CACHE=shared")
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise ImportError("CHAT_HISTORY_CACHE=shared requires the 'redis' package") from e
+        return SharedHistoryCache(Redis.from_url(CACHE_URL, decode_responses=True))
+    return LocalHistoryCache()
+
+
+_history_cache: HistoryCache | None = None
+
+
+def get_history_cache() -> HistoryCache:
+    global _history_cache  # noqa: PLW0603
+    if _history_cache is None:
+        _history_cache = create_history_cache()
+        logger.info("Chat history cache: %s", type(_history_cache).__name__)
+    return _history_cache
+
+
+def set_history_cache(cache: HistoryCache | None) -> None:
+    """キャッシュの実装を差し替える (テストで FakeKeyValueClient を使う場合など)。"""
+    global _history_cache  # noqa: PLW0603
+    _history_cache = cache
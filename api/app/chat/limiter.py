@@ -0,0 +1,193 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Hashable
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import HTTPException, status
+
+from api.app.executor import AI_POOL, executors
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# AI 呼び出しの同時実行数の制限
+# AI_MAX_IN_FLIGHT: インスタンスあたりの同時実行数 (未設定の場合は AI 用ワーカープールのワーカー数)
+# AI_QUEUE_TIMEOUT: 実行枠が空くまで待つ最大秒数
+# AI_MAX_QUEUED_PER_USER: 1 ユーザーが同時に待たせられるリクエスト数
+MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT") or 0)
+QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT") or 30)
+MAX_QUEUED_PER_USER = int(os.getenv("AI_MAX_QUEUED_PER_USER") or 4)
+
+
+class AIQueueTimeoutError(HTTPException):
+    """AI 呼び出しの実行枠を待つ間にタイムアウトした場合に送出される例外。"""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="AI の応答待ちが混み合っています。しばらくしてから再試行してください。",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class AIQueueFullError(HTTPException):
+    """同じユーザーの待ちリクエストが上限に達している場合に送出される例外。"""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="処理中のチャットが多すぎます。前の応答を待ってから再試行してください。",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class FairLimiter:
+    """
+    同時実行数に上限を設け、空きを待つリクエストをユーザー間で公平に割り当てるリミッター。
+
+    待ち行列はユーザーごとの FIFO で、空いた実行枠はユーザー単位のラウンドロビンで渡す。
+    1 ユーザーが大量のリクエストを送っても、他のユーザーの待ち時間は「待っているユーザー数」分に収まる。
+    イベントループ上でのみ操作するため、ロックは使用しない。
+    """
+
+    def __init__(self, max_in_flight: int, queue_timeout: float, max_queued_per_user: int) -> None:
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.max_queued_per_user = max_queued_per_user
+        self._in_flight = 0
+        # ユーザーごとの待ち行列 (先頭のユーザーから順に実行枠を渡す)
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future[None]]] = OrderedDict()
+        self.granted = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._waited = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _retry_after(self) -> int:
+        return max(1, int(self.queue_timeout // 2))
+
+    def _record_wait(self, seconds: float) -> None:
+        self._waited += 1
+        self._wait_total += seconds
+        self._wait_max = max(self._wait_max, seconds)
+
+    def _remove_waiter(self, user_id: Hashable, waiter: asyncio.Future[None]) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[user_id]
+
+    def _grant_next(self) -> None:
+        while self._in_flight < self.max_in_flight and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                # 同じユーザーの次のリクエストは、他のユーザーの後に回す
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self._in_flight += 1
+            self.granted += 1
+
+    async def acquire(self, user_id: Hashable) -> None:
+        """
+        実行枠を 1 つ確保する。空きがなければ FIFO で待つ。
+
+        Raises:
+            AIQueueFullError: 同じユーザーの待ちリクエストが上限に達している場合 (429)。
+            AIQueueTimeoutError: queue_timeout 秒以内に実行枠が空かなかった場合 (503)。
+        """
+        if self._in_flight < self.max_in_flight and not self._queues:
+            self._in_flight += 1
+            self.granted += 1
+            return
+
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self.max_queued_per_user:
+            self.rejected += 1
+            raise AIQueueFullError(self._retry_after())
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # タイムアウトと同時に実行枠が渡された場合はそのまま使う
+                self._record_wait(time.perf_counter() - start)
+                return
+            waiter.cancel()
+            self._remove_waiter(user_id, waiter)
+            self.timeouts += 1
+            logger.warning("AI queue timeout: user=%s, waiting=%d", user_id, self.waiting)
+            raise AIQueueTimeoutError(self._retry_after()) from None
+        except asyncio.CancelledError:
+            # クライアントの切断などで待機が中断された場合、渡された実行枠は返却する
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._remove_waiter(user_id, waiter)
+            raise
+        self._record_wait(time.perf_counter() - start)
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable) -> AsyncIterator[None]:
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "waiting": self.waiting,
+            "waiting_users": len(self._queues),
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "wait_avg_ms": (self._wait_total / self._waited * 1000) if self._waited else 0.0,
+            "wait_max_ms": self._wait_max * 1000,
+        }
+
+
+_ai_limiter: FairLimiter | None = None
+
+
+def get_ai_limiter() -> FairLimiter:
+    global _ai_limiter  # noqa: PLW0603
+    if _ai_limiter is None:
+        # 既定では AI 用ワーカープールのワーカー数に合わせ、プール側の待ち行列を使わずに済むようにする
+        max_in_flight = MAX_IN_FLIGHT or executors.get(AI_POOL).max_workers
+        _ai_limiter = FairLimiter(max_in_flight, QUEUE_TIMEOUT, MAX_QUEUED_PER_USER)
+        logger.info("AI limiter created: max_in_flight=%d, queue_timeout=%.1fs", max_in_flight, QUEUE_TIMEOUT)
+    return _ai_limiter
+
+
+def set_ai_limiter(limiter: FairLimiter | None) -> None:
+    """リミッターを差し替える (テストで上限を変更する場合など)。"""
+    global _ai_limiter  # noqa: PLW0603
+    _ai_limiter = limiter
@@ -0,0 +1,153 @@
+import os
+
+from fastapi import HTTPException
+from sc_system_ai.template.session_naming import session_naming
+from sqlalchemy import Engine, func, update
+from sqlmodel import select
+
+from api.app.chat.limiter import get_ai_limiter
+from api.app.database.database import execute_statement, fetch_all
+from api.app.database.unit_of_work import current_unit_of_work
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.metrics import llm_call_duration, llm_call_errors, track
+from api.app.models import ChatLog, NamingStatus, Session
+from api.app.tasks import task_queue
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# セッション名を付け直す間隔 (往復数)。0 の場合は最初の往復の後に 1 回だけ生成する
+NAMING_EVERY_N_TURNS = int(os.getenv("SESSION_NAMING_EVERY_N_TURNS") or 0)
+
+# AI リミッター上でバックグラウンドの命名処理をまとめて 1 ユーザーとして扱うためのキー
+NAMING_LIMITER_KEY = "__session_naming__"
+
+
+# 作成時に付く仮のセッション名 (このままの場合はまだ命名されていない)
+DEFAULT_SESSION_NAMES = ("New Session", "NewSession")
+
+
+def needs_first_naming(session: Session) -> bool:
+    """
+    保存されている状態から、セッションがまだ命名されていないかどうかを判定する。
+    会話履歴の件数では判定しない (履歴の読み込みに失敗して空になった場合に毎回命名し直してしまうため)。
+    生成に失敗したセッションは、名前が仮のままであれば次の往復で再度生成する。
+    """
+    return (
+        session.naming_status in (None, NamingStatus.FAILED)
+        and session.session_name in DEFAULT_SESSION_NAMES
+    )
+
+
+def should_name_session(turn: int, every_n_turns: int = NAMING_EVERY_N_TURNS) -> bool:
+    """命名済みのセッションについて、turn 回目の往復の後にセッション名を付け直すかどうかを判定する。"""
+    return every_n_turns > 0 and turn % every_n_turns == 0
+
+
+async def count_turns(engine: Engine, session_id: int) -> int:
+    """セッションに保存されているチャットの往復数を返す。"""
+    stmt = select(func.count()).select_from(ChatLog).where(ChatLog.session_id == session_id)
+    return (await fetch_all(engine, stmt))[0]
+
+
+async def name_session(
+    engine: Engine, session_id: int, conversations: list[tuple[str, str]], current_name: str
+) -> None:
+    """
+    セッション名を生成して保存する。バックグラウンドタスクとして実行される。
+    登録から保存までの間にユーザーがセッション名を変更した場合は、生成した名前で上書きしない。
+
+    Args:
+        current_name (str): 登録した時点のセッション名。
+    """
+    try:
+        async with get_ai_limiter().slot(NAMING_LIMITER_KEY):
+            with track(llm_call_duration, llm_call_errors, "naming"):
+                session_name = await run_in_pool(AI_POOL, session_naming, conversations)
+    except Exception as e:
+        logger.error("セッション名の生成に失敗しました。セッションID: %s, エラー: %s", session_id, e)
+        session_name = None
+
+    by_id = update(Session).where(Session.id == session_id)
+    try:
+        if session_name is None:
+            saved = await execute_statement(engine, by_id.values(naming_status=NamingStatus.FAILED))
+        else:
+            # 名前が登録時のままの場合のみ書き込む
+            saved = await execute_statement(
+                engine,
+                by_id.where(Session.session_name == current_name).values(
+                    session_name=session_name, naming_status=NamingStatus.DONE
+                ),
+            )
+            if not saved:
+                saved = await execute_statement(engine, by_id.values(naming_status=NamingStatus.DONE))
+                if saved:
+                    logger.info("セッション名が生成中に変更されたため上書きしません。セッションID: %s", session_id)
+                    return
+    except HTTPException as e:
+        logger.warning("セッション名を保存できませんでした。セッションID: %s, 詳細: %s", session_id, e.detail)
+        return
+    if not saved:
+        # 生成中にセッションが削除された場合
+        logger.warning("セッション名を保存できませんでした。セッションが存在しません。セッションID: %s", session_id)
+        return
+    logger.info("セッション名を更新しました。セッションID: %s, セッション名: %s", session_id, session_name)
+
+
+async def schedule_session_naming(
+    engine: Engine,
+    session_id: int,
+    conversations: list[tuple[str, str]],
+) -> bool:
+    """
+    必要であればセッション名の生成をバックグラウンドタスクに登録する。
+    まだ命名されていないセッション (needs_first_naming) の場合、
+    または SESSION_NAMING_EVERY_N_TURNS 往復ごとに生成する。
+
+    Returns:
+        bool: 登録した場合は True。
+    """
+    sessions = await fetch_all(engine, select(Session).where(Session.id == session_id))
+    if not sessions:
+        return False
+    session = sessions[0]
+    if not needs_first_naming(session):
+        if NAMING_EVERY_N_TURNS <= 0 or session.naming_status == NamingStatus.PENDING:
+            return False
+        if not should_name_session(await count_turns(engine, session_id)):
+            return False
+
+    # 読み込んだ時点の状態のままの場合のみ pending にする (同時に保存された往復と二重に登録しない)
+    observed = (
+        Session.naming_status.is_(None)
+        if session.naming_status is None
+        else Session.naming_status == session.naming_status
+    )
+    stmt = update(Session).where(Session.id == session_id, observed).values(naming_status=NamingStatus.PENDING)
+    if not await execute_statement(engine, stmt):
+        return False
+    current_name = session.session_name
+    key = f"session_naming:{session_id}"
+
+    async def enqueue() -> bool:
+        if task_queue.enqueue(lambda: name_session(engine, session_id, conversations, current_name), key=key):
+            return True
+        if task_queue.is_pending(key):
+            # 同じセッションのタスクが待ち行列にあれば、そのタスクが状態を更新する
+            return True
+        # 待ち行列が満杯で登録できなかった場合、pending のまま残るとポーリングが終わらないため失敗にする
+        await execute_statement(
+            engine,
+            update(Session)
+            .where(Session.id == session_id, Session.naming_status == NamingStatus.PENDING)
+            .values(naming_status=NamingStatus.FAILED),
+        )
+        return False
+
+    # Unit of Work の中では、コミット前のセッションをタスクが読みに行かないようコミット後に登録する
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.after_commit(enqueue)
+        return True
+    return await enqueue()
@@ -0,0 +1,60 @@
+import os
+from dataclasses import dataclass, field
+
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.metrics import track, vector_search_duration, vector_search_errors
+from api.app.middleware.timing import span
+from api.app.vector_store.client import VECTOR_STORE_BACKEND, SearchableVectorStore, SearchHit, get_vector_store
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# チャットの応答に使う学校情報を、バックエンドで検索できるベクターストア (VECTOR_STORE_BACKEND=local) から取得する設定
+# CHAT_RETRIEVAL_K: 1 回の発言で取得する学校情報の件数 (0 の場合は取得しない)
+# CHAT_RETRIEVAL_MAX_CHARS: AI に渡す学校情報 1 件あたりの最大文字数
+# cosmos の場合は sc_system_ai のエージェントが Cosmos DB を直接検索するため、ここでは取得しない
+CHAT_RETRIEVAL_K = int(os.getenv("CHAT_RETRIEVAL_K") or 3)
+CHAT_RETRIEVAL_MAX_CHARS = int(os.getenv("CHAT_RETRIEVAL_MAX_CHARS") or 1000)
+
+GROUNDING_HEADER = "以下は質問に関連する学校情報です。回答の根拠として使ってください。"
+
+
+@dataclass
+class Grounding:
+    """チャットの 1 往復で AI に渡す学校情報。"""
+
+    conversation: list[tuple[str, str]] = field(default_factory=list)
+    document_ids: list[int] = field(default_factory=list)
+
+
+def format_grounding(hits: list[SearchHit], max_chars: int = CHAT_RETRIEVAL_MAX_CHARS) -> str:
+    """検索結果を、会話の先頭に追加する 1 つのメッセージにまとめる。"""
+    sections = [GROUNDING_HEADER]
+    for hit in hits:
+        sections.append(f"## {hit.title} (ID: {hit.source_id})\n{hit.text[:max_chars]}")
+    return "\n\n".join(sections)
+
+
+async def retrieve_grounding(message: str, k: int = CHAT_RETRIEVAL_K) -> Grounding:
+    """
+    発言に近い学校情報をベクターストアから検索し、AI に渡す会話と参照した学校情報の ID を返す。
+    ベクターストアが検索に対応していない場合や、検索に失敗した場合は何も追加しない (チャット自体は続ける)。
+    """
+    if k <= 0 or not message:
+        return Grounding()
+    vector_store = get_vector_store()
+    if not isinstance(vector_store, SearchableVectorStore):
+        return Grounding()
+
+    try:
+        # 発言の埋め込みの作成 (外部 API の呼び出し) を含むため、AI 用のスレッドプールで実行する
+        with span("retrieval"), track(vector_search_duration, vector_search_errors, VECTOR_STORE_BACKEND):
+            hits = await run_in_pool(AI_POOL, vector_store.search, message, k)
+    except Exception as e:
+        logger.warning("学校情報の検索に失敗したため、検索結果なしで応答します: %s", e)
+        return Grounding()
+
+    logger.debug("チャットで参照する学校情報: %s", [hit.source_id for hit in hits])
+    if not hits:
+        return Grounding()
+    return Grounding([("system", format_grounding(hits))], [hit.source_id for hit in hits])
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+from collections.abc import AsyncIterator, Callable, Iterable
+from typing import Any, Generic, TypeVar
+
+from api.app.executor import executors
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _StreamError:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class ThreadedStream(Generic[T]):
+    """
+    同期ジェネレータ (SC_AI.Chat のストリーミング応答など) をワーカープール上で回し、
+    得られたチャンクを到着した順にイベントループ側へ受け渡す。
+
+    cancel() が呼ばれると、次のチャンクを受け取った時点で読み出しを止めてジェネレータを close する。
+    これにより、クライアントが切断した場合に上流の生成も打ち切られる。
+    """
+
+    def __init__(self, pool_name: str, factory: Callable[[], Iterable[T]]) -> None:
+        self._pool_name = pool_name
+        self._factory = factory
+        self._queue: asyncio.Queue[Any] = asyncio.Queue()
+        self._stop = threading.Event()
+        self._future: asyncio.Future[None] | None = None
+
+    def start(self) -> "asyncio.Future[None]":
+        """
+        ワーカープールに読み出し処理を投入する。
+        返り値の Future はワーカー上の読み出しが終わった時点 (キャンセル時を含む) で完了する。
+
+        Raises:
+            PoolSaturatedError: ワーカープールが飽和している場合。
+        """
+        loop = asyncio.get_running_loop()
+
+        def put(item: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(self._queue.put_nowait, item)
+            except RuntimeError:
+                # イベントループが既に閉じている場合は受け取り手がいないため破棄する
+                self._stop.set()
+
+        def pump() -> None:
+            iterator = None
+            try:
+                iterator = iter(self._factory())
+                for item in iterator:
+                    if self._stop.is_set():
+                        logger.info("Stream cancelled; closing upstream generator.")
+                        break
+                    put(item)
+            except BaseException as e:
+                put(_StreamError(e))
+                return
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+            put(_DONE)
+
+        self._future = executors.get(self._pool_name).submit(pump)
+        return self._future
+
+    def cancel(self) -> None:
+        self._stop.set()
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        if self._future is None:
+            self.start()
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.error
+                yield item
+        finally:
+            self.cancel()
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Server-Sent Events 形式の 1 イベントを作成する。"""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = "\n".join(f"data: {line}" for line in payload.splitlines() or [""])
+    return f"event: {event}\n{lines}\n\n"
+
+
+def format_ndjson(event: str, data: Any) -> str:
+    """NDJSON 形式の 1 行を作成する。"""
+    return json.dumps({"type": event, "data": data}, ensure_ascii=False) + "\n"
@@ -0,0 +1,117 @@
+# api/app/database/async_database.py
+import logging
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from typing import Any, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy import Executable
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from api.app.database.statements import apply_updates, build_select
+from api.app.database.unit_of_work import current_unit_of_work
+
+logger = logging.getLogger("database")
+
+M = TypeVar("M", bound=SQLModel)
+
+# api/app/database/database.py のヘルパーと同じシグネチャを持つ AsyncSession 版。
+# DB_ASYNC が有効な場合、database.py のヘルパーからこちらに処理が委譲される。
+
+
+def _session(engine: AsyncEngine) -> AsyncSession:
+    # commit 後に属性アクセスで暗黙の I/O が発生しないよう expire_on_commit を無効にする
+    return AsyncSession(engine, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def _read_session(engine: AsyncEngine) -> AsyncIterator[AsyncSession]:
+    uow = current_unit_of_work()
+    if uow is not None and uow.is_async:
+        yield uow.async_session()
+        return
+    async with _session(engine) as session:
+        yield session
+
+
+@asynccontextmanager
+async def _write_session(engine: AsyncEngine) -> AsyncIterator[AsyncSession]:
+    # Unit of Work の中では flush のみ行い、コミットは Unit of Work に任せる (database._write_session と同じ)
+    uow = current_unit_of_work()
+    if uow is not None and uow.is_async:
+        session = uow.async_session()
+        yield session
+        await session.flush()
+        return
+    async with _session(engine) as session:
+        yield session
+        await session.commit()
+
+
+async def fetch_all(engine: AsyncEngine, stmt: SelectOfScalar[M]) -> Sequence[M]:
+    async with _read_session(engine) as session:
+        result = await session.exec(stmt)
+        return result.all()
+
+
+async def add_db_record(engine: AsyncEngine, data: SQLModel) -> None:
+    async with _write_session(engine) as session_db:
+        session_db.add(data)
+    logger.debug(data)
+
+
+async def add_db_records(engine: AsyncEngine, records: Sequence[SQLModel]) -> None:
+    async with _write_session(engine) as session_db:
+        session_db.add_all(records)
+    logger.debug("Added records: %d", len(records))
+
+
+async def select_table(
+    engine: AsyncEngine,
+    model: type[M],
+    conditions: dict | None = None,
+    like_conditions: dict | None = None,
+    limit: int | None = None,
+    offset: int | None = 0,
+    order_by: str | None = None,
+) -> Sequence[M]:
+    stmt = build_select(model, conditions, like_conditions, limit, offset, order_by)
+    return await fetch_all(engine, stmt)
+
+
+async def update_record(engine: AsyncEngine, model: type[M], conditions: dict, updates: dict) -> M:
+    try:
+        async with _write_session(engine) as session_db:
+            result = (await session_db.exec(build_select(model, conditions))).one_or_none()
+
+            # レコードが見つからない場合は404エラーを返す
+            if not result:
+                raise HTTPException(status_code=404, detail="レコードが見つかりません")
+
+            apply_updates(result, updates)
+            session_db.add(result)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        # ロールバックはセッション (または Unit of Work) の終了時に行われる
+        logger.error("予期しないエラーが発生しました: %s", e)
+        raise HTTPException(status_code=500, detail="予期しないエラーが発生しました。") from e
+
+
+async def execute_statement(engine: AsyncEngine, stmt: Executable) -> int:
+    async with _write_session(engine) as session_db:
+        result = await session_db.execute(stmt)
+    return result.rowcount
+
+
+async def delete_record(engine: AsyncEngine, model: type[M], conditions: dict) -> dict[str, Any]:
+    async with _write_session(engine) as session_db:
+        result = (await session_db.exec(build_select(model, conditions))).one_or_none()
+        if not result:
+            raise HTTPException(status_code=404, detail="レコードが見つかりません")
+        await session_db.delete(result)
+    return {"detail": "レコードが正常に削除されました"}
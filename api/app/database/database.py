@@ -1,12 +1,22 @@
 # api/app/database/database.py
+import inspect
 import logging
-from collections.abc import Callable, Sequence
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
 from functools import wraps
 from typing import Any, TypeVar
 
 from fastapi import HTTPException, status
-from sqlalchemy import Engine
-from sqlmodel import Session, SQLModel, select
+from sqlalchemy import Engine, Executable
+from sqlmodel import Session, SQLModel
+from sqlmodel.sql.expression import SelectOfScalar
+
+from api.app.database import async_database
+from api.app.database.engine import engine_registry
+from api.app.database.pagination import DEFAULT_PAGE_SIZE, apply_keyset, encode_cursor
+from api.app.database.statements import apply_updates, build_select
+from api.app.database.unit_of_work import current_unit_of_work
+from api.app.executor import DB_POOL, run_in_pool
 
 logger = logging.getLogger("database")
 
@@ -21,124 +31,246 @@ def db_error_handling(
     default_status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR,
 ) -> Callable[[Callable[..., T]], Callable[..., T]]:
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        def handle(e: Exception) -> HTTPException:
+            if isinstance(e, HTTPException):
+                # 400/404 などの想定内のエラーはそのまま返す (エラーとしてはログに残さない)
+                logger.debug("HTTP exception in DB function %s: %s", func.__name__, e.status_code)
+                return e
+            logger.error("Unhandled exception in DB function: %s", e, exc_info=True)
+            return HTTPException(
+                status_code=default_status_code,
+                detail=f"Database error occurred: {str(e)}",
+            )
+
+        # コルーチン関数の場合は await した結果の例外も捕捉できるよう非同期のラッパーを返す
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                logger.debug("DB function called: %s", func.__name__)
+                try:
+                    return await func(*args, **kwargs)  # type: ignore[misc]
+                except Exception as e:
+                    error = handle(e)
+                    if error is e:
+                        raise
+                    raise error from e
+
+            return async_wrapper  # type: ignore[return-value]
+
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> T:
             try:
-                logger.debug(
-                    "DB function called: %s, args: %s, kwargs: %s",
-                    func.__name__,
-                    args,
-                    kwargs,
-                )
+                logger.debug("DB function called: %s", func.__name__)
                 return func(*args, **kwargs)
-            except HTTPException as e:
-                logger.error("HTTP exception in DB function: %s", str(e), exc_info=True)
-                raise
             except Exception as e:
-                logger.error(
-                    "Unhandled exception in DB function: %s", str(e), exc_info=True
-                )
-                raise HTTPException(
-                    status_code=default_status_code,
-                    detail=f"Database error occurred: {str(e)}",
-                ) from e
+                error = handle(e)
+                if error is e:
+                    raise
+                raise error from e
 
         return wrapper
 
     return decorator
 
 
-@db_error_handling(default_status_code=470)
-async def add_db_record(engine: Engine, data: SQLModel) -> None:
-    with Session(engine) as session_db:
-        session_db.add(data)
-        session_db.commit()
-        session_db.refresh(data)
-        logger.debug(data)
+# 同期版の処理本体
+# イベントループをブロックしないよう、DB 用のワーカープール上で実行される
 
 
-@db_error_handling(default_status_code=570)
-async def select_table(
-    engine: Engine,
-    model: type[M],
-    conditions: dict | None = None,
-    like_conditions: dict | None = None,  # LIKE条件を追加
-    limit: int | None = None,  # Queryを外して直接Optional[int]
-    offset: int | None = 0,
-    order_by: str | None = None,  # ORDER BY をサポート
-) -> Sequence[M]:
+@contextmanager
+def _read_session(engine: Engine) -> Iterator[Session]:
+    # Unit of Work の中では、flush 済みで未コミットの変更も読めるよう同じセッションを使う
+    uow = current_unit_of_work()
+    if uow is not None:
+        yield uow.sync_session()
+        return
     with Session(engine) as session:
-        stmt = select(model)
+        yield session
 
-        # 等価条件の追加
-        if conditions:
-            for field, value in conditions.items():
-                stmt = stmt.where(getattr(model, field) == value)
 
-        # LIKE条件の追加
-        if like_conditions:
-            for field, pattern in like_conditions.items():
-                stmt = stmt.where(getattr(model, field).like(f"%{pattern}%"))
+@contextmanager
+def _write_session(engine: Engine) -> Iterator[Session]:
+    """
+    書き込み用のセッション。
+    Unit of Work の中ではそのセッションに参加して flush のみ行い、コミットは Unit of Work に任せる。
+    それ以外では単独のトランザクションとしてコミットする。
 
-        # ORDER BY の追加
-        if order_by:
-            stmt = stmt.order_by(getattr(model, order_by))
+    主キーは flush 時の INSERT (対応する DB では RETURNING) で取得され、
+    expire_on_commit=False により commit 後も属性が保持されるため、refresh の SELECT は発行しない。
+    """
+    uow = current_unit_of_work()
+    if uow is not None:
+        session = uow.sync_session()
+        yield session
+        session.flush()
+        return
+    with Session(engine, expire_on_commit=False) as session:
+        yield session
+        session.commit()
 
-        if offset:
-            stmt = stmt.offset(offset)
-        if limit:
-            stmt = stmt.limit(limit)
 
+def _fetch_all(engine: Engine, stmt: SelectOfScalar[M]) -> Sequence[M]:
+    with _read_session(engine) as session:
         result = session.exec(stmt)
-        rows = result.all()
-        return rows
+        return result.all()
 
 
-@db_error_handling(default_status_code=471)
-async def update_record(engine: Engine, model: type[M], conditions: dict, updates: dict) -> M:
+def _add_db_record(engine: Engine, data: SQLModel) -> None:
+    with _write_session(engine) as session_db:
+        session_db.add(data)
+    logger.debug("Added record: %s", type(data).__name__)
+
+
+def _add_db_records(engine: Engine, records: Sequence[SQLModel]) -> None:
+    with _write_session(engine) as session_db:
+        session_db.add_all(records)
+    logger.debug("Added records: %d", len(records))
+
+
+def _update_record(engine: Engine, model: type[M], conditions: dict, updates: dict) -> M:
     try:
-        with Session(engine) as session_db:
+        with _write_session(engine) as session_db:
             # 条件に一致するレコードの検索
-            stmt = select(model)
-            for field, value in conditions.items():
-                stmt = stmt.where(getattr(model, field) == value)
-            result = session_db.exec(stmt).one_or_none()
+            result = session_db.exec(build_select(model, conditions)).one_or_none()
 
             # レコードが見つからない場合は404エラーを返す
             if not result:
                 raise HTTPException(status_code=404, detail="レコードが見つかりません")
 
-            # 更新対象のフィールドに新しい値を設定
-            for field, value in updates.items():
-                setattr(result, field, value)
-
+            apply_updates(result, updates)
             session_db.add(result)
-            session_db.commit()
-            session_db.refresh(result)
-            return result
+        return result
 
     except HTTPException as e:
         # すでに定義されているHTTPエラーを再度送出
-        logger.error(f"HTTPエラーが発生しました: {e.detail}")
+        logger.error("HTTPエラーが発生しました: %s", e.detail)
         raise
 
     except Exception as e:
         # その他の予期しないエラーをキャッチしてログに記録
-        # ロールバックを行い、500エラーを返す
-        session_db.rollback()
-        logger.error(f"予期しないエラーが発生しました: {e}")
+        # ロールバックはセッション (または Unit of Work) の終了時に行われる
+        logger.error("予期しないエラーが発生しました: %s", e)
         raise HTTPException(status_code=500, detail="予期しないエラーが発生しました。") from e
 
 
-@db_error_handling(default_status_code=472)
-async def delete_record(engine: Engine, model: type[M], conditions: dict) -> dict[str, str]:
-    with Session(engine) as session_db:
-        stmt = select(model)
-        for field, value in conditions.items():
-            stmt = stmt.where(getattr(model, field) == value)
-        result = session_db.exec(stmt).one_or_none()
+def _execute_statement(engine: Engine, stmt: Executable) -> int:
+    with _write_session(engine) as session_db:
+        result = session_db.execute(stmt)
+    return result.rowcount
+
+
+def _delete_record(engine: Engine, model: type[M], conditions: dict) -> dict[str, str]:
+    with _write_session(engine) as session_db:
+        result = session_db.exec(build_select(model, conditions)).one_or_none()
         if not result:
             raise HTTPException(status_code=404, detail="レコードが見つかりません")
         session_db.delete(result)
-        session_db.commit()
-        return {"detail": "レコードが正常に削除されました"}
+    return {"detail": "レコードが正常に削除されました"}
+
+
+# 公開ヘルパー
+# DB_ASYNC が有効なら AsyncSession 版 (async_database) に委譲し、
+# 無効なら同期版を DB 用のワーカープールで実行する
+
+
+async def fetch_all(engine: Engine, stmt: SelectOfScalar[M]) -> Sequence[M]:
+    """組み立て済みの SELECT 文を実行し、全件を返す。"""
+    async_engine = engine_registry.get_async()
+    if async_engine is not None:
+        return await async_database.fetch_all(async_engine, stmt)
+    return await run_in_pool(DB_POOL, _fetch_all, engine, stmt)
+
+
+@db_error_handling(default_status_code=470)
+async def add_db_record(engine: Engine, data: SQLModel) -> None:
+    async_engine = engine_registry.get_async()
+    if async_engine is not None:
+        await async_database.add_db_record(async_engine, data)
+        return
+    await run_in_pool(DB_POOL, _add_db_record, engine, data)
+
+
+@db_error_handling(default_status_code=470)
+async def add_db_records(engine: Engine, records: Sequence[SQLModel]) -> None:
+    """
+    複数のレコードをまとめて追加する。
+    同じモデルのレコードは flush 時に複数行の INSERT (対応する DB では RETURNING で主キーも取得) にまとめられる。
+    """
+    async_engine = engine_registry.get_async()
+    if async_engine is not None:
+        await async_database.add_db_records(async_engine, records)
+        return
+    await run_in_pool(DB_POOL, _add_db_records, engine, records)
+
+
+@db_error_handling(default_status_code=570)
+async def select_table(
+    engine: Engine,
+    model: type[M],
+    conditions: dict | None = None,
+    like_conditions: dict | None = None,  # LIKE条件を追加
+    limit: int | None = None,  # Queryを外して直接Optional[int]
+    offset: int | None = 0,
+    order_by: str | None = None,  # ORDER BY をサポート
+) -> Sequence[M]:
+    stmt = build_select(model, conditions, like_conditions, limit, offset, order_by)
+    return await fetch_all(engine, stmt)
+
+
+@db_error_handling(default_status_code=570)
+async def select_table_keyset(
+    engine: Engine,
+    model: type[M],
+    conditions: dict | None = None,
+    like_conditions: dict | None = None,
+    limit: int | None = None,
+    order_by: str | None = None,
+    cursor: str | None = None,  # 前のページで返された next_cursor
+) -> tuple[Sequence[M], str | None]:
+    """
+    select_table のキーセット (カーソル) ページネーション版。
+    OFFSET を使わず (order_by, id) の位置から読み進めるため、深いページでも先頭ページと同じコストで取得できる。
+
+    Returns:
+        tuple[Sequence[M], str | None]: 取得したレコードと、次のページがあればそのカーソル。
+    """
+    order_by = getattr(order_by, "value", order_by)
+    page_size = limit or DEFAULT_PAGE_SIZE
+    stmt = build_select(model, conditions, like_conditions)
+    stmt = apply_keyset(stmt, model, order_by, cursor, engine.dialect.name)
+
+    # 1件多く取得して次のページの有無を判定する
+    rows = await fetch_all(engine, stmt.limit(page_size + 1))
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(order_by, rows[-1])
+
+
+@db_error_handling(default_status_code=471)
+async def update_record(engine: Engine, model: type[M], conditions: dict, updates: dict) -> M:
+    async_engine = engine_registry.get_async()
+    if async_engine is not None:
+        return await async_database.update_record(async_engine, model, conditions, updates)
+    return await run_in_pool(DB_POOL, _update_record, engine, model, conditions, updates)
+
+
+@db_error_handling(default_status_code=471)
+async def execute_statement(engine: Engine, stmt: Executable) -> int:
+    """
+    UPDATE / DELETE 文を実行し、対象となった行数を返す。
+    条件付きの更新 (WHERE used_at IS NULL など) で競合を検出する場合や、まとめて削除する場合に使う。
+    """
+    async_engine = engine_registry.get_async()
+    if async_engine is not None:
+        return await async_database.execute_statement(async_engine, stmt)
+    return await run_in_pool(DB_POOL, _execute_statement, engine, stmt)
+
+
+@db_error_handling(default_status_code=472)
+async def delete_record(engine: Engine, model: type[M], conditions: dict) -> dict[str, str]:
+    async_engine = engine_registry.get_async()
+    if async_engine is not None:
+        return await async_database.delete_record(async_engine, model, conditions)
+    return await run_in_pool(DB_POOL, _delete_record, engine, model, conditions)
@@ -1,54 +1,310 @@
 import logging
 import os
+import threading
+import time
+from typing import Any
 
 from dotenv import load_dotenv
 from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import create_engine
 
+from api.app.database.instrumentation import instrument_engine
+
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
 # ロガー設定
 logger = logging.getLogger(__name__)
 
+# DB_TYPE ごとの接続プールの既定値
+# 環境変数 (DB_POOL_SIZE など) が設定されていればそちらを優先する
+POOL_DEFAULTS: dict[str, dict[str, Any]] = {
+    "sqlite": {"pool_size": 5, "max_overflow": 10, "pool_recycle": -1, "pool_pre_ping": False},
+    "postgresql": {"pool_size": 10, "max_overflow": 20, "pool_recycle": 1800, "pool_pre_ping": True},
+    "mysql": {"pool_size": 10, "max_overflow": 20, "pool_recycle": 3600, "pool_pre_ping": True},
+    # Azure SQL はアイドル接続を約30分で切断するため、それより短く再接続する
+    "sqlserver": {"pool_size": 10, "max_overflow": 20, "pool_recycle": 1500, "pool_pre_ping": True},
+}
 
-def get_engine() -> Engine:
+# DB_TYPE ごとの非同期ドライバ (SQL Server には対応する非同期ドライバがないため同期のみ)
+ASYNC_DRIVERS: dict[str, tuple[str, str]] = {
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+    "mysql": ("mysql+aiomysql", "aiomysql"),
+}
+
+
+class PoolStats:
+    """
+    接続プールの統計情報。
+    チェックアウト待ち時間を計測し、プールの枯渇を検知できるようにする。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": (self.wait_total / attempts * 1000) if attempts else 0.0,
+                "wait_max_ms": self.wait_max * 1000,
+            }
+
+
+class _TimedCheckoutMixin:
+    """
+    チェックアウト待ち時間を PoolStats に記録するプール用の Mixin。
+    dispose 時の再生成でも統計が引き継がれるよう、統計はクラス属性で保持する。
+    """
+
+    stats: PoolStats
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()  # type: ignore[misc]
+        except Exception:
+            self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        return conn
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    stats = PoolStats()
+
+
+class TimedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def describe_pool(pool: Any) -> dict[str, Any]:
+    """接続プールの現在の状態とチェックアウト待ち時間の統計を辞書で返す。"""
+    status: dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        )
+    if isinstance(pool, _TimedCheckoutMixin):
+        status.update(pool.stats.snapshot())
+    return status
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def echo_enabled() -> bool:
+    """DB_ECHO が有効な場合のみ、実行する SQL をすべて出力する (開発用)。"""
+    return _env_bool("DB_ECHO", False)
+
+
+def get_pool_options(db_type: str) -> dict[str, Any]:
+    """DB_TYPE の既定値に環境変数の上書きを適用した接続プール設定を返す。"""
+    defaults = POOL_DEFAULTS[db_type]
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", defaults["pool_size"]),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", defaults["max_overflow"]),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", defaults["pool_recycle"]),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", defaults["pool_pre_ping"]),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+    }
+
+
+def get_database_url(use_async: bool = False) -> str:
+    db_type = os.getenv("DB_TYPE")
+    db_name = os.getenv("DB_NAME")
+    db_user = os.getenv("DB_USER")
+    db_password = os.getenv("DB_PASSWORD")
+    db_host = os.getenv("DB_HOST")
+    db_port = os.getenv("DB_PORT")
+
+    # 環境変数のデバッグ出力 (パスワードは出力しない)
+    logger.debug("DB_TYPE: %s", db_type)
+    logger.debug("DB_NAME: %s", db_name)
+    logger.debug("DB_USER: %s", db_user)
+    logger.debug("DB_HOST: %s", db_host)
+    logger.debug("DB_PORT: %s", db_port)
+
+    if use_async:
+        if db_type not in ASYNC_DRIVERS:
+            raise ValueError(f"DB_TYPE '{db_type}' does not support the async database layer.")
+        driver = ASYNC_DRIVERS[db_type][0]
+        if db_type == "sqlite":
+            return f"{driver}:///{db_name}"
+        return f"{driver}://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+    if db_type == "sqlite":
+        return f"{db_type}:///{db_name}"
+    elif db_type == "postgresql":
+        return f"{db_type}://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    elif db_type == "mysql":
+        return f"{db_type}+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    elif db_type == "sqlserver":
+        return f"mssql+pymssql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    raise ValueError("Unsupported DB_TYPE. Use 'sqlite', 'postgresql', 'mysql', or 'sqlserver'.")
+
+
+def create_db_engine() -> Engine:
+    """環境変数の設定から接続プール付きのエンジンを作成する。"""
     try:
-        db_type = os.getenv("DB_TYPE")
-        db_name = os.getenv("DB_NAME")
-        db_user = os.getenv("DB_USER")
-        db_password = os.getenv("DB_PASSWORD")
-        db_host = os.getenv("DB_HOST")
-        db_port = os.getenv("DB_PORT")
-
-        # 環境変数のデバッグ出力
-        logger.debug(f"DB_TYPE: {db_type}")
-        logger.debug(f"DB_NAME: {db_name}")
-        logger.debug(f"DB_USER: {db_user}")
-        logger.debug(f"DB_PASSWORD: {db_password}")
-        logger.debug(f"DB_HOST: {db_host}")
-        logger.debug(f"DB_PORT: {db_port}")
+        db_type = os.getenv("DB_TYPE", "")
+        database_url = get_database_url()
+        options: dict[str, Any] = {}
 
+        # インメモリ SQLite は接続ごとに別DBになるため、既定のプールに任せる
+        if not (db_type == "sqlite" and os.getenv("DB_NAME") in (None, "", ":memory:")):
+            options = get_pool_options(db_type)
+            options["poolclass"] = TimedQueuePool
         if db_type == "sqlite":
-            database_url = f"{db_type}:///{db_name}"
-        elif db_type == "postgresql":
-            database_url = (
-                f"{db_type}://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-            )
-        elif db_type == "mysql":
-            database_url = f"{db_type}+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-        elif db_type == "sqlserver":
-            database_url = (
-                f"mssql+pymssql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-            )
-        else:
-            raise ValueError(
-                "Unsupported DB_TYPE. Use 'sqlite', 'postgresql', or 'mysql'."
-            )
-
-        logger.debug(f"Database URL: {database_url}")
-        engine = create_engine(database_url, echo=True)
+            options["connect_args"] = {"check_same_thread": False}
+
+        logger.debug("Engine options: %s", options)
+        engine = create_engine(database_url, echo=echo_enabled(), **options)
+        instrument_engine(engine)
         return engine
     except Exception as e:
         logger.error("Error creating database engine: %s", str(e), exc_info=True)
         raise
+
+
+def async_db_enabled() -> bool:
+    """
+    非同期データベース層を使用するかどうかを判定する。
+    DB_ASYNC が有効で、かつ DB_TYPE に対応する非同期ドライバがインストールされている場合のみ True。
+    """
+    if not _env_bool("DB_ASYNC", False):
+        return False
+    db_type = os.getenv("DB_TYPE", "")
+    if db_type not in ASYNC_DRIVERS:
+        logger.warning("DB_ASYNC is enabled but DB_TYPE '%s' has no async driver. Falling back to sync.", db_type)
+        return False
+    try:
+        __import__(ASYNC_DRIVERS[db_type][1])
+    except ImportError:
+        logger.warning(
+            "DB_ASYNC is enabled but '%s' is not installed. Falling back to sync.", ASYNC_DRIVERS[db_type][1]
+        )
+        return False
+    return True
+
+
+def create_async_db_engine() -> AsyncEngine:
+    """環境変数の設定から接続プール付きの非同期エンジンを作成する。"""
+    try:
+        db_type = os.getenv("DB_TYPE", "")
+        database_url = get_database_url(use_async=True)
+        options: dict[str, Any] = {}
+        if not (db_type == "sqlite" and os.getenv("DB_NAME") in (None, "", ":memory:")):
+            options = get_pool_options(db_type)
+            options["poolclass"] = TimedAsyncQueuePool
+
+        logger.debug("Async engine options: %s", options)
+        engine = create_async_engine(database_url, echo=echo_enabled(), **options)
+        instrument_engine(engine.sync_engine)
+        return engine
+    except Exception as e:
+        logger.error("Error creating async database engine: %s", str(e), exc_info=True)
+        raise
+
+
+class EngineRegistry:
+    """
+    プロセス全体で共有するエンジンを管理するレジストリ。
+    アプリケーションの lifespan で初期化し、リクエストごとには同じエンジンを返す。
+    """
+
+    def __init__(self) -> None:
+        self._engine: Engine | None = None
+        self._async_engine: AsyncEngine | None = None
+        self._async_checked = False
+        self._lock = threading.Lock()
+
+    def init(self) -> Engine:
+        with self._lock:
+            if self._engine is None:
+                self._engine = create_db_engine()
+                logger.info("Database engine created.")
+            return self._engine
+
+    def get(self) -> Engine:
+        # lifespan を経由しない呼び出し (スクリプト等) でも動作するよう遅延初期化する
+        if self._engine is None:
+            return self.init()
+        return self._engine
+
+    def get_async(self) -> AsyncEngine | None:
+        """
+        非同期エンジンを返す。非同期データベース層が無効な場合は None を返す。
+        """
+        if not self._async_checked:
+            with self._lock:
+                if not self._async_checked:
+                    if async_db_enabled():
+                        self._async_engine = create_async_db_engine()
+                        logger.info("Async database engine created.")
+                    self._async_checked = True
+        return self._async_engine
+
+    def dispose(self) -> None:
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+
+    async def dispose_async(self) -> None:
+        """非同期エンジンの接続はイベントループ上で閉じる必要があるため、別メソッドで解放する。"""
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+            self._async_engine = None
+        self._async_checked = False
+
+    def pool_status(self) -> dict[str, Any]:
+        """接続プールの現在の状態とチェックアウト待ち時間の統計を返す。"""
+        status = describe_pool(self.get().pool)
+        if self._async_engine is not None:
+            status["async"] = describe_pool(self._async_engine.pool)
+        return status
+
+
+engine_registry = EngineRegistry()
+
+
+def get_engine() -> Engine:
+    """共有エンジンを返す依存関数。"""
+    return engine_registry.get()
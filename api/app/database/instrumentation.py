@@ -0,0 +1,191 @@
+# api/app/database/instrumentation.py
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any
+
+from sqlalchemy import Engine, event
+
+from api.app.middleware.request_context import current_route
+from api.app.middleware.timing import record_timing
+
+logger = logging.getLogger("database.queries")
+
+# クエリ計測の設定
+# DB_QUERY_STATS: SQL の形ごとの実行時間・行数の集計を有効にする
+# DB_SLOW_QUERY_MS: この時間 (ミリ秒) を超えたクエリをルート名とともに警告ログに出力する (0 で無効)
+# DB_QUERY_STATS_SIZE: 集計する SQL の形の数の上限 (超えた場合は最も長く実行されていないものから捨てる)
+QUERY_STATS_ENABLED = (os.getenv("DB_QUERY_STATS") or "true").lower() in ("1", "true", "yes", "on")
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS") or 200)
+QUERY_STATS_SIZE = int(os.getenv("DB_QUERY_STATS_SIZE") or 500)
+
+# 実行時間のヒストグラムの境界 (ミリ秒)。最後のバケットはそれ以上すべて
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_BUCKET_LABELS = [f"le_{b}ms" for b in LATENCY_BUCKETS_MS] + ["inf"]
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+# IN (?, ?, ?) や複数行の VALUES など、パラメータ数だけが異なる形をまとめる
+_PARAM_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)")
+_PARAM_ROWS = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+
+
+def statement_shape(statement: str) -> str:
+    """SQL からリテラルとパラメータ数の違いを取り除き、集計のキーとなる形を返す。"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PARAM_LIST.sub("(?)", shape)
+    shape = _PARAM_ROWS.sub(r"\1", shape)
+    return shape[:1000]
+
+
+class _ShapeStats:
+    __slots__ = ("count", "errors", "total", "max", "rows", "buckets", "routes")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        # 実行したルートごとの回数 (上位のみ返す)
+        self.routes: dict[str, int] = {}
+
+
+class QueryStats:
+    """SQL の形ごとの実行回数・実行時間のヒストグラム・行数を集計する。"""
+
+    def __init__(self, maxsize: int = QUERY_STATS_SIZE) -> None:
+        self.maxsize = maxsize
+        self._shapes: OrderedDict[str, _ShapeStats] = OrderedDict()
+        self._lock = threading.Lock()
+        self.slow = 0
+        self.evictions = 0
+
+    def record(self, shape: str, seconds: float, rows: int, route: str | None, error: bool = False) -> None:
+        ms = seconds * 1000
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = _ShapeStats()
+                while len(self._shapes) > self.maxsize:
+                    self._shapes.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._shapes.move_to_end(shape)
+            stats.count += 1
+            stats.errors += error
+            stats.total += ms
+            stats.max = max(stats.max, ms)
+            if rows > 0:
+                stats.rows += rows
+            stats.buckets[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            if route is not None:
+                stats.routes[route] = stats.routes.get(route, 0) + 1
+
+    def record_slow(self) -> None:
+        with self._lock:
+            self.slow += 1
+
+    def snapshot(self, limit: int = 20) -> dict[str, Any]:
+        """合計実行時間の長い順に、上位 limit 件の SQL の形の統計を返す。"""
+        with self._lock:
+            ranked = sorted(self._shapes.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+            queries = [
+                {
+                    "statement": shape,
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "total_ms": stats.total,
+                    "avg_ms": stats.total / stats.count,
+                    "max_ms": stats.max,
+                    "p95_ms": _percentile(stats.buckets, stats.count, 0.95),
+                    "rows": stats.rows,
+                    "histogram": dict(zip(_BUCKET_LABELS, stats.buckets, strict=True)),
+                    "routes": dict(sorted(stats.routes.items(), key=lambda item: item[1], reverse=True)[:5]),
+                }
+                for shape, stats in ranked
+            ]
+            return {
+                "shapes": len(self._shapes),
+                "executions": sum(stats.count for stats in self._shapes.values()),
+                "slow": self.slow,
+                "slow_threshold_ms": SLOW_QUERY_MS,
+                "evictions": self.evictions,
+                "queries": queries,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+            self.slow = 0
+            self.evictions = 0
+
+
+def _percentile(buckets: list[int], count: int, q: float) -> float | None:
+    """ヒストグラムから分位点の上限 (バケットの境界) を返す。最後のバケットに入る場合は None。"""
+    target = count * q
+    seen = 0
+    for bound, n in zip(LATENCY_BUCKETS_MS, buckets[:-1], strict=True):
+        seen += n
+        if seen >= target:
+            return float(bound)
+    return None
+
+
+query_stats = QueryStats()
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _finish(conn: Any, statement: str, rows: int, error: bool) -> None:
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    # リクエスト内の DB 処理時間の合計を Server-Timing の db 区間に加算する
+    record_timing("db", elapsed)
+    route = current_route()
+    query_stats.record(statement_shape(statement), elapsed, rows, route, error)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        query_stats.record_slow()
+        # パラメータには個人情報が含まれうるため、SQL のみ出力する
+        logger.warning(
+            "Slow query (%.1f ms, route=%s): %s", elapsed * 1000, route, _WHITESPACE.sub(" ", statement)[:500]
+        )
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    # SELECT の rowcount はドライバによっては -1 になるため、取得できた場合のみ加算する
+    _finish(conn, statement, getattr(cursor, "rowcount", -1), error=False)
+
+
+def _handle_error(exception_context: Any) -> None:
+    conn = exception_context.connection
+    if conn is not None and exception_context.statement is not None:
+        _finish(conn, exception_context.statement, -1, error=True)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    エンジンにクエリ計測のイベントを登録する。
+    非同期エンジンの場合は engine.sync_engine を渡す。
+    """
+    if not QUERY_STATS_ENABLED or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,90 @@
+# api/app/database/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, TypeVar
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from sqlmodel import SQLModel
+from sqlmodel.sql.expression import SelectOfScalar
+
+M = TypeVar("M", bound=SQLModel)
+
+# カーソルモードで limit が指定されなかった場合の 1 ページあたりの件数
+DEFAULT_PAGE_SIZE = 50
+
+# 次ページのカーソルを返すレスポンスヘッダ
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# キーセット (カーソル) ページネーション
+# (order_by のカラム, id) の組で位置を表し、OFFSET を使わずに次のページを取得する。
+# NULL は常に先頭に並ぶものとして扱う (PostgreSQL のみ明示的に NULLS FIRST を指定する)。
+
+
+def _serialize(value: Any) -> tuple[str, Any]:
+    if isinstance(value, datetime):
+        return "dt", value.isoformat()
+    return "raw", getattr(value, "value", value)
+
+
+def _deserialize(tag: str, value: Any) -> Any:
+    if tag == "dt" and value is not None:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def encode_cursor(order_by: str | None, record: SQLModel) -> str:
+    """レコードの位置を表す不透明なカーソル文字列を作成する。"""
+    tag, value = _serialize(getattr(record, order_by)) if order_by else ("raw", None)
+    payload = {"o": order_by, "t": tag, "v": value, "id": record.id}  # type: ignore[attr-defined]
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str | None) -> tuple[Any, Any]:
+    """
+    カーソル文字列を (order_by の値, id) に戻す。
+
+    Raises:
+        HTTPException: カーソルが不正、または order_by と一致しない場合 (400 Bad Request)。
+    """
+    invalid = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="不正なカーソルです")
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["o"] != order_by:
+            raise invalid
+        return _deserialize(payload["t"], payload["v"]), payload["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise invalid from e
+
+
+def apply_keyset(
+    stmt: SelectOfScalar[M],
+    model: type[M],
+    order_by: str | None,
+    cursor: str | None,
+    dialect_name: str,
+) -> SelectOfScalar[M]:
+    """SELECT 文にキーセット条件と (order_by, id) の並び順を追加する。"""
+    id_column = model.id  # type: ignore[attr-defined]
+
+    if order_by is None:
+        if cursor:
+            _, last_id = decode_cursor(cursor, order_by)
+            stmt = stmt.where(id_column > last_id)
+        return stmt.order_by(id_column)
+
+    column = getattr(model, order_by)
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, order_by)
+        if last_value is None:
+            stmt = stmt.where(or_(and_(column.is_(None), id_column > last_id), column.is_not(None)))
+        else:
+            stmt = stmt.where(or_(column > last_value, and_(column == last_value, id_column > last_id)))
+
+    order_column = column.asc().nulls_first() if dialect_name == "postgresql" else column.asc()
+    return stmt.order_by(order_column, id_column)
@@ -0,0 +1,64 @@
+# api/app/database/schema.py
+import logging
+
+from sqlalchemy import Column, Engine, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import SQLModel
+
+from api.app.models import SchoolInfo, Session, User
+
+logger = logging.getLogger("database.schema")
+
+# 既存のテーブルに後から追加した列と、既存の行に設定する既定値 (SQL の式。None の場合は NULL)
+# SQLModel.metadata.create_all は存在するテーブルを変更しないため、起動時に migrate_schema で追加する
+ADDED_COLUMNS: tuple[tuple[type[SQLModel], str, str | None], ...] = (
+    (Session, "naming_status", None),
+    (User, "token_version", "0"),
+    (SchoolInfo, "content_hash", None),
+    (SchoolInfo, "chunk_hashes", None),
+)
+
+
+def add_column_sql(engine: Engine, column: Column, default: str | None) -> str:
+    """列を追加する ALTER TABLE 文を作成する (ADD COLUMN ではなく、SQL Server でも使える ADD を使う)。"""
+    preparer = engine.dialect.identifier_preparer
+    definition = str(CreateColumn(column).compile(dialect=engine.dialect))
+    if default is not None:
+        definition += f" DEFAULT {default}"
+    return f"ALTER TABLE {preparer.format_table(column.table)} ADD {definition}"
+
+
+def _column_names(engine: Engine, table_name: str) -> set[str]:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def migrate_schema(engine: Engine) -> list[str]:
+    """
+    create_all の後に呼び出し、既存のテーブルに不足している列とインデックスを追加する。
+    何度実行しても結果は変わらない (既にある列・インデックスは変更しない)。
+
+    Returns:
+        list[str]: 追加した列 ("テーブル名.列名")。
+    """
+    added: list[str] = []
+    for model, name, default in ADDED_COLUMNS:
+        column = model.__table__.c[name]  # type: ignore[attr-defined]
+        table_name = column.table.name
+        if name in _column_names(engine, table_name):
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(add_column_sql(engine, column, default)))
+        except Exception:
+            # 複数のインスタンスが同時に起動した場合は、他のインスタンスが先に追加していることがある
+            if name in _column_names(engine, table_name):
+                continue
+            raise
+        added.append(f"{table_name}.{name}")
+        logger.info("Added column %s.%s", table_name, name)
+
+    # create_all は既存のテーブルにインデックスを追加しないため、後から定義したものをここで作成する
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    return added
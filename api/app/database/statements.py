@@ -0,0 +1,46 @@
+# api/app/database/statements.py
+from typing import Any, TypeVar
+
+from sqlmodel import SQLModel, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+M = TypeVar("M", bound=SQLModel)
+
+
+# 同期・非同期の両方のヘルパーで共有する SELECT 文の組み立て
+def build_select(
+    model: type[M],
+    conditions: dict | None = None,
+    like_conditions: dict | None = None,
+    limit: int | None = None,
+    offset: int | None = 0,
+    order_by: str | None = None,
+) -> SelectOfScalar[M]:
+    stmt = select(model)
+
+    # 等価条件の追加
+    if conditions:
+        for field, value in conditions.items():
+            stmt = stmt.where(getattr(model, field) == value)
+
+    # LIKE条件の追加
+    if like_conditions:
+        for field, pattern in like_conditions.items():
+            stmt = stmt.where(getattr(model, field).like(f"%{pattern}%"))
+
+    # ORDER BY の追加
+    if order_by:
+        stmt = stmt.order_by(getattr(model, order_by))
+
+    if offset:
+        stmt = stmt.offset(offset)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    return stmt
+
+
+def apply_updates(record: SQLModel, updates: dict[str, Any]) -> None:
+    # 更新対象のフィールドに新しい値を設定
+    for field, value in updates.items():
+        setattr(record, field, value)
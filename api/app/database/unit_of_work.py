@@ -0,0 +1,130 @@
+# api/app/database/unit_of_work.py
+import inspect
+import logging
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Annotated, Any
+
+from fastapi import Depends
+from sqlalchemy import Engine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from api.app.database.engine import engine_registry, get_engine
+from api.app.executor import DB_POOL, run_in_pool
+
+logger = logging.getLogger("database")
+
+# 現在のリクエスト (タスク) で有効な Unit of Work
+# run_in_pool はコンテキスト変数をワーカースレッドに引き継ぐため、同期版のヘルパーからも参照できる
+_current: ContextVar["UnitOfWork | None"] = ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    """
+    複数の書き込みを 1 つのトランザクションにまとめる Unit of Work。
+
+    有効な間、database.py のヘルパーはこのセッションに参加し、コミットの代わりに flush のみ行う。
+    接続は最初に使われた時点で取得するため、LLM 呼び出しなどの待ち時間に接続を保持しない。
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self.async_engine = engine_registry.get_async()
+        self._session: Session | None = None
+        self._async_session: AsyncSession | None = None
+        self._after_commit: list[Callable[[], Any]] = []
+
+    @property
+    def is_async(self) -> bool:
+        return self.async_engine is not None
+
+    def sync_session(self) -> Session:
+        """同期版のセッションを返す。DB 用のワーカースレッドから順番に呼び出される。"""
+        if self._session is None:
+            self._session = Session(self.engine, expire_on_commit=False)
+        return self._session
+
+    def async_session(self) -> AsyncSession:
+        if self._async_session is None:
+            assert self.async_engine is not None
+            self._async_session = AsyncSession(self.async_engine, expire_on_commit=False)
+        return self._async_session
+
+    def after_commit(self, callback: Callable[[], Any]) -> None:
+        """コミットが成功した後に実行する処理 (バックグラウンドタスクの登録など) を追加する。"""
+        self._after_commit.append(callback)
+
+    async def commit(self) -> None:
+        if self._async_session is not None:
+            await self._async_session.commit()
+        elif self._session is not None:
+            await run_in_pool(DB_POOL, self._session.commit)
+
+        callbacks, self._after_commit = self._after_commit, []
+        # コミット後の処理での書き込みはこのトランザクションに参加させず、単独でコミットさせる
+        token = _current.set(None)
+        try:
+            for callback in callbacks:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+        finally:
+            _current.reset(token)
+
+    async def rollback(self) -> None:
+        self._after_commit = []
+        if self._async_session is not None:
+            await self._async_session.rollback()
+        elif self._session is not None:
+            await run_in_pool(DB_POOL, self._session.rollback)
+
+    async def close(self) -> None:
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+        if self._session is not None:
+            await run_in_pool(DB_POOL, self._session.close)
+            self._session = None
+
+
+def current_unit_of_work() -> UnitOfWork | None:
+    """現在有効な Unit of Work を返す。ない場合は None。"""
+    return _current.get()
+
+
+@asynccontextmanager
+async def unit_of_work(engine: Engine) -> AsyncIterator[UnitOfWork]:
+    """
+    ブロック内の書き込みを 1 つのトランザクションで実行する。
+    ブロックを正常に抜けた時点でコミットし、例外が発生した場合はロールバックする。
+
+    Example:
+        async with unit_of_work(engine):
+            await add_db_record(engine, session)
+            await add_db_record(engine, chat_log)
+    """
+    uow = UnitOfWork(engine)
+    token = _current.set(uow)
+    try:
+        yield uow
+        await uow.commit()
+    except BaseException:
+        await uow.rollback()
+        raise
+    finally:
+        await uow.close()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 依存関係の終了処理など、別のコンテキストで抜けた場合
+            _current.set(None)
+
+
+async def get_unit_of_work(
+    engine: Annotated[Engine, Depends(get_engine)],
+) -> AsyncIterator[UnitOfWork]:
+    """リクエスト全体を 1 つのトランザクションにまとめる依存関数。"""
+    async with unit_of_work(engine) as uow:
+        yield uow
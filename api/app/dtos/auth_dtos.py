@@ -12,3 +12,8 @@ class Token(SQLModel):
 class LoginData(SQLModel):
     email: EmailStr
     password: str
+
+
+# RefreshDataモデル (Cookie を使わないクライアント向け)
+class RefreshData(SQLModel):
+    refresh_token: str | None = None
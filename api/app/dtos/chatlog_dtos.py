@@ -39,6 +39,11 @@ class ChatOrderBy(str, Enum):
     session_id = "session_id"
 
 
+class ChatStreamFormat(str, Enum):
+    sse = "sse"  # text/event-stream (Server-Sent Events)
+    ndjson = "ndjson"  # application/x-ndjson (1行1イベント)
+
+
 class ChatSearchDTO(SQLModel):
     session_id: int | None = None
     message_like: str | None = None
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class PaginationMode(str, Enum):
+    offset = "offset"  # 従来の offset/limit によるページネーション
+    cursor = "cursor"  # (order_by, id) によるキーセットページネーション
@@ -86,3 +86,20 @@ class SchoolInfoTitleDTO(SQLModel):
                 "title": "本校設立年",
             }
         }
+
+
+class SchoolInfoSearchResultDTO(SQLModel):
+    id: int = Field(..., title="学校情報ID", description="学校情報の一意な識別子")
+    title: str = Field(..., title="タイトル", description="学校情報のタイトル")
+    chunk: str = Field(..., title="チャンク", description="検索語に最も近い本文の一部")
+    score: float = Field(..., title="類似度", description="検索語とのコサイン類似度")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": 1,
+                "title": "本校設立年",
+                "chunk": "本校の創立者は山田太郎氏です。",
+                "score": 0.82,
+            }
+        }
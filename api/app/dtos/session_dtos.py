@@ -4,12 +4,15 @@ from enum import Enum
 from pydantic import Field
 from sqlmodel import SQLModel
 
+from api.app.models import NamingStatus
+
 
 class SessionDTO(SQLModel):
     id: int | None
     session_name: str
     pub_data: datetime | None = None
     user_id: str
+    naming_status: NamingStatus | None = None
 
     class Config:
         schema_extra = {
@@ -18,10 +21,17 @@ class SessionDTO(SQLModel):
                 "session_name": "新しいセッション",
                 "pub_data": "2024-06-29T12:35:00",
                 "user_id": "xxxxxxxx-xxxx-Mxxx-xxxx-xxxxxxxxxxxx",
+                "naming_status": "done",
             }
         }
 
 
+class SessionNamingDTO(SQLModel):
+    id: int
+    session_name: str
+    naming_status: NamingStatus | None = None
+
+
 class SessionOrderBy(str, Enum):
     session_name = "session_name"
     pub_data = "pub_data"
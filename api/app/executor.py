@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from fastapi import HTTPException, status
+
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# プール名
+DB_POOL = "db"  # database.py の同期 DB 処理
+AUTH_POOL = "auth"  # bcrypt によるパスワードのハッシュ化・検証
+AI_POOL = "ai"  # SC_AI.Chat.invoke などの LLM 呼び出し
+
+# プールごとの既定値 (ワーカー数, 待ち行列の上限, 飽和時のステータスコード)
+# 環境変数 EXECUTOR_<NAME>_WORKERS / EXECUTOR_<NAME>_QUEUE で上書きできる
+POOL_DEFAULTS: dict[str, tuple[int, int, int]] = {
+    DB_POOL: (10, 100, status.HTTP_503_SERVICE_UNAVAILABLE),
+    AUTH_POOL: (2, 16, status.HTTP_429_TOO_MANY_REQUESTS),
+    AI_POOL: (8, 32, status.HTTP_503_SERVICE_UNAVAILABLE),
+}
+
+
+class PoolSaturatedError(HTTPException):
+    """ワーカープールの待ち行列が上限に達した場合に送出される例外。"""
+
+    def __init__(self, pool_name: str, status_code: int, retry_after: int = 1) -> None:
+        super().__init__(
+            status_code=status_code,
+            detail=f"サーバーが混み合っています。しばらくしてから再試行してください。({pool_name})",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.pool_name = pool_name
+
+
+class BoundedExecutor:
+    """
+    待ち行列の長さに上限を持つスレッドプール。
+    上限を超えた投入は待たせずに即座に PoolSaturatedError で拒否する。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, reject_status: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.reject_status = reject_status
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._pending = 0  # 待ち行列 + 実行中
+        self._running = 0
+        self._submitted = 0
+        self._started = 0
+        self._rejected = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _release(self, _: Future) -> None:
+        # 実行前にキャンセルされた場合も含め、必ず pending を戻す
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        func をプール上で実行し、結果を待つ。
+
+        Raises:
+            PoolSaturatedError: 待ち行列が上限に達している場合。
+        """
+        return await self.submit(func, *args, **kwargs)
+
+    def submit(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> "asyncio.Future[T]":
+        """
+        func をプールに投入し、結果を受け取る Future を返す。
+        飽和の判定は投入時に行うため、レスポンスを返し始める前に 503/429 を返したい場合に使う。
+
+        Raises:
+            PoolSaturatedError: 待ち行列が上限に達している場合。
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._rejected += 1
+                raise PoolSaturatedError(self.name, self.reject_status)
+            self._pending += 1
+            self._submitted += 1
+
+        enqueued_at = time.perf_counter()
+        # 呼び出し元のコンテキスト変数をワーカースレッドに引き継ぐ
+        ctx = contextvars.copy_context()
+
+        def task() -> T:
+            waited = time.perf_counter() - enqueued_at
+            with self._lock:
+                self._running += 1
+                self._started += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            try:
+                return ctx.run(func, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        try:
+            future = self._executor.submit(task)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "wait_avg_ms": (self._wait_total / self._started * 1000) if self._started else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ExecutorRegistry:
+    """用途ごとに独立したサイズのプールを管理するレジストリ。"""
+
+    def __init__(self) -> None:
+        self._executors: dict[str, BoundedExecutor] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> BoundedExecutor:
+        executor = self._executors.get(name)
+        if executor is not None:
+            return executor
+        with self._lock:
+            if name not in self._executors:
+                workers, queue, reject_status = POOL_DEFAULTS[name]
+                workers = int(os.getenv(f"EXECUTOR_{name.upper()}_WORKERS") or workers)
+                queue = int(os.getenv(f"EXECUTOR_{name.upper()}_QUEUE") or queue)
+                self._executors[name] = BoundedExecutor(name, workers, queue, reject_status)
+                logger.info("Executor '%s' created: workers=%d, max_queue=%d", name, workers, queue)
+            return self._executors[name]
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {name: executor.snapshot() for name, executor in list(self._executors.items())}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for executor in self._executors.values():
+                executor.shutdown()
+            self._executors.clear()
+
+
+executors = ExecutorRegistry()
+
+
+async def run_in_pool(pool_name: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """指定したプールで同期関数を実行する。"""
+    return await executors.get(pool_name).run(func, *args, **kwargs)
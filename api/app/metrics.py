@@ -0,0 +1,228 @@
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from types import TracebackType
+from typing import Any
+
+# Prometheus のテキスト形式で出力するメトリクス
+# 外部ライブラリは使わず、GET /metrics で必要な Counter / Histogram と、
+# 出力時に既存の統計 (接続プール・キャッシュなど) を読み取るコレクターのみ実装する
+
+# 既定のレイテンシのバケット (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = tuple[str, ...]
+# (ラベル, 値) のリスト
+Samples = list[tuple[dict[str, str], float]]
+
+
+class _ThreadShards:
+    """
+    スレッドごとに値を保持する領域。
+    各スレッドは自分の領域にだけ書き込むため、記録時にロックを取らない (ロックは領域の作成時のみ)。
+    出力時は全スレッドの領域を合算する。
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: list[dict[LabelValues, Any]] = []
+        self._lock = threading.Lock()
+
+    def local(self) -> dict[LabelValues, Any]:
+        cells = getattr(self._local, "cells", None)
+        if cells is None:
+            cells = self._local.cells = {}
+            with self._lock:
+                self._shards.append(cells)
+        return cells
+
+    def snapshot(self) -> list[dict[LabelValues, Any]]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy は GIL の下で一度に行われるため、書き込み中のスレッドがあっても安全に読める
+        return [cells.copy() for cells in shards]
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._shards = _ThreadShards()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        cells = self._shards.local()
+        cells[labels] = cells.get(labels, 0) + amount
+
+    def samples(self) -> Samples:
+        totals: dict[LabelValues, float] = {}
+        for cells in self._shards.snapshot():
+            for labels, value in cells.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return [(dict(zip(self.labelnames, labels, strict=True)), value) for labels, value in totals.items()]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(_sample_line(self.name, labels, value) for labels, value in self.samples())
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *labels: str) -> None:
+        cells = self._shards.local()
+        # [バケットごとの件数..., +Inf の件数, 合計]
+        cell = cells.get(labels)
+        if cell is None:
+            cell = cells[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def render(self) -> list[str]:
+        totals: dict[LabelValues, list[float]] = {}
+        for cells in self._shards.snapshot():
+            for labels, cell in cells.items():
+                total = totals.setdefault(labels, [0] * len(cell))
+                for i, value in enumerate(list(cell)):
+                    total[i] += value
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, total in totals.items():
+            label_dict = dict(zip(self.labelnames, labels, strict=True))
+            cumulative = 0.0
+            for bound, count in zip([*self.buckets, float("inf")], total[:-1], strict=True):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(_sample_line(f"{self.name}_bucket", {**label_dict, "le": le}, cumulative))
+            lines.append(_sample_line(f"{self.name}_sum", label_dict, total[-1]))
+            lines.append(_sample_line(f"{self.name}_count", label_dict, cumulative))
+        return lines
+
+
+class track:
+    """
+    ブロックの所要時間を Histogram に記録し、例外で抜けた場合はエラーの Counter を増やす。
+
+    Example:
+        with track(llm_call_duration, llm_call_errors, "chat"):
+            raw_response = await run_in_pool(AI_POOL, resp.invoke, message=message)
+    """
+
+    __slots__ = ("histogram", "errors", "labels", "_start")
+
+    def __init__(self, histogram: Histogram, errors: Counter | None, *labels: str) -> None:
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+
+    def __enter__(self) -> "track":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.histogram.observe(time.perf_counter() - self._start, *self.labels)
+        # キャンセル (クライアントの切断など) はエラーとして数えない
+        if exc_type is not None and issubclass(exc_type, Exception) and self.errors is not None:
+            self.errors.inc(*self.labels)
+
+
+# 出力時に呼び出すコレクター: (名前, 種類, 説明, サンプル) を返す
+Collector = Callable[[], Iterable[tuple[str, str, str, Samples]]]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram] = []
+        self._collectors: list[Collector] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式 (version 0.0.4) で全メトリクスを返す。"""
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(_sample_line(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample_line(name: str, labels: dict[str, str], value: float) -> str:
+    if labels:
+        label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+
+registry = MetricsRegistry()
+
+# HTTP リクエスト (ルートはテンプレートで集計する)
+http_requests = registry.counter(
+    "http_requests_total", "Total HTTP requests.", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds.", ("method", "route")
+)
+
+# LLM 呼び出し (chat: チャット, stream: ストリーミング, naming: セッション名の生成)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+llm_call_duration = registry.histogram(
+    "llm_call_duration_seconds", "LLM call latency in seconds.", ("kind",), LLM_BUCKETS
+)
+llm_call_errors = registry.counter("llm_call_errors_total", "Failed LLM calls.", ("kind",))
+
+# ベクターストア (Cosmos DB) との同期
+vector_store_duration = registry.histogram(
+    "vector_store_sync_duration_seconds", "Vector store (Cosmos DB) sync latency in seconds.", ("operation",)
+)
+vector_store_errors = registry.counter(
+    "vector_store_sync_errors_total", "Failed vector store (Cosmos DB) sync operations.", ("operation",)
+)
+
+# ベクターストアからの検索 (学校情報の検索エンドポイント)
+vector_search_duration = registry.histogram(
+    "vector_search_duration_seconds", "Vector store search latency in seconds.", ("backend",)
+)
+vector_search_errors = registry.counter("vector_search_errors_total", "Failed vector store searches.", ("backend",))
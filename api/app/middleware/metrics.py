@@ -0,0 +1,49 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.app.metrics import http_request_duration, http_requests
+
+# どのルートにも一致しなかったリクエスト (404 など) のルート名。パスをそのままラベルにしないためにまとめる
+UNMATCHED_ROUTE = "<unmatched>"
+
+# 処理中のリクエスト数 (イベントループ上でのみ更新するため、ロックは使用しない)
+_in_flight = 0
+
+
+def in_flight_requests() -> int:
+    return _in_flight
+
+
+class MetricsMiddleware:
+    """
+    ルートのテンプレートごとにリクエスト数と処理時間を記録する ASGI ミドルウェア。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        global _in_flight  # noqa: PLW0603
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        _in_flight += 1
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _in_flight -= 1
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            http_requests.inc(method, route, str(status_code))
+            http_request_duration.observe(time.perf_counter() - start, method, route)
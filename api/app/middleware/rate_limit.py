@@ -0,0 +1,316 @@
+import json
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any
+
+from jose import JWTError, jwt
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.app.cache import KeyValueClient
+from api.app.security.jwt_token import ALGORITHM, SECRET_KEY
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# レート制限の設定
+# RATE_LIMIT_BACKEND: local (プロセス内), shared (Redis 互換の共有ストア), none (無効)
+# RATE_LIMIT_*: "回数/秒数" の形式。例えば 10/60 は 60 秒あたり 10 回 (連続では最大 10 回まで)
+# RATE_LIMIT_TRUST_FORWARDED: X-Forwarded-For の末尾 (直前のプロキシが付けたアドレス) をクライアントの IP とする。
+#   ヘッダーを付け直すプロキシ (Azure のフロントエンドなど) の背後でのみ有効にすること。
+#   プロキシがない状態で有効にすると、クライアントが任意の IP を名乗って制限を回避できる
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND") or "local"
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS") or 100_000)
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL") or 60)
+RATE_LIMIT_TRUST_FORWARDED = (os.getenv("RATE_LIMIT_TRUST_FORWARDED") or "false").lower() == "true"
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimitRule:
+    """
+    トークンバケットの設定。limit 回分のトークンが period 秒で満タンまで回復する。
+
+    Attributes:
+        name (str): バケットのキーの接頭辞 (エンドポイントごとに分ける)。
+        limit (int): バケットの容量 (連続して受け付ける回数)。
+        period (float): 空のバケットが満タンに戻るまでの秒数。
+        scope (str): ip (クライアントの IP ごと) または user (トークンのユーザーIDごと)。
+    """
+
+    name: str
+    limit: int
+    period: float
+    scope: str = "ip"
+
+    @property
+    def interval(self) -> float:
+        """トークン 1 つが回復するまでの秒数。"""
+        return self.period / self.limit
+
+
+def parse_rule(name: str, env: str, default: str, scope: str) -> RateLimitRule:
+    limit, period = (os.getenv(env) or default).split("/")
+    return RateLimitRule(name, int(limit), float(period), scope)
+
+
+# エンドポイントごとの制限 (bcrypt と LLM を使うエンドポイントのみ)
+CHAT_RULES = (
+    parse_rule("chat_ip", "RATE_LIMIT_CHAT_PER_IP", "60/60", "ip"),
+    parse_rule("chat_user", "RATE_LIMIT_CHAT_PER_USER", "20/60", "user"),
+)
+DEFAULT_RULES: dict[str, tuple[RateLimitRule, ...]] = {
+    "/auth/login": (parse_rule("login_ip", "RATE_LIMIT_LOGIN_PER_IP", "10/60", "ip"),),
+    "/auth/signup": (parse_rule("signup_ip", "RATE_LIMIT_SIGNUP_PER_IP", "5/300", "ip"),),
+    "/api/input/chat": CHAT_RULES,
+    "/api/input/chat/stream": CHAT_RULES,
+}
+
+
+class RateLimitStore(ABC):
+    """
+    トークンバケットの状態を保持するストアのインターフェース。
+
+    バケットは「理論上の到着時刻 (TAT)」1 つの浮動小数点数で表す (GCRA)。
+    TAT が現在時刻より limit * interval 以上先にある場合はバケットが空であり、
+    TAT が現在時刻より前であればバケットは満タンなので、状態を捨ててもよい。
+    """
+
+    @abstractmethod
+    async def take(self, key: str, rule: RateLimitRule) -> float:
+        """
+        トークンを 1 つ消費する。
+
+        Returns:
+            float: 受け付けた場合は 0。拒否した場合は次にトークンが回復するまでの秒数。
+        """
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+def _next_tat(tat: float | None, now: float, rule: RateLimitRule) -> tuple[float, float]:
+    """新しい TAT と、拒否する場合の待ち秒数 (受け付ける場合は 0) を返す。"""
+    new_tat = max(tat or now, now) + rule.interval
+    allow_at = new_tat - rule.limit * rule.interval
+    if now < allow_at:
+        return tat or now, allow_at - now
+    return new_tat, 0.0
+
+
+class LocalRateLimitStore(RateLimitStore):
+    """
+    プロセス内のストア。キーごとに TAT を 1 つだけ保持する。
+    満タンに戻ったバケットは sweep_interval 秒ごとに取り除き、キー数が上限を超えた場合は古いものから捨てる。
+    イベントループ上でのみ操作するため、ロックは使用しない。
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL) -> None:
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._tats: dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+        self.allowed = 0
+        self.limited = 0
+        self.evictions = 0
+
+    def _sweep(self, now: float) -> None:
+        expired = [key for key, tat in self._tats.items() if tat <= now]
+        for key in expired:
+            del self._tats[key]
+        self.evictions += len(expired)
+        self._last_sweep = now
+
+    async def take(self, key: str, rule: RateLimitRule) -> float:
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+        tat, retry_after = _next_tat(self._tats.get(key), now, rule)
+        if retry_after:
+            self.limited += 1
+            return retry_after
+
+        # 更新したキーを末尾に移し、上限を超えた場合は最も長く使われていないキーから捨てる
+        self._tats.pop(key, None)
+        self._tats[key] = tat
+        while len(self._tats) > self.max_keys:
+            del self._tats[next(iter(self._tats))]
+            self.evictions += 1
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "keys": len(self._tats),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evictions": self.evictions,
+        }
+
+
+class SharedRateLimitStore(RateLimitStore):
+    """
+    複数の Azure Functions インスタンス間で共有するストア。
+    TAT はバックエンドの TTL 付きで保存するため、満タンに戻ったバケットは自動的に消える。
+    読み込み→書き込みのため同時リクエストでわずかに多く受け付けることがあるが、過負荷の防止には十分とする。
+    """
+
+    def __init__(self, client: KeyValueClient, prefix: str = "rate_limit:") -> None:
+        self._client = client
+        self._prefix = prefix
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    async def take(self, key: str, rule: RateLimitRule) -> float:
+        # インスタンス間で比較するため、単調時計ではなく UNIX 時刻を使う
+        now = time.time()
+        try:
+            raw = await self._client.get(self._prefix + key)
+            tat, retry_after = _next_tat(float(raw) if raw is not None else None, now, rule)
+            if not retry_after:
+                await self._client.set(self._prefix + key, repr(tat), ex=max(1, math.ceil(tat - now)))
+        except Exception as e:
+            # ストアに接続できない場合は制限せずに通す (認証やチャット自体を止めない)
+            self.errors += 1
+            logger.warning("Rate limit store is unavailable: %s", e)
+            return 0.0
+        if retry_after:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "errors": self.errors,
+        }
+
+
+def create_rate_limit_store() -> RateLimitStore | None:
+    """環境変数の設定からストアを作成する。none の場合は None (制限しない)。"""
+    if RATE_LIMIT_BACKEND == "none":
+        return None
+    if RATE_LIMIT_BACKEND == "shared":
+        if not RATE_LIMIT_URL:
+            raise ValueError("RATE_LIMIT_URL is required when RATE_LIMIT_BACKEND=shared")
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise ImportError("RATE_LIMIT_BACKEND=shared requires the 'redis' package") from e
+        return SharedRateLimitStore(Redis.from_url(RATE_LIMIT_URL, decode_responses=True))
+    return LocalRateLimitStore()
+
+
+_rate_limit_store: RateLimitStore | None = None
+_store_created = False
+
+
+def get_rate_limit_store() -> RateLimitStore | None:
+    global _rate_limit_store, _store_created  # noqa: PLW0603
+    if not _store_created:
+        _rate_limit_store = create_rate_limit_store()
+        _store_created = True
+        logger.info("Rate limit store: %s", type(_rate_limit_store).__name__)
+    return _rate_limit_store
+
+
+def set_rate_limit_store(store: RateLimitStore | None) -> None:
+    """ストアを差し替える (テストで FakeKeyValueClient を使う場合など)。None の場合は制限しない。"""
+    global _rate_limit_store, _store_created  # noqa: PLW0603
+    _rate_limit_store = store
+    _store_created = True
+
+
+def client_ip(scope: Scope, headers: dict[bytes, bytes]) -> str:
+    """リクエスト元の IP アドレスを返す。"""
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = headers.get(b"x-forwarded-for")
+        if forwarded:
+            return forwarded.decode("latin-1").split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def token_user_id(headers: dict[bytes, bytes]) -> str | None:
+    """
+    Authorization ヘッダーのトークンからユーザーIDを取り出す。
+    署名と有効期限のみ確認し、失効の確認は get_current_user に任せる (DB にはアクセスしない)。
+    """
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id = payload.get("user_id")
+    return str(user_id) if user_id else None
+
+
+class RateLimitMiddleware:
+    """
+    指定したエンドポイントへのリクエストをトークンバケットで制限する ASGI ミドルウェア。
+    制限を超えたリクエストは、エンドポイントを実行せずに 429 と Retry-After を返す。
+    ストリーミング応答を妨げないよう、BaseHTTPMiddleware ではなく ASGI ミドルウェアとして実装する。
+    """
+
+    def __init__(self, app: ASGIApp, rules: dict[str, tuple[RateLimitRule, ...]] | None = None) -> None:
+        self.app = app
+        self.rules = DEFAULT_RULES if rules is None else rules
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        rules = self.rules.get(scope["path"])
+        store = get_rate_limit_store()
+        if not rules or store is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        retry_after = 0.0
+        user_id: str | None = None
+        for rule in rules:
+            if rule.scope == "user":
+                user_id = user_id or token_user_id(headers)
+                if user_id is None:
+                    # 未認証のリクエストはエンドポイント側で 401 になるため、IP の制限のみ適用する
+                    continue
+                key = f"{rule.name}:{user_id}"
+            else:
+                key = f"{rule.name}:{client_ip(scope, headers)}"
+            retry_after = max(retry_after, await store.take(key, rule))
+            if retry_after:
+                break
+
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        logger.warning("Rate limited: path=%s, retry_after=%.1fs", scope["path"], retry_after)
+        body = json.dumps(
+            {"detail": "リクエストが多すぎます。しばらくしてから再試行してください。"}, ensure_ascii=False
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(retry_after)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,41 @@
+from contextvars import ContextVar
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# 処理中のリクエストの ASGI スコープ
+# ルーティング後に FastAPI が scope["route"] を設定するため、参照時点のルートを取得できる
+# run_in_pool はコンテキスト変数をワーカースレッドに引き継ぐため、DB 用のワーカーからも参照できる
+_current_scope: ContextVar[Scope | None] = ContextVar("request_scope", default=None)
+
+
+def route_name(scope: Scope) -> str:
+    """
+    リクエストのルート名 ("GET /api/view/chat" など) を返す。
+    パスパラメータを含むルートはテンプレート ("/api/view/session/{session_id}/naming") で返す。
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}"
+
+
+def current_route() -> str | None:
+    """処理中のリクエストのルート名を返す。リクエスト外 (バックグラウンドタスクなど) の場合は None。"""
+    scope = _current_scope.get()
+    return route_name(scope) if scope is not None else None
+
+
+class RequestContextMiddleware:
+    """処理中のリクエストのスコープをコンテキスト変数に保持する ASGI ミドルウェア。"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
@@ -0,0 +1,146 @@
+import os
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from functools import wraps
+from types import TracebackType
+from typing import Any, TypeVar
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.app.middleware.request_context import route_name
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# SERVER_TIMING_ENABLED: リクエストごとの処理時間の内訳を Server-Timing ヘッダーとログに出力する
+# 無効の場合はミドルウェアを登録せず、span は ContextVar の参照のみで何もしない
+SERVER_TIMING_ENABLED = (os.getenv("SERVER_TIMING_ENABLED") or "").lower() in ("1", "true", "yes", "on")
+
+
+class RequestTimings:
+    """1 リクエスト内の処理区間 (span) の所要時間を記録する。同じ名前の区間は合計する。"""
+
+    __slots__ = ("started_at", "entries")
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        # ワーカースレッドからも追記されるため、list.append のみで記録する
+        self.entries: list[tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.entries.append((name, seconds))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> dict[str, float]:
+        """区間名ごとの合計時間 (ミリ秒) を、最初に記録された順に返す。"""
+        totals: dict[str, float] = {}
+        for name, seconds in list(self.entries):
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return totals
+
+    def header_value(self) -> str:
+        metrics = [f"{name};dur={ms:.1f}" for name, ms in self.summary().items()]
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """計測済みの時間を区間として記録する。計測が無効な場合は何もしない。"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class span:
+    """
+    処理区間の所要時間を記録するコンテキストマネージャ。計測が無効な場合は何もしない。
+
+    Example:
+        with span("llm"):
+            raw_response = await run_in_pool(AI_POOL, resp.invoke, message=message)
+    """
+
+    __slots__ = ("name", "_timings", "_start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "span":
+        self._timings = _current.get()
+        if self._timings is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if self._timings is not None:
+            self._timings.add(self.name, time.perf_counter() - self._start)
+
+
+def timed(name: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """非同期関数全体を 1 つの区間として記録するデコレータ (依存関数にも使える)。"""
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ServerTimingMiddleware:
+    """
+    リクエストの処理時間と区間ごとの内訳を Server-Timing ヘッダーに付け、完了時にログに出力する。
+    ストリーミング応答ではヘッダーの送信時点までの区間のみヘッダーに含まれ、ログには完了までの全区間が出力される。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header_value().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            total_ms = timings.elapsed() * 1000
+            phases = timings.summary()
+            logger.info(
+                "Request timing: route=%s status=%d total_ms=%.1f %s",
+                route_name(scope),
+                status_code,
+                total_ms,
+                " ".join(f"{name}_ms={ms:.1f}" for name, ms in phases.items()),
+                extra={"route": route_name(scope), "status": status_code, "total_ms": total_ms, "phases": phases},
+            )
@@ -1,9 +1,10 @@
 import uuid
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 from pydantic import EmailStr, field_validator
-from sqlalchemy import Unicode, UnicodeText
+from sqlalchemy import Index, Unicode, UnicodeText
 from sqlmodel import Column, Field, Relationship, SQLModel
 
 from api.app.security.role import Role
@@ -51,6 +52,11 @@ class User(SQLModel, table=True):
     pub_data: datetime | None = Field(
         None, title="公開日時", description="メッセージの公開日時", index=True
     )
+    token_version: int = Field(
+        default=0,
+        title="トークンバージョン",
+        description="権限やパスワードの変更時に増やし、それ以前に発行したトークンを無効にする",
+    )
 
     # UserとMajorのリレーション (N:1)
     major: Optional["Major"] = Relationship(back_populates="users")
@@ -69,6 +75,10 @@ class User(SQLModel, table=True):
         back_populates="user", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
     )
 
+    refresh_tokens: list["RefreshToken"] = Relationship(
+        back_populates="user", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )
+
     class Config:
         schema_extra = {
             "example": {
@@ -167,6 +177,14 @@ class World(SQLModel, table=True):
         }
 
 
+class NamingStatus(str, Enum):
+    """セッション名の自動生成の状態"""
+
+    PENDING = "pending"  # バックグラウンドで生成待ち・生成中
+    DONE = "done"
+    FAILED = "failed"
+
+
 class Session(SQLModel, table=True):
     id: int | None = Field(
         None,
@@ -188,6 +206,12 @@ class Session(SQLModel, table=True):
         title="ユーザID",
         description="関連するユーザのID",
     )
+    naming_status: NamingStatus | None = Field(
+        None,
+        sa_column=Column(Unicode(20)),
+        title="命名状態",
+        description="セッション名の自動生成の状態",
+    )
 
     chat_logs: list["ChatLog"] = Relationship(
         back_populates="session",
@@ -202,11 +226,59 @@ class Session(SQLModel, table=True):
                 "session_name": "新しいセッション",
                 "pub_data": "2024-06-29T12:35:00",
                 "user_id": "xxxxxxxx-xxxx-Mxxx-xxxx-xxxxxxxxxxxx",
+                "naming_status": "done",
             }
         }
 
 
+class RefreshToken(SQLModel, table=True):
+    """
+    リフレッシュトークンモデル: トークン自体は保存せず、HMAC-SHA256 のハッシュのみを保持する。
+    使用するたびに同じ family_id の新しいトークンに置き換え (ローテーション)、
+    使用済みのトークンが再び使われた場合は同じ family_id のトークンをすべて失効させる。
+    """
+
+    id: int | None = Field(
+        None,
+        primary_key=True,
+        title="ID",
+        description="リフレッシュトークンを一意に識別するためのID",
+    )
+    token_hash: str = Field(
+        ...,
+        max_length=64,
+        unique=True,
+        index=True,
+        title="トークンハッシュ",
+        description="リフレッシュトークンの HMAC-SHA256 (16進数)",
+    )
+    family_id: str = Field(
+        ...,
+        max_length=36,
+        index=True,
+        title="ファミリーID",
+        description="同じログインから発行されたトークンに共通のID",
+    )
+    user_id: str = Field(
+        ...,
+        max_length=255,
+        foreign_key="user.id",
+        index=True,
+        title="ユーザID",
+        description="トークンを発行したユーザのID",
+    )
+    issued_at: datetime = Field(..., title="発行日時", description="トークンの発行日時")
+    expires_at: datetime = Field(..., index=True, title="有効期限", description="トークンの有効期限")
+    used_at: datetime | None = Field(None, title="使用日時", description="ローテーションで使用された日時")
+    revoked: bool = Field(default=False, title="失効", description="再利用の検出やログアウトで失効したかどうか")
+
+    user: User | None = Relationship(back_populates="refresh_tokens")
+
+
 class ChatLog(SQLModel, table=True):
+    # 会話履歴の末尾取得 (WHERE session_id = ? ORDER BY pub_data DESC LIMIT ?) 用の複合インデックス
+    __table_args__ = (Index("ix_chatlog_session_id_pub_data", "session_id", "pub_data"),)
+
     id: int | None = Field(
         None,
         primary_key=True,
@@ -282,6 +354,18 @@ class SchoolInfo(SQLModel, table=True):
     )
     title: str | None = Field(None, sa_column=Column(UnicodeText), title="タイトル", description="学校情報のタイトル")
     # TODO: ベクターデータベースのドキュメントIDを格納するカラムを追加する
+    content_hash: str | None = Field(
+        None,
+        max_length=64,
+        title="内容のハッシュ",
+        description="内容の SHA-256 (内容とタイトルが変わらない更新ではベクターストアに同期しない)",
+    )
+    chunk_hashes: str | None = Field(
+        None,
+        sa_column=Column(UnicodeText),
+        title="チャンクのハッシュ",
+        description="埋め込みの単位 (チャンク) ごとの SHA-256 (カンマ区切り)",
+    )
 
     creator: Optional["User"] = Relationship(back_populates="school_infos")
     groups_allowed: list["SchoolInfoGroup"] = Relationship(back_populates="schoolinfo")
@@ -300,6 +384,36 @@ class SchoolInfo(SQLModel, table=True):
         }
 
 
+class VectorStoreOutbox(SQLModel, table=True):
+    """
+    ベクターストア (Cosmos DB) への同期待ちの学校情報。
+    SchoolInfo の変更と同じトランザクションで追加し、バックグラウンドの dispatcher が処理後に削除する。
+    同期は source_id の学校情報の現在の状態 (存在しなければ削除) を反映するため、何度実行しても結果は変わらない。
+    """
+
+    id: int | None = Field(
+        None,
+        primary_key=True,
+        title="ID",
+        description="同期待ちのレコードを一意に識別するためのID",
+    )
+    source_id: int = Field(..., index=True, title="学校情報ID", description="同期する学校情報のID")
+    created_at: datetime = Field(..., title="作成日時", description="レコードの作成日時")
+    available_at: datetime = Field(..., index=True, title="処理可能日時", description="次に処理を試みる日時")
+    metadata_only: bool = Field(
+        default=False,
+        title="メタデータのみ",
+        description="内容は変わらずタイトルのみ変更された (埋め込みを作り直さない)",
+    )
+    attempts: int = Field(default=0, title="試行回数", description="同期に失敗した回数")
+    last_error: str | None = Field(
+        None,
+        sa_column=Column(UnicodeText),
+        title="最後のエラー",
+        description="最後に失敗した際のエラー内容",
+    )
+
+
 class Group(SQLModel, table=True):
     id: int | None = Field(
         None,
@@ -1,63 +1,101 @@
 import logging
-from collections.abc import Generator
 from datetime import timedelta
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlmodel import Session, select
+from fastapi import APIRouter, Cookie, Depends, HTTPException, Response
+from sqlalchemy import Engine, update
 
+from api.app.database.database import add_db_record, execute_statement, select_table
 from api.app.database.engine import get_engine
-from api.app.dtos.auth_dtos import LoginData
+from api.app.dtos.auth_dtos import LoginData, RefreshData
 from api.app.dtos.user_dtos import UserCreateDTO, UserDTO
 from api.app.models import User
 from api.app.security.jwt_token import (
     create_access_token,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    optional_oauth2_scheme,
+    refresh_family_of,
+    revoke_access_token,
+    verify_password_async,
 )
+from api.app.security.password import password_hasher
+from api.app.security.principal import build_token_claims
+from api.app.security.refresh_token import (
+    REFRESH_TOKEN_COOKIE,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    issue_refresh_token,
+    new_family_id,
+    refresh_token_family,
+    revoke_family,
+    rotate_refresh_token,
+)
+from api.app.tasks import task_queue
 from api.logger import getLogger
 
 router = APIRouter()
 logger = getLogger("auth_router", logging.DEBUG)
 
 
-# セッション管理用の依存関数
-def get_session() -> Generator[Session, None, None]:
+async def save_rehashed_password(engine: Engine, user_id: str, old_hash: str, new_hash: str) -> None:
     """
-    データベースセッションを生成する依存関数。
-    Yields:
-        Session: SQLModelのデータベースセッション
+    現在のコストで付け直したハッシュを保存する。パスワード自体は変わらないためトークンは失効させない。
+    その間にパスワードが変更されていた場合は上書きしない。
     """
-    engine = get_engine()
-    with Session(engine) as session:
-        yield session
+    stmt = update(User).where(User.id == user_id, User.password == old_hash).values(password=new_hash)
+    if not await execute_statement(engine, stmt):
+        logger.info("Password changed before the rehash was saved; skipped: %s", user_id)
+        return
+    password_hasher.record_rehash()
+    logger.info("Password rehashed with %d rounds: %s", password_hasher.rounds, user_id)
+
+
+def set_token_cookies(response: Response, access_token: str, refresh_token: str) -> None:
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        httponly=False,
+        max_age=1800,
+        expires=1800,
+        secure=False,
+        samesite="lax",
+    )
+    # リフレッシュトークンは JavaScript から読めないようにし、/auth 以下にのみ送信する
+    max_age = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+    response.set_cookie(
+        key=REFRESH_TOKEN_COOKIE,
+        value=refresh_token,
+        httponly=True,
+        max_age=max_age,
+        expires=max_age,
+        path="/auth",
+        secure=False,
+        samesite="lax",
+    )
 
 
 # サインアップエンドポイント
 @router.post("/signup", response_model=UserDTO, tags=["signup"])
 async def signup(
-    user: UserCreateDTO, session: Annotated[Session, Depends(get_session)]
+    user: UserCreateDTO, engine: Annotated[Engine, Depends(get_engine)]
 ) -> UserDTO:
-    logger.debug("Signup API called with user data: %s", user.dict())
+    logger.debug("Signup API called: %s", user.email)
     try:
         # ユーザーの存在確認
-        existing_user = session.exec(
-            select(User).where(User.email == user.email)
-        ).first()
+        existing_users = await select_table(engine, User, {"email": user.email}, limit=1)
+        existing_user = existing_users[0] if existing_users else None
         logger.debug("Existing user query result: %s", existing_user)
 
         if existing_user:
             logger.warning("Attempted to register with existing email: %s", user.email)
             raise HTTPException(status_code=400, detail="Email already registered")
-        
+
         if user.email is None:
             logger.error("ユーザーの email が None です。適切な値を設定してください。")
         elif user.password is None:
             logger.error("ユーザーの password が None です。認証に必要な値を設定してください。")
 
         # パスワードをハッシュ化して保存
-        hashed_password = get_password_hash(user.password)
-        logger.debug("Hashed password: %s", hashed_password)
+        hashed_password = await get_password_hash_async(user.password)
 
         new_user = User(
             name=user.name,
@@ -66,11 +104,10 @@ async def signup(
             authority=user.authority,
             major_id=user.major_id,
         )
-        session.add(new_user)
-        session.commit()
-        session.refresh(new_user)
+        # 主キーは INSERT 時に取得されるため、refresh の SELECT は行わない
+        await add_db_record(engine, new_user)
 
-        logger.info("New user created: %s", new_user.dict())
+        logger.info("New user created: %s", new_user.id)
 
         # ユーザー情報をDTO形式で返す
         signup_dto = UserDTO(
@@ -80,8 +117,10 @@ async def signup(
             authority=new_user.authority,
             major_id=new_user.major_id,
         )
-        logger.debug("Signup DTO: %s", signup_dto.dict())
+        logger.debug("Signup DTO: user_id=%s", signup_dto.id)
         return signup_dto
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error in signup endpoint: %s", str(e), exc_info=True)
         raise HTTPException(status_code=500, detail="An error occurred during signup")
@@ -89,42 +128,109 @@ async def signup(
 
 # ログインエンドポイント
 @router.post("/login", response_model=dict, tags=["login"])
-async def login(user: LoginData, response: Response, session: Annotated[Session, Depends(get_session)]) -> dict:
-    db_user = session.exec(select(User).where(User.email == user.email)).first()
-    if not db_user or not verify_password(user.password, db_user.password):
+async def login(user: LoginData, response: Response, engine: Annotated[Engine, Depends(get_engine)]) -> dict:
+    db_users = await select_table(engine, User, {"email": user.email}, limit=1)
+    db_user = db_users[0] if db_users else None
+    if not db_user or not await verify_password_async(user.password, db_user.password):
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
-    # トークンにメールアドレスとユーザーIDを含める
+    # 現在より低いコストのハッシュは付け直す
+    # 平文のパスワードをタスクキューに残さないようハッシュ化はリクエスト内で行い、保存のみ応答後に行う
+    if password_hasher.needs_rehash(db_user.password):
+        try:
+            new_hash = await password_hasher.hash(user.password)
+        except HTTPException as e:
+            # 混雑している場合は次回のログインに回す
+            logger.info("Password rehash skipped: %s", e.detail)
+        else:
+            old_hash = db_user.password
+            task_queue.enqueue(
+                lambda: save_rehashed_password(engine, db_user.id, old_hash, new_hash),
+                key=f"rehash_password:{db_user.id}",
+            )
+
+    # アクセストークンの期限切れ後は /auth/refresh で再発行し、bcrypt による再ログインを避ける
+    family_id = new_family_id()
+    refresh_token = await issue_refresh_token(engine, db_user.id, family_id)
+    # トークンにメールアドレスとユーザーID、認可に必要なクレームと、ログアウト用のリフレッシュトークンの系列を含める
     access_token = create_access_token(
-        data={"sub": db_user.email, "user_id": db_user.id},
+        data={**build_token_claims(db_user), "fid": family_id},
         expires_delta=timedelta(minutes=30),
     )
 
-    response.set_cookie(
-        key="access_token",
-        value=access_token,
-        httponly=False,
-        max_age=1800,
-        expires=1800,
-        secure=False,
-        samesite="lax",
-    )
+    set_token_cookies(response, access_token, refresh_token)
     return {
         "access_token": access_token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "role": db_user.authority,
         "message": "Login successful",
     }
 
 
+# トークン再発行エンドポイント
+@router.post("/refresh", response_model=dict, tags=["login"])
+async def refresh(
+    response: Response,
+    engine: Annotated[Engine, Depends(get_engine)],
+    data: RefreshData | None = None,
+    refresh_cookie: Annotated[str | None, Cookie(alias=REFRESH_TOKEN_COOKIE)] = None,
+) -> dict:
+    """
+    リフレッシュトークンを使ってアクセストークンを再発行する。
+    リフレッシュトークンは使用するたびに新しいものに置き換わり、古いトークンを再び使うと同じ系列のトークンはすべて失効する。
+
+    Args:
+        data (RefreshData | None): リクエストボディのリフレッシュトークン (Cookie を使わない場合)。
+        refresh_cookie (str | None): Cookie のリフレッシュトークン。
+
+    Returns:
+        dict: 新しいアクセストークンとリフレッシュトークン。
+    """
+    token = (data.refresh_token if data else None) or refresh_cookie
+    if not token:
+        raise HTTPException(
+            status_code=401, detail="リフレッシュトークンがありません", headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    db_user, refresh_token, family_id = await rotate_refresh_token(engine, token)
+    access_token = create_access_token(
+        data={**build_token_claims(db_user), "fid": family_id},
+        expires_delta=timedelta(minutes=30),
+    )
+
+    set_token_cookies(response, access_token, refresh_token)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "role": db_user.authority,
+        "message": "Token refreshed",
+    }
+
+
 # ログアウトエンドポイント
 @router.post("/logout", tags=["logout"])
-async def logout(response: Response) -> dict:
+async def logout(
+    response: Response,
+    engine: Annotated[Engine, Depends(get_engine)],
+    data: RefreshData | None = None,
+    token: Annotated[str | None, Depends(optional_oauth2_scheme)] = None,
+    access_cookie: Annotated[str | None, Cookie(alias="access_token")] = None,
+    refresh_cookie: Annotated[str | None, Cookie(alias=REFRESH_TOKEN_COOKIE)] = None,
+) -> dict:
     """
-    クライアント側のトークンを無効化するログアウトエンドポイント。
+    トークンを無効化するログアウトエンドポイント。
+    アクセストークンは有効期限まで失効させ、リフレッシュトークンは同じ系列 (ログイン) のトークンをすべて失効させる。
+    系列はリフレッシュトークン、またはアクセストークンの fid クレームから求めるため、
+    リフレッシュトークンを送らないクライアントのログアウトでも失効させられる。
 
     Args:
         response (Response): クッキーの削除のためのレスポンスオブジェクト。
+        data (RefreshData | None): リクエストボディのリフレッシュトークン (Cookie を使わない場合)。
+        token (str | None): Authorization ヘッダーのアクセストークン。
+        access_cookie (str | None): Cookie のアクセストークン。
+        refresh_cookie (str | None): Cookie のリフレッシュトークン。
 
     Returns:
         dict: ログアウトの成功メッセージ。
@@ -132,9 +238,21 @@ async def logout(response: Response) -> dict:
     try:
         # クッキーを削除する
         response.delete_cookie(key="access_token", samesite="lax")
+        response.delete_cookie(key=REFRESH_TOKEN_COOKIE, path="/auth", samesite="lax")
+        access_tokens = {token, access_cookie} - {None}
+        families = {refresh_family_of(access_token) for access_token in access_tokens}
+        for refresh_token in {data.refresh_token if data else None, refresh_cookie} - {None}:
+            families.add(await refresh_token_family(engine, refresh_token))
+        for family_id in families - {None}:
+            await revoke_family(engine, family_id)
+        # 失効リストが満杯の場合 (503) も、リフレッシュトークンは先に失効させておく
+        for access_token in access_tokens:
+            revoke_access_token(access_token)
 
         logger.info("User logged out successfully")
         return {"message": "Logout successful"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error in logout endpoint: %s", str(e), exc_info=True)
         raise HTTPException(status_code=500, detail="An error occurred during logout")
@@ -1,40 +1,51 @@
-import asyncio
 import json
-import logging
-from collections.abc import AsyncGenerator, Generator
+from collections.abc import AsyncGenerator
 from datetime import datetime
 from typing import Annotated, Any
 import traceback
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
 from sc_system_ai import main as SC_AI
-from sc_system_ai.template.session_naming import session_naming
 from sqlalchemy import Engine
-
+from starlette.background import BackgroundTask
+
+from api.app.chat.history import load_recent_history
+from api.app.chat.history_cache import get_history_cache
+from api.app.chat.limiter import get_ai_limiter
+from api.app.chat.naming import schedule_session_naming
+from api.app.chat.retrieval import retrieve_grounding
+from api.app.chat.streaming import ThreadedStream, format_ndjson, format_sse
 from api.app.database.database import (
     add_db_record,
     delete_record,
     select_table,
+    select_table_keyset,
     update_record,
 )
 from api.app.database.engine import get_engine
+from api.app.database.unit_of_work import unit_of_work
+from api.app.database.pagination import NEXT_CURSOR_HEADER
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.metrics import llm_call_duration, llm_call_errors, track
+from api.app.middleware.timing import span
 from api.app.dtos.chatlog_dtos import (
     ChatCreateDTO,
     ChatLogDTO,
     ChatOrderBy,
     ChatSearchDTO,
+    ChatStreamFormat,
     ChatUpdateDTO,
 )
+from api.app.dtos.pagination_dtos import PaginationMode
 from api.app.models import ChatLog, User, Session
 from api.app.security.role import Role, role_required
 from api.app.security.jwt_token import get_current_user
 from api.app.security.role import Role, role_required
-from api.logger import getLogger
+from api.logger import capped, getLogger
 
 router = APIRouter()
-logger = getLogger("chatlog_router")
-logger.setLevel(logging.DEBUG)
+logger = getLogger("chatlog_router", "DEBUG")
 
 
 # @router.post("/input/chat-demo", tags=["chat_post"])
@@ -71,189 +82,105 @@ logger.setLevel(logging.DEBUG)
 #         )
 
 
-# @router.post("/test/resp-invoke", tags=["test"])
-# async def test_resp_invoke_endpoint(chatlog: ChatCreateDTO) -> StreamingResponse:
-#     """
-#     resp.invoke と async_wrap を単独でテストするためのAPIエンドポイント
-#     """
-#     logger.info(f"単独テストリクエストを受け付けました。メッセージ: {chatlog.message}")
+# 会話履歴が空の場合に AI に渡すサンプルデータ
+SAMPLE_CONVERSATIONS = [
+    ("human", "こんにちは!"),
+    ("ai", "本日はどのようなご用件でしょうか？"),
+]
 
-#     try:
-#         # テスト用の AI チャットインスタンス
-#         resp = SC_AI.Chat(
-#             user_name="テストユーザー",
-#             user_major="テスト専攻",
-#             conversation=[
-#                 ("human", "おはようございます！"),
-#                 ("ai", "おはようございます！"),
-#             ],
-#             is_streaming=True,
-#             return_length=5,
-#         )
+# ストリーミングのレスポンス形式ごとの media_type
+STREAM_MEDIA_TYPES = {
+    ChatStreamFormat.sse: "text/event-stream",
+    ChatStreamFormat.ndjson: "application/x-ndjson",
+}
 
-#         # 非同期ジェネレータの実装
-#         async def bot_reply_generator():
-#             try:
-#                 async for chunk in resp.invoke(message=chatlog.message):
-#                     logger.debug(f"Generator チャンク: {chunk}")
-#                     yield json.dumps({"message": chunk}) + "\n\n"
-#             except Exception as e:
-#                 logger.error(f"Generator エラー: {str(e)}", exc_info=True)
-#                 raise
-
-#         # StreamingResponseを返す
-#         return StreamingResponse(
-#             bot_reply_generator(),
-#             media_type="application/json",
-#         )
-#     except Exception as e:
-#         logger.error(f"単独テストエラー: {str(e)}", exc_info=True)
-#         raise HTTPException(
-#             status_code=500,
-#             detail=f"単独テスト中にエラーが発生しました: {str(e)}",
-#         )
 
+def new_session_record(current_user: User) -> Session:
+    """チャットの開始時に作成するセッションのレコード"""
+    return Session(
+        session_name="New Session",
+        pub_data=datetime.now(),
+        user_id=current_user.id,
+    )
 
-# テキストストリーム用の非同期ジェネレータラッパー
-async def async_wrap(
-    generator: Generator[str, None, None]
-) -> AsyncGenerator[str, None]:
-    try:
-        for item in generator:
-            logger.debug(f"Generator item: {item}")
-            yield item
-            await asyncio.sleep(0)
-    except Exception as e:
-        logger.error(f"async_wrapエラー: {str(e)}", exc_info=True)
-        raise
 
+async def prepare_chat_turn(chatlog: ChatCreateDTO, engine: Engine) -> list[tuple[str, str]]:
+    """
+    AI を呼び出す前の共通処理。AI に渡す会話履歴を返す。
+    セッションIDがない場合のセッションの作成は、チャットログと同じトランザクションで save_chat_turn が行う。
+    """
+    tagged_conversations = []
+    if chatlog.session_id:
+        # セッションIDを使用して会話履歴を取得
+        tagged_conversations = await get_tagged_conversations(
+            chatlog.session_id, engine
+        )
+        logger.debug(
+            "取得した会話履歴 (tagged_conversations): %d件 %s", len(tagged_conversations), capped(tagged_conversations)
+        )
 
-# StreamingResponseでのリアルタイムレスポンス
-async def text_stream(
-    bot_reply_generator: AsyncGenerator[str, None],
-    chatlog: ChatCreateDTO,
-    engine: Engine,
-    current_user: User,
-) -> AsyncGenerator[str, None]:  # 戻り値をAsyncGeneratorに明示
-    bot_reply = ""
+    # 会話履歴が空の場合にサンプルデータを追加
+    if not tagged_conversations:
+        logger.warning("会話履歴が空のため、サンプルデータを追加します。")
+        tagged_conversations.extend(SAMPLE_CONVERSATIONS)
+        logger.debug("サンプルデータが追加されました: %s", SAMPLE_CONVERSATIONS)
 
-    async def stream():
-        try:
-            logger.debug("Streaming開始")
-            async for i, chunk in enumerate(bot_reply_generator):
-                bot_reply += chunk
-                yield json.dumps({"index": i, "message": chunk}) + "\n\n"
-                logger.debug(f"Chunk received: {chunk}")
-                await asyncio.sleep(0)
-        except Exception as e:
-            logger.error(f"Streaming中のエラー: {str(e)}", exc_info=True)
-            raise
+    return tagged_conversations
 
-        try:
-            # ストリーム終了後にチャットログを保存
-            chat_log_data = ChatLog(
-                message=chatlog.message,
-                bot_reply=bot_reply,
-                pub_data=chatlog.pub_data or datetime.now(),
-                session_id=chatlog.session_id,
-            )
-            logger.debug("チャットログ保存を試みています")
-            await asyncio.to_thread(add_db_record, engine, chat_log_data)
-            logger.info(f"チャットログを保存しました: {chat_log_data}")
 
-            # DTO形式で最終的なレスポンスを返す
-            dto = ChatLogDTO(
-                id=chat_log_data.id,
-                message=chat_log_data.message,
-                bot_reply=chat_log_data.bot_reply,
-                pub_data=chat_log_data.pub_data,
-                session_id=chat_log_data.session_id,
+async def save_chat_turn(
+    chatlog: ChatCreateDTO,
+    bot_reply: str,
+    tagged_conversations: list[tuple[str, str]],
+    engine: Engine,
+    current_user: User,
+) -> ChatLog:
+    """
+    AI の応答をチャットログとして保存し、履歴キャッシュの更新とセッション名の生成の登録を行う。
+    セッションの作成・チャットログの追加・命名状態の更新は 1 つのトランザクションでコミットする。
+    """
+    async with unit_of_work(engine):
+        # セッションIDがない場合、新しいセッションを作成
+        if not chatlog.session_id:
+            new_session = new_session_record(current_user)
+            await add_db_record(engine, new_session)
+            chatlog.session_id = new_session.id
+            logger.info(
+                "新しいセッションを作成しました。セッションID: %s, 一時的なセッション名: 'New Session'",
+                chatlog.session_id,
             )
-            yield json.dumps(dto.model_dump()) + "\n"
-        except Exception as e:
-            logger.error(f"チャットログ保存中のエラー: {str(e)}", exc_info=True)
-            raise
-
-    return stream()
-
-
-# @router.post("/input/chat", response_model=ChatLogDTO, tags=["chat_post"])
-# @role_required(Role.STUDENT)
-# async def create_chatlog(
-#     chatlog: ChatCreateDTO,
-#     engine: Annotated[Engine, Depends(get_engine)],
-#     current_user: Annotated[User, Depends(get_current_user)],
-# ) -> StreamingResponse:
-#     logger.info(
-#         f"チャット作成リクエストを受け付けました。ユーザーID: {current_user.id}"
-#     )
 
-#     try:
-#         # セッションIDがない場合、新しいセッションを作成
-#         if not chatlog.session_id:
-#             new_session = Session(
-#                 session_name="Default Session",
-#                 pub_data=datetime.now(),
-#                 user_id=current_user.id,
-#             )
-#             await add_db_record(engine, new_session)
-#             chatlog.session_id = new_session.id
-#             logger.info(
-#                 f"新しいセッションを作成しました。セッションID: {chatlog.session_id}"
-#             )
-
-#         # get_tagged_conversationsを使用して過去の会話履歴を取得
-#         tagged_conversations = await get_tagged_conversations(
-#             chatlog.session_id, engine
-#         )
-#         logger.info(f"取得した会話履歴 (tagged_conversations): {tagged_conversations}")
-
-#         # AI応答を生成するChatインスタンスを作成
-#         resp = SC_AI.Chat(
-#             user_name=current_user.name,
-#             user_major=current_user.major,
-#             conversation=tagged_conversations,
-#             is_streaming=True,
-#             return_length=5,
-#         )
-
-#         # メッセージに対するAI応答を生成し、非同期で取得
-#         logger.debug(f"AIモデルに渡すデータ: {tagged_conversations}")
-#         bot_reply_generator = async_wrap(resp.invoke(message=chatlog.message))
-#         logger.debug("AIモデル呼び出しが成功しました")
-#         logger.debug("text_streamが開始されました")
-#         logger.debug(f"bot_reply_generatorの型: {type(bot_reply_generator)}")
-
-#         # StreamingResponseでリアルタイムにAI応答を返却し、最後にDTOを返す
-#         try:
-#             logger.debug("StreamingResponseの準備を開始")
-#             # text_streamの呼び出しを修正
-#             stream = text_stream(bot_reply_generator, chatlog, engine, current_user)
-#             return StreamingResponse(stream, media_type="application/json")
-#         except Exception as e:
-#             logger.error(f"StreamingResponseエラー: {str(e)}", exc_info=True)
-#             raise HTTPException(
-#                 status_code=500,
-#                 detail=f"ストリーミング中にエラーが発生しました: {str(e)}",
-#             )
+        chat_log_data = ChatLog(
+            message=chatlog.message,
+            bot_reply=bot_reply,
+            pub_data=chatlog.pub_data or datetime.now(),
+            session_id=chatlog.session_id,
+        )
+        await add_db_record(engine, chat_log_data)
 
-#     except Exception as e:
-#         logger.error(f"チャットログ作成中にエラーが発生しました: {str(e)}")
-#         raise HTTPException(
-#             status_code=500,
-#             detail=f"チャットログの作成中にエラーが発生しました。{str(e)}",
-#         ) from e
+        # セッション名の生成は LLM の呼び出しを伴うため、応答を返した後にバックグラウンドで行う
+        # (タスクの登録はコミット後に行われる)
+        history = [
+            (role, text)
+            for role, text in tagged_conversations
+            if (role, text) not in SAMPLE_CONVERSATIONS
+        ]
+        await schedule_session_naming(
+            engine,
+            chatlog.session_id,
+            [*history, ("human", chatlog.message), ("ai", bot_reply)],
+        )
 
+    logger.info(
+        "チャットログを保存しました。チャットID: %s, セッションID: %s", chat_log_data.id, chat_log_data.session_id
+    )
 
-async def update_session_name(session_id: int, conversations: list, engine: Engine):
-    """セッション名を生成して更新するヘルパー関数"""
-    session_name = session_naming(conversations)
-    conditions = {"id": session_id}
-    updates = {"session_name": session_name}
-    await update_record(
-        engine=engine, model=Session, conditions=conditions, updates=updates
+    # 次のターンで SQL を読み直さないよう、キャッシュ済みの履歴に今回の往復を追記する
+    await get_history_cache().append(
+        chatlog.session_id, [("human", chat_log_data.message), ("ai", bot_reply)]
     )
-    return session_name
+
+    return chat_log_data
 
 
 @router.post("/input/chat", response_model=ChatLogDTO, tags=["chat_post"])
@@ -263,70 +190,59 @@ async def create_chatlog(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> ChatLogDTO:
-    logger.info(
-        f"チャット作成リクエストを受け付けました。ユーザーID: {current_user.id}"
-    )
+    logger.info("チャット作成リクエストを受け付けました。ユーザーID: %s", current_user.id)
 
     try:
-        # 定数としてサンプルデータを定義
-        SAMPLE_CONVERSATIONS = [
-            ("human", "こんにちは!"),
-            ("ai", "本日はどのようなご用件でしょうか？"),
-        ]
-
-        # セッションIDがない場合、新しいセッションを作成
-        if not chatlog.session_id:
-            new_session = Session(
-                session_name="New Session",
-                pub_data=datetime.now(),
-                user_id=current_user.id,
-            )
-            await add_db_record(engine, new_session)
-            chatlog.session_id = new_session.id
-            logger.info(
-                f"新しいセッションを作成しました。セッションID: {chatlog.session_id}, \
-                一時的なセッション名: 'New Session'"
-            )
-
-        # セッションIDを使用して会話履歴を取得
-        tagged_conversations = await get_tagged_conversations(
-            chatlog.session_id, engine
-        )
-        logger.info(f"取得した会話履歴 (tagged_conversations): {tagged_conversations}")
-
-        # 会話履歴が空の場合にサンプルデータを追加
-        if not tagged_conversations:
-            logger.warning("会話履歴が空のため、サンプルデータを追加します。")
-            tagged_conversations.extend(SAMPLE_CONVERSATIONS)
-            logger.info(f"サンプルデータが追加されました: {SAMPLE_CONVERSATIONS}")
+        with span("history"):
+            tagged_conversations = await prepare_chat_turn(chatlog, engine)
+        # ローカルのベクターインデックスを使う場合は、関連する学校情報を会話の先頭に追加して渡す
+        grounding = await retrieve_grounding(chatlog.message)
 
         # AI応答を生成
         resp = SC_AI.Chat(
             user_name=current_user.name,
             user_major="fugafuga専攻", # current_user.major
-            conversation=tagged_conversations,
+            conversation=[*grounding.conversation, *tagged_conversations],
         )
 
-        logger.debug(f"AIモデルに渡すデータ: {tagged_conversations}")
+        logger.debug("AIモデルに渡すデータ: %s", capped(tagged_conversations))
         try:
-            raw_response = resp.invoke(message=chatlog.message)
-            logger.debug(f"AIモデルの応答 (raw): {raw_response}")
+            # LLM 呼び出しはイベントループをブロックしないよう AI 用のワーカープールで実行する
+            # 同時実行数は AI_MAX_IN_FLIGHT で制限し、空きを待つリクエストはユーザー間で公平に処理する
+            limiter = get_ai_limiter()
+            with span("ai_queue"):
+                await limiter.acquire(current_user.id)
+            try:
+                with span("llm"), track(llm_call_duration, llm_call_errors, "chat"):
+                    raw_response = await run_in_pool(AI_POOL, resp.invoke, message=chatlog.message)
+            finally:
+                limiter.release()
+            logger.debug("AIモデルの応答 (raw): %s", capped(raw_response))
 
             # 応答が辞書型としてそのまま渡された場合の処理
             if isinstance(raw_response, dict) and {"output", "error", "document_id"} <= raw_response.keys():
-                logger.debug(f"受信した応答が辞書型: {raw_response}")
+                logger.debug("受信した応答が辞書型: %s", capped(raw_response))
                 bot_reply = raw_response.get("output", "No output available.")
             else:
                 # それ以外のケースはエラーメッセージを設定
-                logger.warning(f"予期しない応答形式: {raw_response}")
+                logger.warning("予期しない応答形式: %s", capped(raw_response))
                 bot_reply = "Unexpected response format from AI."
 
-            logger.debug(f"整形済みAI応答: {bot_reply}")
+            logger.debug("整形済みAI応答: %s", capped(bot_reply))
 
+        except HTTPException:
+            # プールの飽和・実行枠待ちのタイムアウト (503/429) はそのまま返す
+            raise
         except Exception as e:
             # エラーが発生した場合はエラーメッセージを設定
             bot_reply = f"An error occurred while processing the AI response: {e}"
-            logger.error(f"AI応答データの処理中にエラーが発生しました: {e}")
+            logger.error("AI応答データの処理中にエラーが発生しました: %s", e)
+
+            # エラー時でも続けて会話できるよう、セッションは作成しておく
+            if not chatlog.session_id:
+                new_session = new_session_record(current_user)
+                await add_db_record(engine, new_session)
+                chatlog.session_id = new_session.id
 
             # エラー時でもレスポンスを返却
             return ChatLogDTO(
@@ -337,34 +253,11 @@ async def create_chatlog(
                 session_id=chatlog.session_id,
             )
 
-        # チャットログを保存
-        chat_log_data = ChatLog(
-            message=chatlog.message,
-            bot_reply=bot_reply,
-            pub_data=chatlog.pub_data or datetime.now(),
-            session_id=chatlog.session_id,
-        )
-        await add_db_record(engine, chat_log_data)
-
-        logger.info(f"チャットログを保存しました: {chat_log_data}")
-        logger.info(f"ドキュメントID:{raw_response['document_id']}")
-
-        # 実際のデータを会話履歴に追加
-        tagged_conversations.append(
-            ("human", chatlog.message)
-        )  # 新しいユーザーのメッセージ
-        tagged_conversations.append(("ai", ""))  # AI応答は後で更新
-
-        # サンプルデータを除外してセッション名を生成・更新
-        filtered_conversations = [
-            (role, text)
-            for role, text in tagged_conversations
-            if (role, text) not in SAMPLE_CONVERSATIONS
-        ]
-        session_name = await update_session_name(
-            chatlog.session_id, filtered_conversations, engine
-        )
-        logger.info(f"セッション名を更新しました: {session_name}")
+        with span("save"):
+            chat_log_data = await save_chat_turn(
+                chatlog, bot_reply, tagged_conversations, engine, current_user
+            )
+        logger.info("ドキュメントID:%s", raw_response['document_id'])
 
         # DTO形式でレスポンスを返却
         return ChatLogDTO(
@@ -373,13 +266,13 @@ async def create_chatlog(
             bot_reply=chat_log_data.bot_reply,
             pub_data=chat_log_data.pub_data,
             session_id=chat_log_data.session_id,
-            document_id=raw_response["document_id"],
+            document_id=grounding.document_ids or raw_response["document_id"],
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(
-            f"チャットログ作成中にエラーが発生しました: {str(e)}", exc_info=True
-        )
+        logger.error("チャットログ作成中にエラーが発生しました: %s", e, exc_info=True)
         tb = traceback.format_exc()
         raise HTTPException(
             status_code=500,
@@ -387,22 +280,119 @@ async def create_chatlog(
         ) from e
 
 
+def split_stream_chunk(chunk: Any) -> tuple[str, list[int] | None]:
+    """
+    ストリーミング応答の 1 チャンクを (テキスト, document_id) に分解する。
+    SC_AI は通常 str を返すが、非ストリーミング時と同じ形式の辞書が混ざる場合にも対応する。
+    """
+    if isinstance(chunk, dict):
+        return chunk.get("output") or "", chunk.get("document_id")
+    return ("" if chunk is None else str(chunk)), None
+
+
+@router.post("/input/chat/stream", tags=["chat_post"])
+@role_required(Role.STUDENT)
+async def create_chatlog_stream(
+    chatlog: ChatCreateDTO,
+    engine: Annotated[Engine, Depends(get_engine)],
+    current_user: Annotated[User, Depends(get_current_user)],
+    stream_format: Annotated[ChatStreamFormat, Query(alias="format")] = ChatStreamFormat.sse,
+) -> StreamingResponse:
+    """
+    AI の応答を生成され次第逐次返すエンドポイント。
+
+    chunk イベントで応答の断片を送り、生成が終わった時点でチャットログを 1 回だけ保存して
+    done イベントで ChatLogDTO (document_id を含む) を返す。失敗した場合は error イベントを返す。
+    クライアントが切断した場合は上流の生成を打ち切り、チャットログは保存しない。
+    """
+    logger.info("ストリーミングチャット作成リクエストを受け付けました。ユーザーID: %s", current_user.id)
+
+    with span("history"):
+        tagged_conversations = await prepare_chat_turn(chatlog, engine)
+    grounding = await retrieve_grounding(chatlog.message)
+    resp = SC_AI.Chat(
+        user_name=current_user.name,
+        user_major="fugafuga専攻", # current_user.major
+        conversation=[*grounding.conversation, *tagged_conversations],
+        is_streaming=True,
+    )
+
+    # 実行枠の確保とプールへの投入はレスポンスを返し始める前に行い、混雑時は 503/429 を返す
+    limiter = get_ai_limiter()
+    with span("ai_queue"):
+        await limiter.acquire(current_user.id)
+    stream = ThreadedStream(AI_POOL, lambda: resp.invoke(message=chatlog.message))
+    try:
+        worker = stream.start()
+    except BaseException:
+        limiter.release()
+        raise
+    # 実行枠はワーカー上の生成が実際に終わった時点で返却する
+    worker.add_done_callback(lambda _: limiter.release())
+    encode = format_sse if stream_format == ChatStreamFormat.sse else format_ndjson
+
+    async def event_stream() -> AsyncGenerator[str, None]:
+        chunks: list[str] = []
+        document_id: list[int] | None = grounding.document_ids or None
+        try:
+            # ヘッダーの送信後に計測する区間はログにのみ出力される
+            with span("llm"), track(llm_call_duration, llm_call_errors, "stream"):
+                async for chunk in stream:
+                    text, chunk_document_id = split_stream_chunk(chunk)
+                    if chunk_document_id is not None and not grounding.document_ids:
+                        document_id = chunk_document_id
+                    if not text:
+                        continue
+                    yield encode("chunk", {"index": len(chunks), "message": text})
+                    chunks.append(text)
+
+            with span("save"):
+                chat_log_data = await save_chat_turn(
+                    chatlog, "".join(chunks), tagged_conversations, engine, current_user
+                )
+            dto = ChatLogDTO(
+                id=chat_log_data.id,
+                message=chat_log_data.message,
+                bot_reply=chat_log_data.bot_reply,
+                pub_data=chat_log_data.pub_data,
+                session_id=chat_log_data.session_id,
+                document_id=document_id,
+            )
+            yield encode("done", json.loads(dto.model_dump_json()))
+        except Exception as e:
+            # ヘッダ送信後はステータスコードを変更できないため、error イベントで通知する
+            logger.error("ストリーミング中にエラーが発生しました: %s", e, exc_info=True)
+            yield encode("error", {"detail": f"ストリーミング中にエラーが発生しました: {str(e)}"})
+        finally:
+            # クライアントの切断でキャンセルされた場合も、上流の生成を止める
+            stream.cancel()
+
+    # 本文の送信が始まる前にクライアントが切断した場合は event_stream の finally が実行されないため、
+    # 応答の終了時 (切断時を含む) に実行される BackgroundTask でも上流の生成を止め、実行枠を返却させる
+    return StreamingResponse(
+        event_stream(),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(stream.cancel),
+    )
+
+
 async def get_tagged_conversations(session_id: int, engine: Engine) -> list[tuple[str, str]]:
     tagged_conversations = []
     try:
-        condition = {"session_id": session_id}
-        past_chats = await select_table(engine=engine, model=ChatLog, conditions=condition, order_by="pub_data")
-        logger.info(f"取得した会話履歴: {past_chats}")
-        if not past_chats:
-            return []  # サンプルデータを返さない
-        for chat in past_chats:
-            if chat.message:
-                tagged_conversations.append(("human", chat.message))
-            if chat.bot_reply:
-                tagged_conversations.append(("ai", chat.bot_reply))
-        logger.info(f"タグ付けした会話履歴: {tagged_conversations}")
+        cache = get_history_cache()
+        cached = await cache.get(session_id)
+        if cached is not None:
+            return cached
+
+        # 読み込み中に別のリクエストが往復を追記した場合に、古い履歴で上書きしないよう世代を控えておく
+        generation = await cache.generation(session_id)
+        # 直近の履歴のみを読み込む (件数・トークン数の上限は CHAT_HISTORY_MAX_* で設定)
+        tagged_conversations = await load_recent_history(engine, session_id)
+        await cache.set(session_id, tagged_conversations, generation)
+        logger.debug("タグ付けした会話履歴: %d件 %s", len(tagged_conversations), capped(tagged_conversations))
     except Exception as e:
-        logger.error(f"会話履歴取得中にエラーが発生しました: {e}")
+        logger.error("会話履歴取得中にエラーが発生しました: %s", e)
     return tagged_conversations
 
 
@@ -412,11 +402,14 @@ async def view_chatlog(
     search_params: Annotated[ChatSearchDTO, Depends()],
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
     order_by: ChatOrderBy | None = None,
     limit: int | None = None,
     offset: int | None = 0,
+    pagination: PaginationMode = PaginationMode.offset,
+    cursor: str | None = None,
 ) -> list[ChatLogDTO]:
-    logger.info(f"チャットログ取得リクエストを受け付けました。検索条件: {search_params}")
+    logger.info("チャットログ取得リクエストを受け付けました。検索条件: %s", search_params)
 
     conditions_dict = {}
     like_conditions = {}
@@ -427,17 +420,31 @@ async def view_chatlog(
     if search_params.message_like:
         like_conditions["message"] = search_params.message_like
 
-    chatlog = await select_table(
-        engine,
-        ChatLog,
-        conditions_dict,
-        like_conditions=like_conditions,
-        offset=offset,
-        limit=limit,
-        order_by=order_by,
-    )
+    if pagination == PaginationMode.cursor or cursor:
+        # カーソルモード: 次ページのカーソルはレスポンスヘッダで返す
+        chatlog, next_cursor = await select_table_keyset(
+            engine,
+            ChatLog,
+            conditions_dict,
+            like_conditions=like_conditions,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        chatlog = await select_table(
+            engine,
+            ChatLog,
+            conditions_dict,
+            like_conditions=like_conditions,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+        )
 
-    logger.info(f"チャットログ取得完了: {len(chatlog)}件")
+    logger.info("チャットログ取得完了: %s件", len(chatlog))
 
     chatlog_dto_list = [
         ChatLogDTO(
@@ -461,13 +468,20 @@ async def update_chatlog(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> ChatLogDTO:
-    logger.info(f"チャットログ更新リクエストを受け付けました。チャットID: {chat_id}")
+    logger.info("チャットログ更新リクエストを受け付けました。チャットID: %s", chat_id)
 
     conditions = {"id": chat_id}
     updates_dict = updates.model_dump(exclude_unset=True)
+
+    # セッションが付け替えられる場合は、元のセッションの履歴キャッシュも無効化する
+    if "session_id" in updates_dict:
+        for record in await select_table(engine, ChatLog, conditions):
+            await get_history_cache().invalidate(record.session_id)
+
     updated_record = await update_record(engine, ChatLog, conditions, updates_dict)
+    await get_history_cache().invalidate(updated_record.session_id)
 
-    logger.info(f"チャットログを更新しました。チャットID: {updated_record.id}, 更新内容: {updates_dict}")
+    logger.info("チャットログを更新しました。チャットID: %s, 更新内容: %s", updated_record.id, capped(updates_dict))
 
     updated_chatlog_dto = ChatLogDTO(
         id=updated_record.id,
@@ -487,11 +501,14 @@ async def delete_chatlog(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> dict:
-    logger.info(f"チャットログ削除リクエストを受け付けました。チャットID: {chat_id}")
+    logger.info("チャットログ削除リクエストを受け付けました。チャットID: %s", chat_id)
 
     conditions = {"id": chat_id}
+    existing = await select_table(engine, ChatLog, conditions)
     await delete_record(engine, ChatLog, conditions)
+    for record in existing:
+        await get_history_cache().invalidate(record.session_id)
 
-    logger.info(f"チャットログを削除しました。チャットID: {chat_id}")
+    logger.info("チャットログを削除しました。チャットID: %s", chat_id)
 
     return {"message": "チャットログが削除されました"}
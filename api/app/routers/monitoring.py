@@ -0,0 +1,258 @@
+import hmac
+import os
+from collections.abc import Iterable
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import Engine
+
+from api.app.chat.history_cache import get_history_cache
+from api.app.chat.limiter import get_ai_limiter
+from api.app.database.engine import engine_registry, get_engine
+from api.app.database.instrumentation import query_stats
+from api.app.executor import executors
+from api.app.metrics import Samples, registry
+from api.app.middleware.metrics import in_flight_requests
+from api.app.middleware.rate_limit import get_rate_limit_store
+from api.app.models import User
+from api.app.security.denylist import token_denylist
+from api.app.security.jwt_token import get_current_user
+from api.app.security.password import password_hasher
+from api.app.security.principal import principal_cache, token_version_cache
+from api.app.security.role import Role, role_required
+from api.app.tasks import task_queue
+from api.app.vector_store.outbox import outbox_backlog
+from api.logger import getLogger, logging_stats
+
+router = APIRouter()
+logger = getLogger("monitoring_router")
+
+# GET /metrics を Prometheus から取得する際のトークン
+# 未設定の場合は他の /metrics/* と同じく管理者のアクセストークンを要求する
+# METRICS_ALLOW_ANONYMOUS を有効にした場合のみ、トークンなしで出力する (ネットワークで保護されている場合など)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_ALLOW_ANONYMOUS = (os.getenv("METRICS_ALLOW_ANONYMOUS") or "").lower() in ("1", "true", "yes", "on")
+if METRICS_ALLOW_ANONYMOUS and not METRICS_TOKEN:
+    logger.warning("GET /metrics is served without authentication (METRICS_ALLOW_ANONYMOUS)")
+
+
+def collect_app_stats() -> Iterable[tuple[str, str, str, Samples]]:
+    """各コンポーネントの既存の統計を、GET /metrics の出力時に読み取る。"""
+    yield "http_requests_in_flight", "gauge", "HTTP requests currently being processed.", [({}, in_flight_requests())]
+
+    pools = {"sync": engine_registry.pool_status()}
+    if "async" in pools["sync"]:
+        pools["async"] = pools["sync"].pop("async")
+    yield "db_pool_checkouts_total", "counter", "Database connection pool checkouts.", [
+        ({"engine": name}, pool.get("checkouts", 0)) for name, pool in pools.items()
+    ]
+    yield "db_pool_checkout_timeouts_total", "counter", "Database connection pool checkout timeouts.", [
+        ({"engine": name}, pool.get("timeouts", 0)) for name, pool in pools.items()
+    ]
+    yield "db_pool_checked_out", "gauge", "Database connections currently checked out.", [
+        ({"engine": name}, pool["checked_out"]) for name, pool in pools.items() if "checked_out" in pool
+    ]
+
+    executor_stats = executors.snapshot()
+    yield "executor_queue_depth", "gauge", "Tasks waiting in each worker pool.", [
+        ({"pool": name}, pool["queue_depth"]) for name, pool in executor_stats.items()
+    ]
+    yield "executor_rejected_total", "counter", "Tasks rejected because the worker pool was saturated.", [
+        ({"pool": name}, pool["rejected"]) for name, pool in executor_stats.items()
+    ]
+
+    limiter = get_ai_limiter().stats()
+    yield "ai_limiter_in_flight", "gauge", "LLM calls currently holding a limiter slot.", [({}, limiter["in_flight"])]
+    yield "ai_limiter_waiting", "gauge", "Requests waiting for an LLM slot.", [({}, limiter["waiting"])]
+
+    caches = {
+        "chat_history": get_history_cache().stats(),
+        "principal": principal_cache.stats(),
+        "token_version": token_version_cache.stats(),
+    }
+    yield "cache_hits_total", "counter", "Cache hits.", [
+        ({"cache": name}, stats["hits"]) for name, stats in caches.items() if "hits" in stats
+    ]
+    yield "cache_misses_total", "counter", "Cache misses.", [
+        ({"cache": name}, stats["misses"]) for name, stats in caches.items() if "misses" in stats
+    ]
+
+    log_stats = logging_stats()
+    yield "log_queue_depth", "gauge", "Log records waiting for the writer thread.", [({}, log_stats["queue_depth"])]
+    yield "log_dropped_total", "counter", "Log records dropped because the log queue was full.", [
+        ({}, log_stats["dropped"])
+    ]
+
+
+registry.register_collector(collect_app_stats)
+
+
+@role_required(Role.ADMIN)
+async def _require_admin(current_user: User) -> None:
+    """管理者でない場合は 403 を送出する。"""
+
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["monitoring"])
+async def view_prometheus_metrics(
+    engine: Annotated[Engine, Depends(get_engine)],
+    authorization: Annotated[str | None, Header()] = None,
+) -> PlainTextResponse:
+    """
+    Prometheus のテキスト形式でメトリクスを出力するエンドポイント。
+    METRICS_TOKEN が設定されている場合は Authorization: Bearer <METRICS_TOKEN> を、
+    設定されていない場合は管理者のアクセストークンを要求する (METRICS_ALLOW_ANONYMOUS が有効な場合を除く)。
+
+    Returns:
+        PlainTextResponse: ルートごとのリクエスト数・処理時間、LLM 呼び出し、接続プール、キャッシュなどのメトリクス。
+    """
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    elif not METRICS_ALLOW_ANONYMOUS:
+        scheme, token = get_authorization_scheme_param(authorization)
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        await _require_admin(current_user=await get_current_user(token, engine))
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/db-pool", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_db_pool_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    データベース接続プールの統計情報を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: プールサイズ、使用中の接続数、チェックアウト待ち時間などの統計。
+    """
+    return engine_registry.pool_status()
+
+
+@router.get("/metrics/queries", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_query_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+    limit: int = Query(20, ge=1, le=500),
+) -> dict[str, Any]:
+    """
+    SQL の形ごとの実行時間・行数の統計を取得するエンドポイント。
+
+    Args:
+        limit (int): 返す SQL の形の数 (合計実行時間の長い順)。
+
+    Returns:
+        dict[str, Any]: 実行回数、平均・最大・p95 の実行時間、ヒストグラム、実行したルートなどの統計。
+    """
+    return query_stats.snapshot(limit)
+
+
+@router.get("/metrics/executors", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_executor_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    ワーカープールごとの待ち行列の長さと待ち時間を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: プール名をキーとした統計情報。
+    """
+    return executors.snapshot()
+
+
+@router.get("/metrics/ai-limiter", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_ai_limiter_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    AI 呼び出しの同時実行数と、実行枠を待っているリクエストの統計情報を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: 実行中・待機中の件数、タイムアウト数、待ち時間などの統計。
+    """
+    return get_ai_limiter().stats()
+
+
+@router.get("/metrics/password-hashing", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_password_hashing_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    パスワードハッシュ化サービスの統計情報を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: 現在の bcrypt のコスト、ハッシュ化・検証の件数と平均時間、スループットなど。
+    """
+    return password_hasher.stats()
+
+
+@router.get("/metrics/tasks", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_task_queue_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    バックグラウンドタスクキューの待ち行列の長さと処理件数を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: ワーカー数、待ち行列の長さ、完了・失敗件数などの統計。
+    """
+    return task_queue.stats()
+
+
+@router.get("/metrics/outbox", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_outbox_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+    engine: Annotated[Engine, Depends(get_engine)],
+) -> dict[str, Any]:
+    """
+    ベクターストアへの同期待ち (outbox) の件数を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: 同期待ち・同期を中止した件数、最も古いレコードの作成日時、このプロセスでの成功・失敗件数。
+    """
+    return await outbox_backlog(engine)
+
+
+@router.get("/metrics/rate-limit", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_rate_limit_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    レート制限の受け付け・拒否件数を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: バックエンドの種類、保持しているキー数、拒否件数などの統計。
+    """
+    store = get_rate_limit_store()
+    return store.stats() if store is not None else {"backend": None}
+
+
+@router.get("/metrics/caches", response_model=dict, tags=["monitoring"])
+@role_required(Role.ADMIN)
+async def view_cache_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> dict[str, Any]:
+    """
+    キャッシュごとのヒット率などの統計情報を取得するエンドポイント。
+
+    Returns:
+        dict[str, Any]: キャッシュ名をキーとした統計情報。
+    """
+    return {
+        "chat_history": get_history_cache().stats(),
+        "principal": principal_cache.stats(),
+        "token_denylist": token_denylist.stats(),
+    }
@@ -2,9 +2,9 @@ import logging
 from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
-from sc_system_ai.template.azure_cosmos import CosmosDBManager
 
 from api.app.database.database import (
     add_db_record,
@@ -13,16 +13,25 @@ from api.app.database.database import (
     update_record,
 )
 from api.app.database.engine import get_engine
+from api.app.database.unit_of_work import unit_of_work
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.metrics import track, vector_search_duration, vector_search_errors
+from api.app.middleware.timing import span
 from api.app.dtos.school_info_dtos import (
     SchoolInfoCreateDTO,
     SchoolInfoDTO,
     SchoolInfoSearchDTO,
+    SchoolInfoSearchResultDTO,
     SchoolInfoUpdateDTO,
     SchoolInfoTitleDTO,
 )
 from api.app.models import SchoolInfo, User
+from api.app.school_info.importer import import_school_infos, parse_import
 from api.app.security.jwt_token import get_current_user
 from api.app.security.role import Role, role_required
+from api.app.vector_store.chunking import document_hashes
+from api.app.vector_store.client import VECTOR_STORE_BACKEND, SearchableVectorStore, get_vector_store
+from api.app.vector_store.outbox import enqueue_vector_sync
 from api.logger import getLogger
 
 router = APIRouter()
@@ -46,28 +55,24 @@ async def create_school_info(
     Returns:
         SchoolInfoDTO: 作成された学校情報。
     """
-    logger.info(f"学校情報作成リクエスト。ユーザー: {current_user.id}")
+    logger.info("学校情報作成リクエスト。ユーザー: %s", current_user.id)
 
+    content_hash, chunk_hashes = document_hashes(school_info.contents)
     new_school_info = SchoolInfo(
         title=school_info.title,
         contents=school_info.contents,
         pub_date=school_info.pub_date or datetime.now(),
         updated_at=school_info.updated_at or datetime.now(),
         created_by=current_user.id,
+        content_hash=content_hash,
+        chunk_hashes=chunk_hashes,
     )
-    await add_db_record(engine, new_school_info)
-
-    logger.info(f"新しい学校情報が作成されました。ID: {new_school_info.id}")
-    cosmos_manager = CosmosDBManager(create_container=True)
-
-    cosmos_manager.create_document(
-        text=new_school_info.contents,
-        title=new_school_info.title,
-        source_id=new_school_info.id,
-    )
-
-    logger.info(f"新しい学校情報が作成されました。ID: {new_school_info.id}")
+    # ベクターストアへの同期は outbox に記録し、コミット後にバックグラウンドで行う
+    async with unit_of_work(engine):
+        await add_db_record(engine, new_school_info)
+        await enqueue_vector_sync(engine, new_school_info.id)
 
+    logger.info("新しい学校情報が作成されました。ID: %s", new_school_info.id)
 
     return SchoolInfoDTO(
         id=new_school_info.id,
@@ -79,6 +84,36 @@ async def create_school_info(
     )
 
 
+@router.post("/input/schoolinfo/bulk", tags=["schoolinfo_post"])
+@role_required(Role.STAFF)
+async def import_school_info(
+    request: Request,
+    engine: Annotated[Session, Depends(get_engine)],
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> StreamingResponse:
+    """
+    学校情報を一括で登録するエンドポイント。
+
+    Content-Type に応じて JSON の配列 (application/json)、NDJSON (application/x-ndjson)、
+    Markdown ファイルの zip (application/zip) を受け付ける。
+    zip の場合は最初の見出し (なければファイル名) をタイトルとする。
+    登録とベクターストアへの同期はバッチごとに行い、1 件ごとの結果を NDJSON で逐次返す。
+
+    Returns:
+        StreamingResponse: item イベント (index, status, id など) を 1 件ずつ返し、
+            最後に done イベントで件数の集計を返す。
+    """
+    body = await request.body()
+    items = parse_import(body, request.headers.get("content-type", ""))
+    logger.info("学校情報一括登録リクエスト。ユーザー: %s, 件数: %d", current_user.id, len(items))
+
+    return StreamingResponse(
+        import_school_infos(engine, items, current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get(
     "/view/schoolinfo/", response_model=list[SchoolInfoDTO], tags=["schoolinfo_get"]
 )
@@ -103,7 +138,7 @@ async def view_school_info(
     Returns:
         List[SchoolInfoDTO]: 学校情報のリスト。
     """
-    logger.info(f"学校情報一覧取得リクエスト: {search_params}")
+    logger.info("学校情報一覧取得リクエスト: %s", search_params)
     conditions, like_conditions = {}, {}
 
     if search_params.title_like:
@@ -122,7 +157,7 @@ async def view_school_info(
         limit=limit,
     )
 
-    logger.info(f"学校情報一覧取得成功: {len(school_infos)}件")
+    logger.info("学校情報一覧取得成功: %d件", len(school_infos))
     return [
         SchoolInfoDTO(
             id=info.id,
@@ -163,7 +198,7 @@ async def view_school_info_title(
     Returns:
         List[SchoolInfoTitleDTO]: 学校情報のリスト。
     """
-    logger.info(f"学校情報一覧取得リクエスト: {search_params}")
+    logger.info("学校情報一覧取得リクエスト: %s", search_params)
     conditions, like_conditions = {}, {}
 
     if search_params.title_like:
@@ -184,7 +219,7 @@ async def view_school_info_title(
         limit=limit,
     )
 
-    logger.info(f"学校情報一覧取得成功: {len(school_infos)}件")
+    logger.info("学校情報一覧取得成功: %d件", len(school_infos))
     return [
         SchoolInfoTitleDTO(
             id=info.id,
@@ -193,6 +228,44 @@ async def view_school_info_title(
         for info in school_infos
     ]
 
+@router.get(
+    "/view/schoolinfo/search",
+    response_model=list[SchoolInfoSearchResultDTO],
+    tags=["schoolinfo_get"],
+)
+@role_required(Role.STUDENT)
+async def search_school_info(
+    current_user: Annotated[User, Depends(get_current_user)],
+    q: Annotated[str, Query(min_length=1, max_length=1000)],
+    k: Annotated[int, Query(ge=1, le=50)] = 5,
+) -> list[SchoolInfoSearchResultDTO]:
+    """
+    ベクターストアから検索語に意味の近い学校情報を取得するエンドポイント。
+    検索に対応したベクターストア (VECTOR_STORE_BACKEND=local) の場合のみ利用できる。
+
+    Args:
+        q (str): 検索語。
+        k (int): 最大取得件数。
+        current_user (User): 現在認証されているユーザー。
+
+    Returns:
+        list[SchoolInfoSearchResultDTO]: 類似度の高い順の学校情報と、最も近い本文の一部。
+    """
+    vector_store = await run_in_pool(AI_POOL, get_vector_store)
+    if not isinstance(vector_store, SearchableVectorStore):
+        raise HTTPException(status_code=501, detail="このベクターストアは検索に対応していません")
+
+    # 検索語の埋め込みの作成 (外部 API の呼び出し) を含むため、AI 用のスレッドプールで実行する
+    with span("vector_store"), track(vector_search_duration, vector_search_errors, VECTOR_STORE_BACKEND):
+        hits = await run_in_pool(AI_POOL, vector_store.search, q, k)
+
+    logger.info("学校情報の検索: %d件", len(hits))
+    return [
+        SchoolInfoSearchResultDTO(id=hit.source_id, title=hit.title, chunk=hit.text, score=hit.score)
+        for hit in hits
+    ]
+
+
 @router.get("/view/schoolinfo/{schoolinfo_id}", response_model=list[SchoolInfoDTO], tags=["user_get"])
 @role_required(Role.STUDENT)
 async def get_me(
@@ -222,7 +295,7 @@ async def get_me(
         ]
 
     except Exception as e:
-        logger.error(f"学校情報取得中にエラーが発生しました: {str(e)}")
+        logger.error("学校情報取得中にエラーが発生しました: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"学校情報の取得中にエラーが発生しました。{str(e)}",
@@ -249,23 +322,40 @@ async def update_school_info(
     Returns:
         SchoolInfoDTO: 更新された学校情報。
     """
-    logger.info(f"学校情報更新リクエスト: {school_info_id}")
+    logger.info("学校情報更新リクエスト: %s", school_info_id)
     updates_dict = updates.model_dump(exclude_unset=True)
 
     conditions = {"id": school_info_id}
-    # TODO: ベクターデータベースの情報を更新するか、削除してから再作成する
-    updated_record = await update_record(engine, SchoolInfo, conditions, updates_dict)
-
-    cosmos_manager = CosmosDBManager(create_container=True)
-
-    cosmos_manager.update_document(
-        text=updated_record.contents,
-        text_type='markdown',
-        title=updated_record.title,
-        source_id=updated_record.id,
-    )
-
-    logger.info(f"学校情報を更新しました。ID: {updated_record.id}")
+    async with unit_of_work(engine):
+        current = await select_table(engine, SchoolInfo, conditions)
+        if not current:
+            raise HTTPException(status_code=404, detail="レコードが見つかりません")
+        # 更新で同じオブジェクトが書き換わるため、変更前の値を先に取り出しておく
+        previous_chunks = set((current[0].chunk_hashes or "").split(","))
+        title_changed = "title" in updates_dict and updates_dict["title"] != current[0].title
+        contents_changed = False
+        if updates_dict.get("contents") is not None:
+            content_hash, chunk_hashes = document_hashes(updates_dict["contents"])
+            contents_changed = content_hash != current[0].content_hash
+            updates_dict.update(content_hash=content_hash, chunk_hashes=chunk_hashes)
+
+        updated_record = await update_record(engine, SchoolInfo, conditions, updates_dict)
+        # 公開日時・更新日時のみの変更はベクターストアに影響しないため同期しない
+        # タイトルのみの変更は、ChunkedVectorStore (local, memory) では埋め込みを作り直さずにメタデータのみ更新する
+        # (Cosmos DB ではドキュメント全体を置き換える)
+        if contents_changed or title_changed:
+            await enqueue_vector_sync(engine, updated_record.id, metadata_only=not contents_changed)
+
+    if contents_changed:
+        new_chunks = (updated_record.chunk_hashes or "").split(",")
+        logger.info(
+            "学校情報を更新しました。ID: %s, 変更されたチャンク: %d/%d",
+            updated_record.id,
+            sum(1 for chunk in new_chunks if chunk not in previous_chunks),
+            len(new_chunks),
+        )
+    else:
+        logger.info("学校情報を更新しました (内容の変更なし)。ID: %s", updated_record.id)
     return SchoolInfoDTO(
         id=updated_record.id,
         title=updated_record.title,
@@ -294,17 +384,12 @@ async def delete_school_info(
     Returns:
         dict[str, str]: 削除完了メッセージ。
     """
-    logger.info(f"学校情報削除リクエスト: {school_info_id}")
-
-    cosmos_manager = CosmosDBManager(create_container=True)
-
-    cosmos_manager.delete_document_by_source_id(
-        source_id=school_info_id,
-    )
+    logger.info("学校情報削除リクエスト: %s", school_info_id)
 
     conditions = {"id": school_info_id}
-    # TODO: ベクターデータベースから情報を削除する
-    await delete_record(engine, SchoolInfo, conditions)
+    async with unit_of_work(engine):
+        await delete_record(engine, SchoolInfo, conditions)
+        await enqueue_vector_sync(engine, school_info_id)
 
-    logger.info(f"学校情報を削除しました。ID: {school_info_id}")
+    logger.info("学校情報を削除しました。ID: %s", school_info_id)
     return {"message": "SchoolInfo deleted successfully"}
@@ -1,18 +1,22 @@
 from datetime import datetime
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy import Engine
 
+from api.app.chat.history_cache import get_history_cache
 from api.app.database.database import (
     add_db_record,
     delete_record,
     select_table,
+    select_table_keyset,
     update_record,
 )
 from api.app.database.engine import get_engine
+from api.app.database.pagination import NEXT_CURSOR_HEADER
 from api.app.dtos.session_dtos import (
     SessionDTO,
+    SessionNamingDTO,
     SessionOrderBy,
     SessionSearchDTO,
     SessionUpdateDTO,
@@ -21,6 +25,7 @@ from api.app.dtos.chatlog_dtos import (
     ChatLogDTO,
     ChatOrderBy,
 )
+from api.app.dtos.pagination_dtos import PaginationMode
 from api.app.models import Session, User, ChatLog
 from api.app.security.jwt_token import get_current_user
 from api.app.security.role import Role, role_required
@@ -39,7 +44,7 @@ async def create_session(
     """
     デフォルトのセッションを作成する GET メソッド。
     """
-    logger.info(f"セッション作成リクエストを受け付けました。ユーザーID: {current_user.id}")
+    logger.info("セッション作成リクエストを受け付けました。ユーザーID: %s", current_user.id)
 
     # デフォルト値を設定してセッションを作成
     session_data = Session(
@@ -54,10 +59,10 @@ async def create_session(
         await db.refresh(session_data)
 
     logger.info("新しいセッションを登録しました。")
-    logger.info(f"セッションID:{session_data.id}")
-    logger.info(f"セッション名:{session_data.session_name}")
-    logger.info(f"投稿日時:{session_data.pub_data}")
-    logger.info(f"ユーザーID:{session_data.user_id}")
+    logger.info("セッションID:%s", session_data.id)
+    logger.info("セッション名:%s", session_data.session_name)
+    logger.info("投稿日時:%s", session_data.pub_data)
+    logger.info("ユーザーID:%s", session_data.user_id)
 
     # DTO に変換して返却
     session_dto = SessionDTO(
@@ -65,6 +70,7 @@ async def create_session(
         session_name=session_data.session_name,
         pub_data=session_data.pub_data,
         user_id=session_data.user_id,
+        naming_status=session_data.naming_status,
     )
     return session_dto
 
@@ -75,11 +81,14 @@ async def view_session(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
     search_params: Annotated[SessionSearchDTO, Depends()],
+    response: Response,
     order_by: SessionOrderBy | None = None,
     limit: int | None = None,
     offset: int | None = 0,
+    pagination: PaginationMode = PaginationMode.offset,
+    cursor: str | None = None,
 ) -> list[SessionDTO]:
-    logger.info(f"セッション取得リクエストを受け付けました。検索条件: {search_params}")
+    logger.info("セッション取得リクエストを受け付けました。検索条件: %s", search_params)
     conditions = {}
     like_conditions = {}
 
@@ -94,17 +103,31 @@ async def view_session(
     else:
         conditions["user_id"] = current_user.id
 
-    sessions = await select_table(
-        engine,
-        Session,
-        conditions,
-        like_conditions=like_conditions,
-        offset=offset,
-        limit=limit,
-        order_by=order_by,
-    )
+    if pagination == PaginationMode.cursor or cursor:
+        # カーソルモード: 次ページのカーソルはレスポンスヘッダで返す
+        sessions, next_cursor = await select_table_keyset(
+            engine,
+            Session,
+            conditions,
+            like_conditions=like_conditions,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        sessions = await select_table(
+            engine,
+            Session,
+            conditions,
+            like_conditions=like_conditions,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+        )
 
-    logger.info(f"セッション取得完了: {len(sessions)}件")
+    logger.info("セッション取得完了: %s件", len(sessions))
 
     session_dto_list = [
         SessionDTO(
@@ -112,6 +135,7 @@ async def view_session(
             session_name=session.session_name,
             pub_data=session.pub_data,
             user_id=session.user_id,
+            naming_status=session.naming_status,
         )
         for session in sessions
     ]
@@ -127,28 +151,42 @@ async def view_chatlog_by_session(
     session_id: int,
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
     order_by: ChatOrderBy | None = None,
     limit: int | None = None,
     offset: int | None = 0,
+    pagination: PaginationMode = PaginationMode.offset,
+    cursor: str | None = None,
 ) -> list[ChatLogDTO]:
-    logger.info(
-        f"セッションID {session_id} のチャットログ取得リクエストを受け付けました。"
-    )
+    logger.info("セッションID %s のチャットログ取得リクエストを受け付けました。", session_id)
 
     # 検索条件を設定
     conditions_dict = {"session_id": session_id}
 
     # データベースからチャットログを取得
-    chatlog = await select_table(
-        engine,
-        ChatLog,
-        conditions_dict,
-        offset=offset,
-        limit=limit,
-        order_by=order_by,
-    )
+    if pagination == PaginationMode.cursor or cursor:
+        # カーソルモード: 次ページのカーソルはレスポンスヘッダで返す
+        chatlog, next_cursor = await select_table_keyset(
+            engine,
+            ChatLog,
+            conditions_dict,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        chatlog = await select_table(
+            engine,
+            ChatLog,
+            conditions_dict,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+        )
 
-    logger.info(f"チャットログ取得完了: {len(chatlog)}件")
+    logger.info("チャットログ取得完了: %s件", len(chatlog))
 
     # DTOリストを作成して返す
     chatlog_dto_list = [
@@ -165,6 +203,32 @@ async def view_chatlog_by_session(
     return chatlog_dto_list
 
 
+@router.get(
+    "/view/session/{session_id}/naming", response_model=SessionNamingDTO, tags=["session_get"]
+)
+@role_required(Role.STUDENT)
+async def view_session_naming(
+    session_id: int,
+    engine: Annotated[Engine, Depends(get_engine)],
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> SessionNamingDTO:
+    """
+    セッション名の自動生成の状態を取得するエンドポイント。
+    セッション名はチャットの応答後にバックグラウンドで生成されるため、
+    フロントエンドは naming_status が pending の間このエンドポイントをポーリングする。
+    """
+    sessions = await select_table(engine, Session, {"id": session_id, "user_id": current_user.id})
+    if not sessions:
+        raise HTTPException(status_code=404, detail="セッションが見つかりません")
+
+    session = sessions[0]
+    return SessionNamingDTO(
+        id=session.id,
+        session_name=session.session_name,
+        naming_status=session.naming_status,
+    )
+
+
 @router.put("/update/session/{session_id}", response_model=SessionDTO, tags=["session_put"])
 @role_required(Role.STUDENT)
 async def update_session(
@@ -173,18 +237,19 @@ async def update_session(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[Engine, Depends(get_current_user)],
 ) -> SessionDTO:
-    logger.info(f"セッション更新リクエストを受け付けました。セッションID: {session_id}")
+    logger.info("セッション更新リクエストを受け付けました。セッションID: %s", session_id)
     conditions = {"id": session_id}
     updates_dict = updates.model_dump(exclude_unset=True)  # 送信されていないフィールドは無視
     updated_record = await update_record(engine, Session, conditions, updates_dict)
 
-    logger.info(f"セッションを更新しました。セッションID: {updated_record.id}, 更新内容: {updates_dict}")
+    logger.info("セッションを更新しました。セッションID: %s, 更新内容: %s", updated_record.id, updates_dict)
 
     updated_session_dto = SessionDTO(
         id=updated_record.id,
         session_name=updated_record.session_name,
         pub_data=updated_record.pub_data,
         user_id=updated_record.user_id,
+        naming_status=updated_record.naming_status,
     )
 
     return updated_session_dto
@@ -197,10 +262,11 @@ async def delete_session(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> dict:
-    logger.info(f"セッション削除リクエストを受け付けました。セッションID: {session_id}")
+    logger.info("セッション削除リクエストを受け付けました。セッションID: %s", session_id)
     conditions = {"id": session_id}
 
     result = await delete_record(engine, Session, conditions)
-    logger.info(f"セッションを削除しました。セッションID: {session_id}")
+    await get_history_cache().invalidate(session_id)
+    logger.info("セッションを削除しました。セッションID: %s", session_id)
 
     return result
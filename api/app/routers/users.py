@@ -2,16 +2,20 @@ from datetime import datetime
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy import Engine
-from sqlmodel import Session, select
+from sqlalchemy import Engine, update
 
 from api.app.database.database import (
     add_db_record,
     delete_record,
+    execute_statement,
     select_table,
+    select_table_keyset,
     update_record,
 )
 from api.app.database.engine import get_engine
+from api.app.database.pagination import NEXT_CURSOR_HEADER
+from api.app.database.unit_of_work import unit_of_work
+from api.app.dtos.pagination_dtos import PaginationMode
 from api.app.dtos.user_dtos import (
     UserCreateDTO,
     UserDTO,
@@ -21,13 +25,18 @@ from api.app.dtos.user_dtos import (
 )
 from api.app.models import User
 from api.app.security.role import Role, role_required
-from api.app.security.jwt_token import get_current_user, get_password_hash
+from api.app.security.jwt_token import get_current_user, get_password_hash_async
+from api.app.security.principal import invalidate_principal
+from api.app.security.refresh_token import revoke_user_refresh_tokens
 from api.app.security.role import Role, role_required
 from api.logger import getLogger
 
 router = APIRouter()
 logger = getLogger("user_router")
 
+# 変更時に発行済みのトークンを無効にする項目
+REVOKING_FIELDS = {"authority", "email", "password", "major_id"}
+
 
 @router.post("/input/user", response_model=UserDTO, tags=["user_post"])
 @role_required(Role.ADMIN)
@@ -38,8 +47,6 @@ async def create_user(
 ) -> UserDTO:
     logger.info("ユーザー作成リクエストを受け付けました。")
 
-    session = Session(engine)
-
     if user.email is None:
         logger.error("ユーザーの email が None です。適切な値を設定してください。")
     elif user.password is None:
@@ -47,17 +54,12 @@ async def create_user(
 
 
     # 既存のメールアドレスのチェック
-    existing_user = session.exec(select(User).where(User.email == user.email)).first()
-
-    if existing_user:
-        session.close()
-        logger.error(f"既に登録済みのメールアドレス: {user.email}")
+    if await select_table(engine, User, {"email": user.email}, limit=1):
+        logger.info("既に登録済みのメールアドレス: %s", user.email)
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    session.close()
-
     # パスワードをハッシュ化
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
 
     # 新しいユーザーオブジェクトを作成
     user_data = User(
@@ -74,11 +76,11 @@ async def create_user(
 
     # ログに情報を出力
     logger.info("新しいユーザーが作成されました")
-    logger.info(f"ユーザーID:{user_data.id}")
-    logger.info(f"ユーザー名:{user_data.name}")
-    logger.info(f"E-mail:{user_data.email}")
-    logger.info(f"権限情報:{user_data.authority}")
-    logger.info(f"専攻情報:{user_data.major_id}")
+    logger.info("ユーザーID:%s", user_data.id)
+    logger.info("ユーザー名:%s", user_data.name)
+    logger.info("E-mail:%s", user_data.email)
+    logger.info("権限情報:%s", user_data.authority)
+    logger.info("専攻情報:%s", user_data.major_id)
 
     # UserDTO を作成して返す
     user_dto = UserDTO(
@@ -96,7 +98,7 @@ async def create_user(
 @role_required(Role.ADMIN)
 async def get_me(current_user: Annotated[User, Depends(get_current_user)]) -> UserDTO:
     try:
-        logger.info(f"現在のユーザー情報を取得: {current_user.email}")
+        logger.info("現在のユーザー情報を取得: %s", current_user.email)
 
         me_dto = UserDTO(
             id=current_user.id,
@@ -108,7 +110,7 @@ async def get_me(current_user: Annotated[User, Depends(get_current_user)]) -> Us
         return me_dto
 
     except Exception as e:
-        logger.error(f"ユーザー情報取得中にエラーが発生しました: {str(e)}")
+        logger.error("ユーザー情報取得中にエラーが発生しました: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"ユーザー情報の取得中にエラーが発生しました。{str(e)}",
@@ -121,12 +123,15 @@ async def view_user(
     search_params: Annotated[UserSearchDTO, Depends()],
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
     order_by: UserOrderBy | None = None,
     limit: int | None = None,
     offset: int | None = 0,
+    pagination: PaginationMode = PaginationMode.offset,
+    cursor: str | None = None,
 ) -> list[UserDTO]:
     try:
-        logger.info(f"ユーザー一覧の取得リクエストを受け付けました。検索条件: {search_params}")
+        logger.info("ユーザー一覧の取得リクエストを受け付けました。検索条件: %s", search_params)
         conditions = {}
         like_conditions = {}
 
@@ -146,17 +151,31 @@ async def view_user(
         if search_params.major_id:
             conditions["major_id"] = search_params.major_id
 
-        users = await select_table(
-            engine,
-            User,
-            conditions,
-            like_conditions=like_conditions,
-            offset=offset,
-            limit=limit,
-            order_by=order_by,
-        )
+        if pagination == PaginationMode.cursor or cursor:
+            # カーソルモード: 次ページのカーソルはレスポンスヘッダで返す
+            users, next_cursor = await select_table_keyset(
+                engine,
+                User,
+                conditions,
+                like_conditions=like_conditions,
+                limit=limit,
+                order_by=order_by,
+                cursor=cursor,
+            )
+            if next_cursor:
+                response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        else:
+            users = await select_table(
+                engine,
+                User,
+                conditions,
+                like_conditions=like_conditions,
+                offset=offset,
+                limit=limit,
+                order_by=order_by,
+            )
 
-        logger.info(f"ユーザー一覧取得完了: {len(users)}件")
+        logger.info("ユーザー一覧取得完了: %s件", len(users))
 
         user_dto_list = [
             UserDTO(
@@ -170,8 +189,10 @@ async def view_user(
         ]
 
         return user_dto_list
+    except HTTPException:
+        raise
     except Exception as e:
-            logger.error(f"ユーザー情報取得中にエラーが発生しました: {str(e)}")
+            logger.error("ユーザー情報取得中にエラーが発生しました: %s", str(e))
             raise HTTPException(
                 status_code=500,
                 detail=f"ユーザー情報の取得中にエラーが発生しました。{str(e)}",
@@ -186,30 +207,35 @@ async def update_user(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> UserDTO:
-    logger.info(f"ユーザー更新リクエストを受け付けました。ユーザーID: {user_id}")
+    logger.info("ユーザー更新リクエストを受け付けました。ユーザーID: %s", user_id)
     updates_dict = updates.model_dump(exclude_unset=True)
 
-    session = Session(engine)
-
     # 既存のメールアドレスのチェック
     if "email" in updates_dict:
-        existing_user = session.exec(select(User).where(User.email == updates_dict["email"])).first()
-
-        if existing_user:
-            session.close()
-            logger.info(f"既に登録済みのメールアドレス: {updates_dict['email']}")
+        if await select_table(engine, User, {"email": updates_dict["email"]}, limit=1):
+            logger.info("既に登録済みのメールアドレス: %s", updates_dict["email"])
             raise HTTPException(status_code=400, detail="Email already registered")
 
-    session.close()
-
     # パスワードのハッシュ化
     if "password" in updates_dict:
-        updates_dict["password"] = get_password_hash(updates_dict["password"])
+        updates_dict["password"] = await get_password_hash_async(updates_dict["password"])
 
-    # 更新内容を辞書形式でupdate_record関数に渡す
     conditions = {"id": user_id}
-    updated_record = await update_record(engine, User, conditions, updates_dict)
-    logger.info(f"ユーザー情報を更新しました。ユーザーID: {updated_record.id}")
+    async with unit_of_work(engine):
+        # 更新内容を辞書形式でupdate_record関数に渡す
+        updated_record = await update_record(engine, User, conditions, updates_dict)
+        # 認可に関わる項目を変更する場合は token_version を増やし、発行済みのトークンを無効にする
+        # (同時に更新されても番号が重複しないよう、読み出した値ではなく DB 上の値に加算する)
+        # リフレッシュトークンも失効させ、盗まれたトークンでアクセストークンを再発行できないようにする
+        if REVOKING_FIELDS & updates_dict.keys():
+            await execute_statement(
+                engine,
+                update(User).where(User.id == user_id).values(token_version=User.token_version + 1),
+            )
+            await revoke_user_refresh_tokens(engine, user_id)
+    # 権限やメールアドレスの変更が次のリクエストから反映されるよう、認証キャッシュを破棄する
+    invalidate_principal(user_id)
+    logger.info("ユーザー情報を更新しました。ユーザーID: %s", updated_record.id)
     updated_user_dto = UserDTO(
         id=updated_record.id,
         name=updated_record.name,
@@ -228,11 +254,14 @@ async def delete_user(
     engine: Annotated[Engine, Depends(get_engine)],
     current_user: Annotated[User, Depends(get_current_user)],
 ) -> dict[str, str]:
-    logger.info(f"ユーザー削除リクエストを受け付けました。削除対象: {user_id}, ログイン中のユーザー: {current_user.id}")
+    logger.info(
+        "ユーザー削除リクエストを受け付けました。削除対象: %s, ログイン中のユーザー: %s", user_id, current_user.id
+    )
 
     conditions = {"id": user_id}
     await delete_record(engine, User, conditions)
-    logger.info(f"ユーザーを削除しました。ユーザーID: {user_id}")
+    invalidate_principal(user_id)
+    logger.info("ユーザーを削除しました。ユーザーID: %s", user_id)
 
     # 自分自身のアカウントを削除した場合はログアウト処理を行う
     if current_user.id == user_id:
@@ -0,0 +1,264 @@
+import io
+import json
+import os
+import re
+import zipfile
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import Any
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import Engine
+
+from api.app.chat.streaming import format_ndjson
+from api.app.database.database import add_db_records
+from api.app.database.unit_of_work import unit_of_work
+from api.app.dtos.school_info_dtos import SchoolInfoCreateDTO
+from api.app.models import SchoolInfo
+from api.app.vector_store.chunking import document_hashes
+from api.app.vector_store.outbox import outbox_record, process_outbox_rows
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# 学校情報の一括登録の設定
+# SCHOOLINFO_IMPORT_MAX_BYTES: リクエスト本文 (zip の場合は展開後の合計) の上限
+# SCHOOLINFO_IMPORT_MAX_ITEMS: 1 回で登録できる件数の上限
+# SCHOOLINFO_IMPORT_BATCH_SIZE / SCHOOLINFO_IMPORT_BATCH_CHARS:
+#   1 回の INSERT とベクターストアへの同期にまとめる件数と本文の文字数の上限
+# SCHOOLINFO_IMPORT_SYNC_GRACE:
+#   一括登録の処理中に dispatcher が同じレコードを同期しないよう、outbox の処理を後回しにする秒数
+#   (クライアントの切断などで同期が終わらなかった分は、この秒数の後に dispatcher が同期する)
+IMPORT_MAX_BYTES = int(os.getenv("SCHOOLINFO_IMPORT_MAX_BYTES") or 10 * 1024 * 1024)
+IMPORT_MAX_ITEMS = int(os.getenv("SCHOOLINFO_IMPORT_MAX_ITEMS") or 1000)
+IMPORT_BATCH_SIZE = int(os.getenv("SCHOOLINFO_IMPORT_BATCH_SIZE") or 50)
+IMPORT_BATCH_CHARS = int(os.getenv("SCHOOLINFO_IMPORT_BATCH_CHARS") or 200_000)
+IMPORT_SYNC_GRACE = float(os.getenv("SCHOOLINFO_IMPORT_SYNC_GRACE") or 300)
+
+JSON_TYPES = ("application/json",)
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+
+_MARKDOWN_TITLE = re.compile(r"^#\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+@dataclass(slots=True)
+class ImportItem:
+    """
+    一括登録の 1 件。
+
+    Attributes:
+        index (int): リクエスト内の位置 (0 始まり)。結果の対応付けに使う。
+        data (SchoolInfoCreateDTO | None): 検証済みのデータ。不正な場合は None。
+        error (str | None): 不正な場合の理由。
+        source (str | None): zip の場合のファイル名。
+    """
+
+    index: int
+    data: SchoolInfoCreateDTO | None = None
+    error: str | None = None
+    source: str | None = None
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"一括登録のデータが大きすぎます (上限 {IMPORT_MAX_BYTES} バイト)",
+    )
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors())
+
+
+def _validate(index: int, value: Any, source: str | None = None) -> ImportItem:
+    try:
+        return ImportItem(index, data=SchoolInfoCreateDTO.model_validate(value), source=source)
+    except ValidationError as e:
+        return ImportItem(index, error=_validation_message(e), source=source)
+
+
+def _parse_json(body: bytes) -> list[ImportItem]:
+    try:
+        values = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"JSON を解析できません: {e}") from e
+    if not isinstance(values, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="JSON の配列を送信してください")
+    return [_validate(index, value) for index, value in enumerate(values)]
+
+
+def _parse_ndjson(body: bytes) -> list[ImportItem]:
+    items: list[ImportItem] = []
+    for line in body.decode("utf-8-sig").splitlines():
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            items.append(ImportItem(len(items), error=f"JSON を解析できません: {e}"))
+            continue
+        items.append(_validate(len(items), value))
+    return items
+
+
+def _markdown_item(index: int, name: str, text: str) -> ImportItem:
+    # 最初の見出しをタイトルとし、見出しがなければファイル名を使う
+    match = _MARKDOWN_TITLE.search(text)
+    title = match.group(1) if match else PurePosixPath(name).stem
+    return _validate(index, {"title": title, "contents": text}, source=name)
+
+
+def _parse_markdown_zip(body: bytes) -> list[ImportItem]:
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(body))
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="zip ファイルを読み込めません") from e
+
+    with archive:
+        entries = sorted(
+            (
+                info
+                for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(MARKDOWN_SUFFIXES)
+            ),
+            key=lambda info: info.filename,
+        )
+        # 展開後のサイズで判定する (圧縮率の極端に高いファイルで展開時にメモリを使い切らないように)
+        if sum(info.file_size for info in entries) > IMPORT_MAX_BYTES:
+            raise _too_large()
+        items: list[ImportItem] = []
+        for info in entries:
+            index = len(items)
+            try:
+                text = archive.read(info).decode("utf-8-sig")
+            except UnicodeDecodeError:
+                items.append(ImportItem(index, error="UTF-8 のテキストではありません", source=info.filename))
+                continue
+            items.append(_markdown_item(index, info.filename, text))
+    return items
+
+
+def parse_import(body: bytes, content_type: str) -> list[ImportItem]:
+    """
+    Content-Type に応じて一括登録のリクエスト本文を解析し、1 件ずつ検証する。
+    JSON の配列、NDJSON (1 行 1 件)、Markdown ファイルの zip に対応する。
+
+    Raises:
+        HTTPException: 本文を解析できない (400)、大きすぎる (413)、対応していない形式 (415) の場合。
+    """
+    if len(body) > IMPORT_MAX_BYTES:
+        raise _too_large()
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in JSON_TYPES:
+        items = _parse_json(body)
+    elif media_type in NDJSON_TYPES:
+        items = _parse_ndjson(body)
+    elif media_type in ZIP_TYPES:
+        items = _parse_markdown_zip(body)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="application/json, application/x-ndjson, application/zip のいずれかで送信してください",
+        )
+    if len(items) > IMPORT_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"一度に登録できるのは {IMPORT_MAX_ITEMS} 件までです",
+        )
+    return items
+
+
+def import_batches(
+    items: list[ImportItem], max_items: int = IMPORT_BATCH_SIZE, max_chars: int = IMPORT_BATCH_CHARS
+) -> Iterator[list[ImportItem]]:
+    """件数と本文の文字数の合計がそれぞれの上限を超えないよう、検証済みの項目をまとめる。"""
+    batch: list[ImportItem] = []
+    chars = 0
+    for item in items:
+        assert item.data is not None
+        size = len(item.data.contents)
+        if batch and (len(batch) >= max_items or chars + size > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(item)
+        chars += size
+    if batch:
+        yield batch
+
+
+def _result(item: ImportItem, result_status: str, **fields: Any) -> str:
+    data = {"index": item.index, "status": result_status, **fields}
+    if item.source is not None:
+        data["source"] = item.source
+    return format_ndjson("item", data)
+
+
+async def import_school_infos(engine: Engine, items: list[ImportItem], user_id: str) -> AsyncIterator[str]:
+    """
+    検証済みの項目をバッチごとに登録し、1 件ごとの結果を NDJSON で返す。
+
+    バッチごとに学校情報と outbox のレコードを 1 つのトランザクションで追加し (それぞれ複数行の INSERT 1 文)、
+    コミット後にそのバッチのベクターストアへの同期を並列に行う。
+    結果の status は invalid (検証エラー), error (登録の失敗), indexed (同期済み),
+    queued (登録済みで同期は再試行待ち) のいずれか。
+    """
+    counts = {"invalid": 0, "error": 0, "indexed": 0, "queued": 0}
+    valid: list[ImportItem] = []
+    for item in items:
+        if item.data is None:
+            counts["invalid"] += 1
+            yield _result(item, "invalid", error=item.error)
+        else:
+            valid.append(item)
+
+    try:
+        for batch in import_batches(valid):
+            records: list[SchoolInfo] = []
+            for item in batch:
+                assert item.data is not None
+                content_hash, chunk_hashes = document_hashes(item.data.contents)
+                records.append(
+                    SchoolInfo(
+                        title=item.data.title,
+                        contents=item.data.contents,
+                        pub_date=item.data.pub_date or datetime.now(),
+                        updated_at=item.data.updated_at or datetime.now(),
+                        created_by=user_id,
+                        content_hash=content_hash,
+                        chunk_hashes=chunk_hashes,
+                    )
+                )
+
+            try:
+                async with unit_of_work(engine):
+                    await add_db_records(engine, records)
+                    outbox_rows = [outbox_record(record.id, delay=IMPORT_SYNC_GRACE) for record in records]
+                    await add_db_records(engine, outbox_rows)
+            except Exception as e:
+                logger.error("学校情報の一括登録に失敗しました: %s", e)
+                for item in batch:
+                    counts["error"] += 1
+                    yield _result(item, "error", error="登録に失敗しました")
+                continue
+
+            items_by_id = {record.id: (item, record) for item, record in zip(batch, records, strict=True)}
+            async for source_id, error in process_outbox_rows(engine, outbox_rows):
+                item, record = items_by_id[source_id]
+                if error is None:
+                    counts["indexed"] += 1
+                    yield _result(item, "indexed", id=record.id, title=record.title)
+                else:
+                    counts["queued"] += 1
+                    yield _result(item, "queued", id=record.id, title=record.title, error=str(error))
+    except Exception as e:
+        # ヘッダ送信後はステータスコードを変更できないため、error イベントで通知する
+        logger.error("学校情報の一括登録中にエラーが発生しました: %s", e, exc_info=True)
+        yield format_ndjson("error", {"detail": "一括登録中にエラーが発生しました"})
+
+    logger.info("学校情報を一括登録しました: %s", counts)
+    yield format_ndjson("done", {"total": len(items), **counts})
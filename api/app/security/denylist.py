@@ -0,0 +1,173 @@
+import hashlib
+import heapq
+import math
+import os
+import threading
+import time
+from typing import Any
+
+from fastapi import HTTPException, status
+
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# 失効させたアクセストークン (jti) の保持件数の上限と、Bloom フィルタの誤検出率
+# 上限に達した場合は期限切れのものだけを取り除き、有効な jti は捨てない (取り除けない場合は追加を拒否する)
+TOKEN_DENYLIST_SIZE = int(os.getenv("TOKEN_DENYLIST_SIZE") or 100_000)
+TOKEN_DENYLIST_FP_RATE = float(os.getenv("TOKEN_DENYLIST_FP_RATE") or 0.001)
+# 期限切れの jti を取り除き、Bloom フィルタを作り直す間隔 (秒)
+TOKEN_DENYLIST_PURGE_INTERVAL = float(os.getenv("TOKEN_DENYLIST_PURGE_INTERVAL") or 300)
+
+
+class BloomFilter:
+    """
+    固定サイズのビット配列による Bloom フィルタ。
+    「含まれない」の判定は確実で、「含まれる」の判定は誤検出率 fp_rate で誤る。
+    """
+
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        # 最適なビット数 m = -n ln p / (ln 2)^2 、ハッシュ関数の数 k = m / n ln 2
+        self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> list[int]:
+        # 1 回のハッシュ計算から k 個の位置を作る (ダブルハッシング)
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def clear(self) -> None:
+        self._bits = bytearray(len(self._bits))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+class DenylistFullError(HTTPException):
+    """失効リストが有効な jti で埋まっており、新しい jti を追加できない場合に送出される例外。"""
+
+    def __init__(self, retry_after: int = 60) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="トークンを失効させられませんでした。しばらくしてから再試行してください。",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class TokenDenylist:
+    """
+    ログアウトなどで失効させたアクセストークンの jti を、トークンの有効期限まで保持する。
+
+    判定は Bloom フィルタで行い、「含まれる可能性がある」場合のみ jti と有効期限の辞書で確認する。
+    大半のリクエスト (失効していないトークン) はビット配列の参照だけで判定が終わる。
+    Bloom フィルタは要素を削除できないため、期限切れの jti を取り除く際に作り直す。
+    プロセス内で保持するため、他のインスタンスには反映されない (ユーザー単位の失効は token_version で行う)。
+    上限に達した場合は有効期限順のヒープから期限切れの jti だけを取り除く。
+    有効な jti を捨てると失効させたトークンが再び使えてしまうため、取り除けない場合は DenylistFullError を送出する。
+    """
+
+    def __init__(
+        self,
+        capacity: int = TOKEN_DENYLIST_SIZE,
+        fp_rate: float = TOKEN_DENYLIST_FP_RATE,
+        purge_interval: float = TOKEN_DENYLIST_PURGE_INTERVAL,
+    ) -> None:
+        self.capacity = capacity
+        self.purge_interval = purge_interval
+        self._bloom = BloomFilter(capacity, fp_rate)
+        # jti -> 有効期限 (UNIX 時刻)
+        self._expires: dict[str, float] = {}
+        # (有効期限, jti) のヒープ。同じ jti を追加し直した場合の古い要素は取り出す際に読み飛ばす
+        self._heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._next_purge = time.time() + purge_interval
+        self.revoked = 0
+        self.rejected = 0
+        self.false_positives = 0
+        self.evictions = 0
+        self.overflows = 0
+
+    def add(self, jti: str, expires_at: float) -> None:
+        """
+        jti を expires_at (UNIX 時刻) まで失効させる。
+
+        Raises:
+            DenylistFullError: 期限切れの jti を取り除いても上限に達している場合 (503 Service Unavailable)。
+        """
+        now = time.time()
+        if expires_at <= now:
+            return
+        with self._lock:
+            if now >= self._next_purge:
+                self._purge(now)
+            if jti not in self._expires and len(self._expires) >= self.capacity:
+                self._evict_expired(now)
+                if len(self._expires) >= self.capacity:
+                    self.overflows += 1
+                    logger.error("Token denylist is full of live entries: capacity=%d", self.capacity)
+                    raise DenylistFullError(retry_after=max(1, math.ceil(self._heap[0][0] - now)))
+            if expires_at > self._expires.get(jti, 0.0):
+                self._expires[jti] = expires_at
+                heapq.heappush(self._heap, (expires_at, jti))
+            self._bloom.add(jti)
+            self.revoked += 1
+
+    def _evict_expired(self, now: float) -> None:
+        # 有効期限の早い順に、期限切れのものだけを取り除く (Bloom フィルタには次の作り直しまで残る)
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, jti = heapq.heappop(self._heap)
+            if self._expires.get(jti) == expires_at:
+                del self._expires[jti]
+                self.evictions += 1
+
+    def __contains__(self, jti: str) -> bool:
+        if jti not in self._bloom:
+            return False
+        with self._lock:
+            expires_at = self._expires.get(jti)
+            if expires_at is None or expires_at <= time.time():
+                self.false_positives += 1
+                return False
+            self.rejected += 1
+            return True
+
+    def _purge(self, now: float) -> None:
+        self._expires = {jti: expires_at for jti, expires_at in self._expires.items() if expires_at > now}
+        self._heap = [(expires_at, jti) for jti, expires_at in self._expires.items()]
+        heapq.heapify(self._heap)
+        self._bloom.clear()
+        for jti in self._expires:
+            self._bloom.add(jti)
+        self._next_purge = now + self.purge_interval
+
+    def purge(self) -> None:
+        with self._lock:
+            self._purge(time.time())
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._expires),
+                "capacity": self.capacity,
+                "bloom_bytes": self._bloom.nbytes,
+                "bloom_hashes": self._bloom.hashes,
+                "revoked": self.revoked,
+                "rejected": self.rejected,
+                "false_positives": self.false_positives,
+                "evictions": self.evictions,
+                "overflows": self.overflows,
+            }
+
+
+token_denylist = TokenDenylist()
@@ -1,4 +1,5 @@
 import os
+import uuid
 from datetime import datetime, timedelta
 from typing import Annotated
 
@@ -9,8 +10,22 @@ from passlib.context import CryptContext
 from sqlalchemy import Engine
 from sqlmodel import Session, select
 
+from api.app.database.database import fetch_all
 from api.app.database.engine import get_engine
+from api.app.middleware.timing import timed
 from api.app.models import User
+from api.app.security.denylist import token_denylist
+from api.app.security.password import password_hasher
+from api.app.security.principal import (
+    AUTH_STATELESS,
+    MISSING_USER_VERSION,
+    UserPrincipal,
+    cache_principal,
+    get_cached_principal,
+    has_stateless_claims,
+    matches_token,
+    token_version_cache,
+)
 from api.logger import getLogger
 
 logger = getLogger(__name__)
@@ -33,6 +48,8 @@ else:
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# ログアウトなど、トークンがなくても処理を続けるエンドポイント用
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
@@ -46,22 +63,24 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     else:
         expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
+    # jti はログアウト時にトークン単位で失効させるための識別子
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
 
     try:
         # トークンをエンコード
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-        logger.debug(f"アクセストークンの生成に成功しました: {encoded_jwt}")
+        logger.debug("アクセストークンの生成に成功しました: user_id=%s", data.get("user_id"))
         # XXX: jwt.encodeはstrを返すはずなのにAnyを返すって怒られるからstrでキャストする
         return str(encoded_jwt)
     except JWTError as e:
-        logger.error(f"トークンの生成中にエラーが発生しました: {str(e)}")
+        logger.error("トークンの生成中にエラーが発生しました: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="トークンの生成に失敗しました。再試行してください。",
         ) from e
     except Exception as e:
-        logger.error(f"予期しないエラーが発生しました: {str(e)}")
+        logger.error("予期しないエラーが発生しました: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="予期しないエラーが発生しました。",
@@ -76,6 +95,16 @@ def get_password_hash(password: str | bytes) -> str:
     return str(pwd_context.hash(password))
 
 
+# bcrypt は CPU を長時間占有するため、非同期ハンドラからはパスワードハッシュ化サービス
+# (プロセスプール、起動時に調整したコスト) 経由で呼び出す
+async def verify_password_async(plain_password: str | bytes, hashed_password: str | bytes) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str | bytes) -> str:
+    return await password_hasher.hash(password)
+
+
 async def get_user_by_email(db: Session, email: str) -> User | None:
     statement = select(User).where(User.email == email)
     results = db.exec(statement)
@@ -84,16 +113,65 @@ async def get_user_by_email(db: Session, email: str) -> User | None:
 
 async def authenticate_user(db: Session, email: str, password: str) -> User | None:
     user = await get_user_by_email(db, email)
-    if user and verify_password(password, user.password):
+    if user and await verify_password_async(password, user.password):
         return user
     return None
 
 
-def get_current_user(
+async def get_token_version(engine: Engine, user_id: str) -> int:
+    """
+    ユーザーの現在の token_version を返す。ユーザーが存在しない場合は MISSING_USER_VERSION。
+    ユーザーごとにキャッシュし、キャッシュにあればデータベースを参照しない。
+    """
+    version = token_version_cache.get(user_id)
+    if version is None:
+        versions = await fetch_all(engine, select(User.token_version).where(User.id == user_id))
+        version = versions[0] if versions else MISSING_USER_VERSION
+        token_version_cache.set(user_id, version)
+    return version
+
+
+def revoke_access_token(token: str) -> bool:
+    """
+    アクセストークンを有効期限まで失効させる (ログアウト時)。
+    署名が不正なトークンや期限切れのトークン、jti を持たない古いトークンは何もしない。
+
+    Returns:
+        bool: 失効させた場合は True。
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    jti = payload.get("jti")
+    if jti is None or "exp" not in payload:
+        return False
+    token_denylist.add(jti, float(payload["exp"]))
+    return True
+
+
+def refresh_family_of(token: str) -> str | None:
+    """
+    アクセストークンの fid (同時に発行したリフレッシュトークンの family_id) を返す。
+    ログアウト時に系列ごと失効させるために使うため、有効期限が切れたトークンも受け付ける (署名は検証する)。
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+    except JWTError:
+        return None
+    family_id = payload.get("fid")
+    return family_id if isinstance(family_id, str) else None
+
+
+@timed("auth")
+async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)], engine: Annotated[Engine, Depends(get_engine)]
-) -> User:
-    # トークンを受け取ったログ
-    logger.debug(f"受け取ったトークン: {token}")
+) -> UserPrincipal:
+    """
+    トークンから認証済みユーザーを取得する依存関数。
+    ユーザーは UserPrincipal としてキャッシュし、キャッシュにあればデータベースを参照しない。
+    AUTH_STATELESS が有効な場合は、トークンのクレーム (role, major_id, name, tv) から作成する。
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="資格情報を検証できませんでした",
@@ -104,25 +182,55 @@ def get_current_user(
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         user_id: str = payload.get("user_id")
-        logger.debug(f"デコードされたトークン: email={email}, user_id={user_id}")
+        logger.debug("デコードされたトークン: email=%s, user_id=%s", email, user_id)
         if email is None or user_id is None:
             logger.error("メールアドレスまたはユーザーIDが存在しません")
             raise credentials_exception
     except JWTError as e:
         # トークンのデコードエラー
-        logger.error(f"JWTデコードエラー: {str(e)}")
+        logger.error("JWTデコードエラー: %s", str(e))
         raise credentials_exception from e
 
+    jti = payload.get("jti")
+    if jti is not None and jti in token_denylist:
+        logger.info("ログアウト済みのトークンです。ユーザーID: %s", user_id)
+        raise credentials_exception
+
+    if AUTH_STATELESS and has_stateless_claims(payload):
+        # クレームだけで認可し、失効していないかは token_version で確認する
+        try:
+            principal = UserPrincipal.from_claims(payload)
+        except (KeyError, ValueError) as e:
+            logger.error("不正なクレーム: %s", str(e))
+            raise credentials_exception from e
+        if payload["tv"] != await get_token_version(engine, user_id):
+            logger.info("失効したトークンです。ユーザーID: %s", user_id)
+            raise credentials_exception
+        return principal
+
+    principal = get_cached_principal(user_id, payload)
+    if principal is not None:
+        return principal
+
     try:
         # データベースからユーザー情報を取得
-        with Session(engine) as db:
-            user = db.exec(select(User).where(User.id == user_id, User.email == email)).first()
-            logger.debug(f"取得したユーザー情報: {user}")
-            if user is None:
-                logger.error("ユーザーが見つかりません")
-                raise credentials_exception
-            return user
+        users = await fetch_all(engine, select(User).where(User.id == user_id, User.email == email))
+    except HTTPException:
+        # ワーカープールの飽和 (503) などはそのまま返す
+        raise
     except Exception as e:
         # データベース操作エラー
-        logger.error(f"ユーザー取得エラー: {str(e)}")
+        logger.error("ユーザー取得エラー: %s", str(e))
         raise credentials_exception from e
+
+    logger.debug("取得したユーザー情報: %d件", len(users))
+    if not users:
+        logger.error("ユーザーが見つかりません")
+        raise credentials_exception
+
+    principal = UserPrincipal.from_user(users[0])
+    cache_principal(principal)
+    if not matches_token(principal, payload):
+        logger.info("失効したトークンです。ユーザーID: %s", user_id)
+        raise credentials_exception
+    return principal
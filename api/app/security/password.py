@@ -0,0 +1,226 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from fastapi import status
+from passlib.hash import bcrypt
+
+from api.app.executor import AUTH_POOL, PoolSaturatedError, executors
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# パスワードハッシュ化の設定
+# PASSWORD_HASH_EXECUTOR: process (プロセスプール) または thread (認証用のワーカープール)
+# PASSWORD_HASH_ROUNDS: bcrypt のコストを固定する場合に指定 (未指定の場合は起動時に計測して決める)
+# PASSWORD_HASH_TARGET_MS: 1 回のハッシュ化にかける目標時間 (ミリ秒)
+# PASSWORD_HASH_MP_CONTEXT: プロセスの起動方法。既定は forkserver (使えない場合は spawn)
+#   fork はスレッド (ワーカープールやクライアントのロック) を持つプロセスを複製するため、明示した場合のみ使う
+#   forkserver と spawn はワーカーの起動時に __main__ を読み込み直すため、
+#   起動スクリプトは if __name__ == "__main__" で保護する
+HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR") or "process"
+HASH_MP_CONTEXT = os.getenv("PASSWORD_HASH_MP_CONTEXT") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or 2)
+HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE") or 16)
+HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS") or 0)
+HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS") or 250)
+
+# 計測結果に関わらず使用するコストの範囲
+# 下限は passlib の既定値 (12) とし、計測ではコストを上げることのみ行う (既存のハッシュより弱くしない)
+DEFAULT_ROUNDS = 12
+MAX_ROUNDS = 16
+# 計測に使うコスト (起動時間を抑えるため低いコストで計測し、上のコストは外挿する)
+CALIBRATION_ROUNDS = 10
+
+_BCRYPT_ROUNDS = re.compile(r"^\$2[abxy]?\$(\d+)\$")
+
+
+# プロセスプールで実行するため、モジュールレベルの関数として定義する
+
+
+def _hash(password: str | bytes, rounds: int) -> str:
+    return str(bcrypt.using(rounds=rounds).hash(password))
+
+
+def _verify(password: str | bytes, hashed_password: str | bytes) -> bool:
+    return bool(bcrypt.verify(password, hashed_password))
+
+
+def _measure(rounds: int) -> float:
+    start = time.perf_counter()
+    _hash("calibration-password", rounds)
+    return time.perf_counter() - start
+
+
+def hash_rounds(hashed_password: str) -> int | None:
+    """bcrypt のハッシュ ($2b$12$...) からコストを取り出す。"""
+    match = _BCRYPT_ROUNDS.match(hashed_password)
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """
+    パスワードのハッシュ化・検証をイベントループの外で行うサービス。
+
+    既定ではプロセスプールで実行するため、GIL の影響を受けずに複数の CPU を使える。
+    bcrypt のコストは起動時に PASSWORD_HASH_TARGET_MS に収まる最大値に調整し、
+    それより低いコストのハッシュはログイン時に needs_rehash で検出して付け直す。
+    """
+
+    def __init__(
+        self,
+        executor_type: str = HASH_EXECUTOR,
+        workers: int = HASH_WORKERS,
+        max_queue: int = HASH_QUEUE,
+        rounds: int = HASH_ROUNDS,
+        target_ms: float = HASH_TARGET_MS,
+    ) -> None:
+        self.executor_type = executor_type
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds or DEFAULT_ROUNDS
+        self._fixed_rounds = bool(rounds)
+        self.target_ms = target_ms
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._started_at = time.monotonic()
+        self._counts = {"hash": 0, "verify": 0, "rehash": 0, "rejected": 0}
+        self._seconds = {"hash": 0.0, "verify": 0.0}
+        self.calibration: dict[str, float] = {}
+
+    def _get_executor(self) -> Executor | None:
+        # プロセスプールを使わない場合は認証用のワーカープール (スレッド) で実行する
+        if self.executor_type != "process":
+            return None
+        with self._lock:
+            if self._executor is None:
+                try:
+                    context = multiprocessing.get_context(HASH_MP_CONTEXT)
+                    if HASH_MP_CONTEXT == "forkserver":
+                        # ワーカーの起動ごとに bcrypt を読み込まないよう、サーバープロセスで先に読み込む
+                        context.set_forkserver_preload([__name__])
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                except (OSError, ValueError, NotImplementedError) as e:
+                    self._fall_back_to_threads(e)
+                    return None
+            return self._executor
+
+    def _fall_back_to_threads(self, error: BaseException) -> None:
+        # サンドボックス環境などでプロセスを起動できない場合は、認証用のワーカープールで実行する
+        logger.warning("Process pool is unavailable (%s); falling back to threads.", error)
+        self.executor_type = "thread"
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, kind: str, func: Any, *args: Any) -> Any:
+        executor = self._get_executor()
+        if executor is None:
+            start = time.perf_counter()
+            result = await executors.get(AUTH_POOL).run(func, *args)
+        else:
+            with self._lock:
+                if self._pending >= self.workers + self.max_queue:
+                    self._counts["rejected"] += 1
+                    raise PoolSaturatedError("password", status.HTTP_429_TOO_MANY_REQUESTS)
+                self._pending += 1
+            try:
+                start = time.perf_counter()
+                result = await asyncio.wrap_future(executor.submit(func, *args))
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                with self._lock:
+                    self._fall_back_to_threads(e)
+                return await self._run(kind, func, *args)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+        if kind in self._seconds:
+            with self._lock:
+                self._counts[kind] += 1
+                self._seconds[kind] += time.perf_counter() - start
+        return result
+
+    async def start(self) -> None:
+        """プールを起動し、bcrypt のコストを調整する。アプリケーションの lifespan で呼び出す。"""
+        if self._fixed_rounds:
+            logger.info("Password hash rounds fixed at %d", self.rounds)
+            return
+        await self.calibrate()
+
+    async def calibrate(self) -> int:
+        """
+        目標時間に収まる最大のコストを計測して設定する (DEFAULT_ROUNDS を下回ることはない)。
+        bcrypt はコストを 1 増やすと時間が 2 倍になるため、CALIBRATION_ROUNDS の計測値から外挿して確認する。
+        """
+        try:
+            elapsed = await self._run("calibrate", _measure, CALIBRATION_ROUNDS)
+        except Exception as e:
+            logger.warning("Password hash calibration failed (%s); using %d rounds.", e, self.rounds)
+            return self.rounds
+
+        target = self.target_ms / 1000
+        rounds = DEFAULT_ROUNDS
+        while rounds < MAX_ROUNDS and elapsed * 2 ** (rounds + 1 - CALIBRATION_ROUNDS) <= target:
+            rounds += 1
+        self.rounds = rounds
+        self.calibration = {
+            "calibration_rounds_ms": elapsed * 1000,
+            "estimated_ms": elapsed * 2 ** (rounds - CALIBRATION_ROUNDS) * 1000,
+        }
+        logger.info("Password hash rounds calibrated to %d (target %.0f ms)", rounds, self.target_ms)
+        return rounds
+
+    async def hash(self, password: str | bytes) -> str:
+        return await self._run("hash", _hash, password, self.rounds)
+
+    async def verify(self, password: str | bytes, hashed_password: str | bytes) -> bool:
+        return await self._run("verify", _verify, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """現在のコストより低いコストで作られたハッシュかどうか。"""
+        rounds = hash_rounds(hashed_password)
+        return rounds is not None and rounds < self.rounds
+
+    def record_rehash(self) -> None:
+        with self._lock:
+            self._counts["rehash"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            uptime = time.monotonic() - self._started_at
+            stats: dict[str, Any] = {
+                "executor": self.executor_type,
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "target_ms": self.target_ms,
+                "calibration": dict(self.calibration),
+                "pending": self._pending,
+                "rehashed": self._counts["rehash"],
+                "rejected": self._counts["rejected"],
+            }
+            for kind in ("hash", "verify"):
+                count = self._counts[kind]
+                stats[kind] = {
+                    "count": count,
+                    "avg_ms": (self._seconds[kind] / count * 1000) if count else 0.0,
+                    "per_second": count / uptime if uptime else 0.0,
+                }
+            return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,104 @@
+import os
+from dataclasses import dataclass
+
+from api.app.cache import TTLCache
+from api.app.models import User
+from api.app.security.role import Role
+
+# 認証済みユーザーのキャッシュ設定
+# 他のインスタンスでの更新はキャッシュの有効期限 (秒) が切れるまで反映されないため、短めに設定する
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE") or 1024)
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL") or 60)
+
+# トークンのクレームだけで認可を行うモード (AUTH_STATELESS)
+# 失効の確認に使う token_version はユーザーごとに TOKEN_VERSION_CACHE_TTL 秒キャッシュする
+AUTH_STATELESS = (os.getenv("AUTH_STATELESS") or "").lower() in ("1", "true", "yes", "on")
+TOKEN_VERSION_CACHE_TTL = int(os.getenv("TOKEN_VERSION_CACHE_TTL") or 30)
+
+# ユーザーが存在しない場合に token_version_cache に保存する値
+MISSING_USER_VERSION = -1
+
+
+@dataclass(frozen=True, slots=True)
+class UserPrincipal:
+    """
+    認証済みユーザーの不変なスナップショット。
+    get_current_user が User の代わりに返し、リクエスト間でキャッシュされる。
+    パスワードハッシュやリレーションは保持しない。
+    """
+
+    id: str
+    name: str | None
+    email: str
+    authority: Role
+    major_id: int | None
+    token_version: int = 0
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            authority=Role(user.authority),
+            major_id=user.major_id,
+            token_version=user.token_version,
+        )
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> "UserPrincipal":
+        """build_token_claims で発行したトークンのクレームから作成する。"""
+        return cls(
+            id=payload["user_id"],
+            name=payload.get("name"),
+            email=payload["sub"],
+            authority=Role(payload["role"]),
+            major_id=payload.get("major_id"),
+            token_version=payload["tv"],
+        )
+
+
+def build_token_claims(user: User) -> dict:
+    """アクセストークンに含めるクレーム。AUTH_STATELESS が有効な場合はこれだけで認可を行う。"""
+    return {
+        "sub": user.email,
+        "user_id": user.id,
+        "role": Role(user.authority).value,
+        "major_id": user.major_id,
+        "name": user.name,
+        "tv": user.token_version,
+    }
+
+
+def has_stateless_claims(payload: dict) -> bool:
+    return all(key in payload for key in ("role", "tv"))
+
+
+principal_cache: TTLCache[str, UserPrincipal] = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+token_version_cache: TTLCache[str, int] = TTLCache(PRINCIPAL_CACHE_SIZE, TOKEN_VERSION_CACHE_TTL)
+
+
+def matches_token(principal: UserPrincipal, payload: dict) -> bool:
+    """ユーザーがトークンの内容と一致するか (メールアドレスが同じで、トークンが失効していないか)。"""
+    if principal.email != payload.get("sub"):
+        return False
+    # tv を含まない (token_version の導入前に発行された) トークンは失効の確認を行わない
+    return "tv" not in payload or payload["tv"] == principal.token_version
+
+
+def get_cached_principal(user_id: str, payload: dict) -> UserPrincipal | None:
+    """キャッシュからユーザーを取得する。トークンの内容と一致しない場合は使用しない。"""
+    principal = principal_cache.get(user_id)
+    if principal is None or not matches_token(principal, payload):
+        return None
+    return principal
+
+
+def cache_principal(principal: UserPrincipal) -> None:
+    principal_cache.set(principal.id, principal)
+
+
+def invalidate_principal(user_id: str) -> None:
+    """ユーザーの更新・削除時に呼び出し、キャッシュ済みのスナップショットと token_version を破棄する。"""
+    principal_cache.pop(user_id)
+    token_version_cache.pop(user_id)
@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import Engine, delete, update
+
+from api.app.database.database import add_db_record, execute_statement, select_table
+from api.app.database.unit_of_work import unit_of_work
+from api.app.models import RefreshToken, User
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# リフレッシュトークンの設定
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS") or 14)
+# 期限切れのトークンを削除する間隔 (秒)
+# 使用済みのトークンは再利用を検出するため、有効期限が切れるまで残す
+REFRESH_TOKEN_PURGE_INTERVAL = int(os.getenv("REFRESH_TOKEN_PURGE_INTERVAL") or 3600)
+
+REFRESH_TOKEN_COOKIE = "refresh_token"
+
+_SECRET = (os.getenv("SECRET_KEY") or "").encode()
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    リフレッシュトークンのハッシュを計算する。
+    トークン自体が十分なエントロピーを持つため、bcrypt ではなく HMAC-SHA256 で検証する。
+    """
+    return hmac.new(_SECRET, token.encode(), hashlib.sha256).hexdigest()
+
+
+def _invalid_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="リフレッシュトークンが無効です",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def new_family_id() -> str:
+    """ログイン時に新しいトークンの系列 (family) の ID を作成する。"""
+    return str(uuid.uuid4())
+
+
+async def issue_refresh_token(engine: Engine, user_id: str, family_id: str) -> str:
+    """
+    リフレッシュトークンを発行し、ハッシュを保存する。
+
+    Args:
+        family_id (str): ログイン時は new_family_id() で作成した ID、ローテーションの場合は元のトークンの family_id。
+            同時に発行するアクセストークンにも fid クレームとして含め、ログアウト時に系列ごと失効させる。
+
+    Returns:
+        str: クライアントに渡すリフレッシュトークン。
+    """
+    token = secrets.token_urlsafe(32)
+    now = datetime.now()
+    record = RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id,
+        user_id=user_id,
+        issued_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    await add_db_record(engine, record)
+    return token
+
+
+async def revoke_family(engine: Engine, family_id: str) -> int:
+    """同じ family_id のトークンをすべて失効させる。"""
+    return await execute_statement(
+        engine,
+        update(RefreshToken).where(RefreshToken.family_id == family_id).values(revoked=True),
+    )
+
+
+async def revoke_user_refresh_tokens(engine: Engine, user_id: str) -> int:
+    """
+    ユーザーの失効していないトークンをすべて失効させる。
+    パスワードや権限の変更 (token_version の更新) と同じトランザクションで呼び出し、
+    盗まれたリフレッシュトークンで新しいアクセストークンを発行できないようにする。
+    """
+    return await execute_statement(
+        engine,
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked.is_(False))
+        .values(revoked=True),
+    )
+
+
+async def rotate_refresh_token(engine: Engine, token: str) -> tuple[User, str, str]:
+    """
+    リフレッシュトークンを検証し、新しいトークンに置き換える。
+    使用済み・失効済みのトークンが使われた場合は、盗用とみなして同じ family のトークンをすべて失効させる。
+
+    Returns:
+        tuple[User, str, str]: トークンの持ち主、新しいリフレッシュトークンとその family_id。
+
+    Raises:
+        HTTPException: トークンが無効・期限切れ・再利用された場合 (401 Unauthorized)。
+    """
+    records = await select_table(engine, RefreshToken, {"token_hash": hash_refresh_token(token)})
+    if not records:
+        raise _invalid_token()
+    record = records[0]
+
+    if record.revoked or record.used_at is not None:
+        logger.warning(
+            "リフレッシュトークンの再利用を検出しました。ユーザーID: %s, family: %s", record.user_id, record.family_id
+        )
+        await revoke_family(engine, record.family_id)
+        raise _invalid_token()
+    if record.expires_at < datetime.now():
+        raise _invalid_token()
+
+    async with unit_of_work(engine):
+        # 同じトークンでの同時リクエストのうち、1 つだけがローテーションに成功する
+        claimed = await execute_statement(
+            engine,
+            update(RefreshToken)
+            .where(RefreshToken.id == record.id, RefreshToken.used_at.is_(None), RefreshToken.revoked.is_(False))
+            .values(used_at=datetime.now()),
+        )
+        if claimed != 1:
+            raise _invalid_token()
+
+        users = await select_table(engine, User, {"id": record.user_id})
+        if not users:
+            raise _invalid_token()
+        new_token = await issue_refresh_token(engine, record.user_id, record.family_id)
+
+    return users[0], new_token, record.family_id
+
+
+async def refresh_token_family(engine: Engine, token: str) -> str | None:
+    """リフレッシュトークンの family_id を返す。保存されていないトークンの場合は None。"""
+    records = await select_table(engine, RefreshToken, {"token_hash": hash_refresh_token(token)})
+    return records[0].family_id if records else None
+
+
+async def purge_expired_refresh_tokens(engine: Engine) -> int:
+    """有効期限が切れたトークンを削除する。バックグラウンドタスクとして定期的に実行される。"""
+    deleted = await execute_statement(
+        engine, delete(RefreshToken).where(RefreshToken.expires_at < datetime.now())
+    )
+    if deleted:
+        logger.info("期限切れのリフレッシュトークンを削除しました: %d件", deleted)
+    return deleted
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# バックグラウンドタスクのワーカー数と待ち行列の上限
+TASK_WORKERS = int(os.getenv("BACKGROUND_TASK_WORKERS") or 2)
+TASK_QUEUE_SIZE = int(os.getenv("BACKGROUND_TASK_QUEUE") or 1000)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class BackgroundTaskQueue:
+    """
+    リクエストの応答後に実行する処理 (セッション名の生成など) を受け付けるタスクキュー。
+
+    アプリケーションの lifespan で start() / stop() を呼び出す。
+    同じ key のタスクが待ち行列にある間は重複して登録しない。
+    待ち行列が上限に達している場合、タスクは破棄して警告を出す (リクエストの応答は妨げない)。
+    """
+
+    def __init__(self, workers: int = TASK_WORKERS, max_queue: int = TASK_QUEUE_SIZE) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue: asyncio.Queue[tuple[str | None, Job]] | None = None
+        self._workers: list[asyncio.Task[None]] = []
+        self._pending_keys: set[str] = set()
+        self._periodic: dict[str, asyncio.Task[None]] = {}
+        self.enqueued = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(self.max_queue)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Background task queue started: workers=%d", self.workers)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """待ち行列に残っているタスクを timeout 秒まで処理してからワーカーを止める。"""
+        if not self._workers:
+            return
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Background task queue stopped with %d pending tasks.", self._queue.qsize())
+        periodic = list(self._periodic.values())
+        for task in [*periodic, *self._workers]:
+            task.cancel()
+        await asyncio.gather(*periodic, *self._workers, return_exceptions=True)
+        self._periodic.clear()
+        self._workers = []
+        self._queue = None
+        self._pending_keys.clear()
+
+    def enqueue(self, job: Job, key: str | None = None) -> bool:
+        """
+        タスクを待ち行列に追加する。
+
+        Args:
+            job (Job): 引数なしで呼び出すコルーチン関数。
+            key (str | None): 重複登録を防ぐためのキー。
+
+        Returns:
+            bool: 追加した場合は True。重複または待ち行列が満杯の場合は False。
+        """
+        # lifespan を経由しない呼び出し (スクリプト等) でも動作するよう遅延起動する
+        if not self._workers:
+            self.start()
+        assert self._queue is not None
+
+        if key is not None and key in self._pending_keys:
+            return False
+        try:
+            self._queue.put_nowait((key, job))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Background task queue is full; dropped task %s", key)
+            return False
+        if key is not None:
+            self._pending_keys.add(key)
+        self.enqueued += 1
+        return True
+
+    def is_pending(self, key: str) -> bool:
+        """key のタスクが待ち行列にある (まだ実行が始まっていない) かどうかを返す。"""
+        return key in self._pending_keys
+
+    def every(self, interval: float, job: Job, key: str) -> None:
+        """
+        interval 秒ごとに job を待ち行列に追加する (期限切れのレコードの削除など)。
+        前回追加したタスクがまだ待ち行列に残っている場合は key による重複防止で追加しない。
+        """
+        if not self._workers:
+            self.start()
+        if key in self._periodic:
+            return
+
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                self.enqueue(job, key=key)
+
+        self._periodic[key] = asyncio.create_task(loop())
+        logger.info("Periodic task %s scheduled every %.0f seconds", key, interval)
+
+    async def _worker(self, index: int) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            key, job = await queue.get()
+            if key is not None:
+                self._pending_keys.discard(key)
+            try:
+                await job()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Background task %s failed: %s", key, e, exc_info=True)
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "periodic": sorted(self._periodic),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+task_queue = BackgroundTaskQueue()
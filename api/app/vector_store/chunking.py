@@ -0,0 +1,56 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+
+# 学校情報を埋め込みの単位 (チャンク) に分割する際の最大文字数
+VECTOR_CHUNK_SIZE = int(os.getenv("VECTOR_CHUNK_SIZE") or 1000)
+
+_HEADING = re.compile(r"^(?=#{1,6}\s)", re.MULTILINE)
+
+
+@dataclass(frozen=True, slots=True)
+class Chunk:
+    hash: str
+    text: str
+
+
+def normalize(text: str) -> str:
+    """改行コードと前後の空白の違いだけで内容が変わったとみなさないよう正規化する。"""
+    return text.replace("\r\n", "\n").strip()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(normalize(text).encode()).hexdigest()
+
+
+def split_chunks(text: str, size: int = VECTOR_CHUNK_SIZE) -> list[str]:
+    """
+    Markdown を見出しごとに分割し、size 文字を超える節は行の区切りでさらに分割する。
+    一部の節だけを編集した場合に、他の節のチャンクが変わらないようにする。
+    """
+    chunks: list[str] = []
+    for section in _HEADING.split(normalize(text)):
+        current = ""
+        for line in section.strip().splitlines(keepends=True):
+            if current and len(current) + len(line) > size:
+                chunks.append(current.strip())
+                current = ""
+            # 1 行が size を超える場合はそのまま切る
+            rest = line
+            while len(rest) > size:
+                chunks.append(rest[:size])
+                rest = rest[size:]
+            current += rest
+        if current.strip():
+            chunks.append(current.strip())
+    return chunks
+
+
+def chunk_document(text: str, size: int = VECTOR_CHUNK_SIZE) -> list[Chunk]:
+    return [Chunk(hash_text(chunk), chunk) for chunk in split_chunks(text, size)]
+
+
+def document_hashes(text: str) -> tuple[str, str]:
+    """SchoolInfo に保存する本文全体のハッシュと、チャンクごとのハッシュ (カンマ区切り) を返す。"""
+    return hash_text(text), ",".join(chunk.hash for chunk in chunk_document(text))
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Protocol, runtime_checkable
+
+from sqlalchemy import Engine
+
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.vector_store.chunking import Chunk, chunk_document
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# ベクターストアの実装
+# cosmos: Azure Cosmos DB (sc_system_ai の CosmosDBManager)
+# local: プロセス内の NumPy のベクターインデックス (SchoolInfo から作成し、検索にも対応する)
+# memory: プロセス内 (テスト・ローカル開発用。埋め込みを作成しない)
+VECTOR_STORE_BACKEND = (os.getenv("VECTOR_STORE_BACKEND") or "cosmos").lower()
+
+
+class VectorStore(Protocol):
+    """学校情報の同期に使うベクターストアの操作 (CosmosDBManager と同じシグネチャ)。"""
+
+    def create_document(self, text: str, title: str, source_id: int) -> Any: ...
+
+    def update_document(self, text: str, text_type: str, title: str, source_id: int) -> Any: ...
+
+    def delete_document_by_source_id(self, source_id: int) -> Any: ...
+
+
+@runtime_checkable
+class ChunkedVectorStore(Protocol):
+    """
+    チャンク単位で埋め込みを保持するベクターストア。
+    update_document の代わりに使われ、保持しているハッシュと異なるチャンクのみ埋め込みを作り直す。
+    """
+
+    def upsert_chunks(self, source_id: int, title: str, chunks: list[Chunk]) -> int:
+        """source_id のチャンクを chunks に置き換え、埋め込みを作成したチャンクの数を返す。"""
+        ...
+
+    def update_metadata(self, source_id: int, title: str) -> None:
+        """埋め込みを作り直さずにタイトルのみ更新する。"""
+        ...
+
+
+@dataclass(frozen=True, slots=True)
+class SearchHit:
+    source_id: int
+    title: str
+    text: str
+    score: float
+
+
+@runtime_checkable
+class SearchableVectorStore(Protocol):
+    """バックエンドから直接検索できるベクターストア。"""
+
+    def search(self, query: str, k: int) -> list[SearchHit]:
+        """query に近い学校情報を、最も近いチャンクの類似度の高い順に最大 k 件返す。"""
+        ...
+
+
+@runtime_checkable
+class ManagedVectorStore(Protocol):
+    """起動時の準備 (SchoolInfo との差分の反映など) と終了時の保存が必要なベクターストア。"""
+
+    def start(self, engine: Engine) -> None: ...
+
+    def close(self) -> None: ...
+
+
+@runtime_checkable
+class WarmableVectorStore(Protocol):
+    """起動時に接続を確認する軽い呼び出し (warm_up) に対応するベクターストア。"""
+
+    def warm_up(self) -> None:
+        """接続・認証を済ませるため、結果を使わない軽い呼び出しを 1 回行う。"""
+        ...
+
+
+class InMemoryVectorStore:
+    """
+    テスト・ローカル開発用の VectorStore のインメモリ実装。
+    埋め込みは行わず、source_id ごとにタイトルとチャンクを保持する
+    (embedded_chunks は埋め込みを作成したはずのチャンク数)。
+    """
+
+    def __init__(self) -> None:
+        self.documents: dict[int, tuple[str, dict[str, str]]] = {}
+        self.embedded_chunks = 0
+        self._lock = threading.Lock()
+
+    def create_document(self, text: str, title: str, source_id: int) -> list[str]:
+        self.upsert_chunks(source_id, title, chunk_document(text))
+        return [str(source_id)]
+
+    def update_document(self, text: str, text_type: str, title: str, source_id: int) -> list[str]:
+        return self.create_document(text=text, title=title, source_id=source_id)
+
+    def delete_document_by_source_id(self, source_id: int) -> None:
+        with self._lock:
+            self.documents.pop(source_id, None)
+
+    def upsert_chunks(self, source_id: int, title: str, chunks: list[Chunk]) -> int:
+        with self._lock:
+            _, current = self.documents.get(source_id, ("", {}))
+            embedded = sum(1 for chunk in chunks if chunk.hash not in current)
+            self.documents[source_id] = (title, {chunk.hash: chunk.text for chunk in chunks})
+            self.embedded_chunks += embedded
+        return embedded
+
+    def update_metadata(self, source_id: int, title: str) -> None:
+        with self._lock:
+            if source_id in self.documents:
+                self.documents[source_id] = (title, self.documents[source_id][1])
+
+
+def create_vector_store() -> VectorStore:
+    """環境変数の設定からベクターストアのクライアントを作成する。"""
+    if VECTOR_STORE_BACKEND == "memory":
+        return InMemoryVectorStore()
+    if VECTOR_STORE_BACKEND == "local":
+        from api.app.vector_store.local_index import open_local_index
+
+        return open_local_index()
+    if VECTOR_STORE_BACKEND != "cosmos":
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}")
+    from sc_system_ai.template.azure_cosmos import CosmosDBManager
+
+    # コンテナの存在確認 (なければ作成) はクライアントの作成時の 1 回だけ行う
+    return CosmosDBManager(create_container=True)
+
+
+def warm_up_vector_store(store: VectorStore) -> bool:
+    """
+    最初の同期・検索が接続の確立や認証を待たないよう、軽い呼び出しを 1 回行う。
+    Cosmos DB (CosmosDBManager) はコンテナのプロパティを読み込む (メタデータの要求 1 回で、埋め込みは作成しない)。
+
+    Returns:
+        bool: 呼び出しを行った場合は True。対応していないストアの場合は False。
+    """
+    if isinstance(store, WarmableVectorStore):
+        store.warm_up()
+        return True
+    # CosmosDBManager (LangChain の AzureCosmosDBNoSqlVectorSearch) はコンテナのクライアントを _container に保持する
+    container = getattr(store, "_container", None)
+    if container is not None and callable(getattr(container, "read", None)):
+        container.read()
+        return True
+    return False
+
+
+_vector_store: VectorStore | None = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """
+    プロセスで共有するベクターストアのクライアントを返す。
+    クライアントは接続を保持して再利用するため、呼び出しごとに作成しない。
+    lifespan で作成できなかった場合は、最初に使われた時点で作成する。
+    """
+    global _vector_store  # noqa: PLW0603
+    if _vector_store is None:
+        # ワーカースレッドから同時に呼ばれても 1 つだけ作成する
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = create_vector_store()
+    return _vector_store
+
+
+def set_vector_store(store: VectorStore | None) -> None:
+    """
+    クライアントを差し替える (テストで InMemoryVectorStore を使う場合など)。
+    None の場合は次に使われた時点で作り直す。
+    """
+    global _vector_store  # noqa: PLW0603
+    with _vector_store_lock:
+        _vector_store = store
+
+
+async def init_vector_store(engine: Engine) -> None:
+    """
+    アプリケーションの起動時にクライアントを作成し、warm_up_vector_store で接続を済ませておく。
+    失敗しても起動は止めない (同期は outbox で再試行され、その際に作成し直す)。
+    """
+    start = time.perf_counter()
+    try:
+        store = await run_in_pool(AI_POOL, get_vector_store)
+    except Exception as e:
+        logger.warning("Vector store is unavailable at startup: %s", e)
+        return
+    created = time.perf_counter()
+    try:
+        warmed = await run_in_pool(AI_POOL, warm_up_vector_store, store)
+    except Exception as e:
+        # クライアントは作成できているため、そのまま使う (次の呼び出しで接続し直す)
+        logger.warning("Vector store warm-up failed: %s: %s", type(store).__name__, e)
+        warmed = False
+    name, create_ms = type(store).__name__, (created - start) * 1000
+    if warmed:
+        logger.info(
+            "Vector store ready: %s (create %.0f ms, warm-up %.0f ms)",
+            name,
+            create_ms,
+            (time.perf_counter() - created) * 1000,
+        )
+    else:
+        logger.info("Vector store ready: %s (create %.0f ms, no warm-up call)", name, create_ms)
+    if isinstance(store, ManagedVectorStore):
+        store.start(engine)
+
+
+def close_vector_store() -> None:
+    """アプリケーションの終了時に、保存が必要なベクターストアを保存する。"""
+    store = _vector_store
+    if isinstance(store, ManagedVectorStore):
+        store.close()
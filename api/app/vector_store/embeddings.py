@@ -0,0 +1,73 @@
+import os
+import re
+import zlib
+from typing import Protocol
+
+# ローカルのベクターインデックス (VECTOR_STORE_BACKEND=local) で使う埋め込みモデル
+# VECTOR_EMBEDDING: azure (Azure OpenAI の埋め込みモデル)
+#   または hashing (文字 n-gram のハッシュ。オフライン・負荷試験用)
+# VECTOR_EMBEDDING_MODEL: azure の場合のデプロイ名
+# VECTOR_EMBEDDING_DIM: hashing の場合の次元数
+# VECTOR_EMBEDDING_BATCH: 1 回の呼び出しで埋め込みを作成するチャンク数の上限
+VECTOR_EMBEDDING = (os.getenv("VECTOR_EMBEDDING") or "azure").lower()
+VECTOR_EMBEDDING_MODEL = os.getenv("VECTOR_EMBEDDING_MODEL") or "text-embedding-3-small"
+VECTOR_EMBEDDING_DIM = int(os.getenv("VECTOR_EMBEDDING_DIM") or 256)
+VECTOR_EMBEDDING_BATCH = int(os.getenv("VECTOR_EMBEDDING_BATCH") or 64)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class Embedder(Protocol):
+    """埋め込みモデルの操作 (LangChain の Embeddings と同じシグネチャ)。"""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]: ...
+
+    def embed_query(self, text: str) -> list[float]: ...
+
+
+class HashingEmbedder:
+    """
+    文字の 1-gram と 2-gram をハッシュで固定次元に割り当てる埋め込み。
+    外部の API を呼ばないため、オフラインでの動作確認や検索レイテンシの負荷試験に使う (意味的な類似度は扱えない)。
+    プロセスごとに値が変わる hash() ではなく crc32 を使い、保存したインデックスを再起動後も使えるようにする。
+    """
+
+    def __init__(self, dim: int = VECTOR_EMBEDDING_DIM) -> None:
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dim
+        text = _WHITESPACE.sub(" ", text.lower()).strip()
+        grams = list(text) + [text[i : i + 2] for i in range(len(text) - 1)]
+        for gram in grams:
+            h = zlib.crc32(gram.encode())
+            # 衝突による偏りを打ち消すため、ハッシュの 1 ビットで符号を決める
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def embedder_id() -> str:
+    """インデックスの保存時に記録する埋め込みモデルの識別子。異なるモデルで作成したベクトルは使わない。"""
+    if VECTOR_EMBEDDING == "hashing":
+        return f"hashing:{VECTOR_EMBEDDING_DIM}"
+    return f"azure:{VECTOR_EMBEDDING_MODEL}"
+
+
+def create_embedder() -> Embedder:
+    """環境変数の設定から埋め込みモデルを作成する。"""
+    if VECTOR_EMBEDDING == "hashing":
+        return HashingEmbedder()
+    if VECTOR_EMBEDDING != "azure":
+        raise ValueError(f"Unknown VECTOR_EMBEDDING: {VECTOR_EMBEDDING}")
+    try:
+        from langchain_openai import AzureOpenAIEmbeddings
+    except ImportError as e:
+        raise ImportError("VECTOR_EMBEDDING=azure requires the 'langchain-openai' package") from e
+    # エンドポイントと API キーは AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_API_KEY / OPENAI_API_VERSION から読み込まれる
+    return AzureOpenAIEmbeddings(azure_deployment=VECTOR_EMBEDDING_MODEL)
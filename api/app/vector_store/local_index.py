@@ -0,0 +1,399 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from sqlalchemy import Engine
+from sqlmodel import select
+
+from api.app.database.database import fetch_all
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.models import SchoolInfo
+from api.app.tasks import task_queue
+from api.app.vector_store.chunking import Chunk, chunk_document
+from api.app.vector_store.client import SearchHit
+from api.app.vector_store.embeddings import VECTOR_EMBEDDING_BATCH, Embedder, create_embedder, embedder_id
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# ローカルのベクターインデックス (VECTOR_STORE_BACKEND=local) の設定
+# VECTOR_INDEX_PATH: 保存先のディレクトリ (未設定の場合は保存せず、起動のたびに SchoolInfo から作成する)
+# VECTOR_INDEX_SAVE_INTERVAL: 変更があった場合に保存する間隔 (秒)
+# VECTOR_INDEX_SYNC_PAGE_SIZE: 起動時に SchoolInfo との差分を反映する際に、1 回で読み込む件数
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH")
+VECTOR_INDEX_SAVE_INTERVAL = float(os.getenv("VECTOR_INDEX_SAVE_INTERVAL") or 60)
+VECTOR_INDEX_SYNC_PAGE_SIZE = int(os.getenv("VECTOR_INDEX_SYNC_PAGE_SIZE") or 100)
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+
+# (学校情報ID, タイトル, チャンク)
+Document = tuple[int, str, list[Chunk]]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    # 正規化しておき、検索時のコサイン類似度を内積 1 回で求める
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class LocalVectorIndex:
+    """
+    チャンクの埋め込みを 1 つの float32 の行列に保持する総当たり (flat) のベクターインデックス。
+
+    検索は正規化済みの行列とクエリの内積 1 回で全チャンクのコサイン類似度を求め、argpartition で上位を取り出す。
+    追加は行列の末尾への書き込み、削除は末尾の行との入れ替えで行うため、行列は常に先頭から詰まっている。
+    保存したインデックスは読み込み時にメモリマップし、最初の変更の時点でメモリ上にコピーする。
+    """
+
+    def __init__(self, embedder: Embedder, model: str, path: str | None = None) -> None:
+        self.embedder = embedder
+        self.model = model
+        self.path = Path(path) if path else None
+        self._lock = threading.RLock()
+        self._vectors: np.ndarray | None = None
+        self._count = 0
+        # 行ごとの (学校情報ID, チャンクのハッシュ) と本文
+        self._keys: list[tuple[int, str]] = []
+        self._texts: list[str] = []
+        # 学校情報ID -> {チャンクのハッシュ: 行}
+        self._rows: dict[int, dict[str, int]] = {}
+        self._titles: dict[int, str] = {}
+        # 削除の通し番号と、学校情報ID -> 最後に削除した時点の通し番号
+        # 埋め込みの作成中や SchoolInfo の読み込み後に削除された学校情報を、追加し直さないために使う
+        self._deletions = 0
+        self._deleted_at: dict[int, int] = {}
+        self._dirty = False
+        self.embedded = 0
+        self.searches = 0
+
+    # 行列の操作 (呼び出し側でロックを取る)
+
+    def _writable(self, needed: int) -> np.ndarray:
+        vectors = self._vectors
+        if (
+            vectors is not None
+            and vectors.flags.writeable
+            and len(vectors) >= needed
+            and not isinstance(vectors, np.memmap)
+        ):
+            return vectors
+        # 容量が足りない場合、またはメモリマップしたファイルの場合は、余裕を持たせてメモリ上にコピーする
+        dim = vectors.shape[1] if vectors is not None else None
+        capacity = max(16, needed, 2 * len(vectors) if vectors is not None else 0)
+        grown = np.zeros((capacity, dim or 0), dtype=np.float32)
+        if vectors is not None:
+            grown[: self._count] = vectors[: self._count]
+        self._vectors = grown
+        return grown
+
+    def _append(self, source_id: int, chunk: Chunk, vector: np.ndarray) -> None:
+        if self._vectors is None:
+            self._vectors = np.zeros((16, len(vector)), dtype=np.float32)
+        vectors = self._writable(self._count + 1)
+        row = self._count
+        vectors[row] = vector
+        self._keys.append((source_id, chunk.hash))
+        self._texts.append(chunk.text)
+        self._rows.setdefault(source_id, {})[chunk.hash] = row
+        self._count += 1
+
+    def _remove(self, row: int) -> None:
+        vectors = self._writable(self._count)
+        last = self._count - 1
+        source_id, chunk_hash = self._keys[row]
+        if row != last:
+            # 末尾の行を削除した行の位置に移す
+            vectors[row] = vectors[last]
+            moved = self._keys[last]
+            self._keys[row] = moved
+            self._texts[row] = self._texts[last]
+            self._rows[moved[0]][moved[1]] = row
+        self._keys.pop()
+        self._texts.pop()
+        self._count -= 1
+        rows = self._rows[source_id]
+        del rows[chunk_hash]
+        if not rows:
+            del self._rows[source_id]
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        batches = [
+            self.embedder.embed_documents(texts[i : i + VECTOR_EMBEDDING_BATCH])
+            for i in range(0, len(texts), VECTOR_EMBEDDING_BATCH)
+        ]
+        return _normalize(np.asarray([vector for batch in batches for vector in batch], dtype=np.float32))
+
+    # 追加・削除
+
+    def deletion_mark(self) -> int:
+        """削除の通し番号を返す。upsert_many に渡すと、これ以降に削除された学校情報は追加しない。"""
+        with self._lock:
+            return self._deletions
+
+    def _deleted_since(self, source_id: int, mark: int) -> bool:
+        return self._deleted_at.get(source_id, 0) > mark
+
+    def upsert_many(self, documents: list[Document], mark: int | None = None) -> int:
+        """
+        学校情報ごとにチャンクを置き換える。保持していないハッシュのチャンクのみ、まとめて埋め込みを作成する。
+
+        Args:
+            mark (int | None): deletion_mark の戻り値。documents を読み込む前に取得しておくと、
+                読み込み後に削除された学校情報を追加しない。省略した場合は呼び出した時点の値を使う。
+
+        Returns:
+            int: 埋め込みを作成したチャンクの数。
+        """
+        with self._lock:
+            if mark is None:
+                mark = self._deletions
+            documents = [document for document in documents if not self._deleted_since(document[0], mark)]
+            pending: dict[str, Chunk] = {}
+            for source_id, _, chunks in documents:
+                current = self._rows.get(source_id, {})
+                for chunk in chunks:
+                    if chunk.hash not in current:
+                        pending.setdefault(chunk.hash, chunk)
+
+        # 埋め込みの作成 (外部 API の呼び出し) の間は、検索を止めないようロックを外す
+        new_chunks = list(pending.values())
+        embedded: dict[str, np.ndarray] = {}
+        if new_chunks:
+            vectors = self._embed([chunk.text for chunk in new_chunks])
+            embedded = dict(zip((chunk.hash for chunk in new_chunks), vectors, strict=True))
+
+        with self._lock:
+            for source_id, title, chunks in documents:
+                # ロックを外していた間に削除された学校情報は追加し直さない
+                if self._deleted_since(source_id, mark):
+                    continue
+                hashes = {chunk.hash for chunk in chunks}
+                current = self._rows.get(source_id, {})
+                for chunk_hash in [h for h in current if h not in hashes]:
+                    self._remove(current[chunk_hash])
+                for chunk in chunks:
+                    if chunk.hash in embedded and chunk.hash not in self._rows.get(source_id, {}):
+                        self._append(source_id, chunk, embedded[chunk.hash])
+                self._titles[source_id] = title
+            self._dirty = True
+            self.embedded += len(new_chunks)
+        return len(new_chunks)
+
+    def upsert_chunks(self, source_id: int, title: str, chunks: list[Chunk]) -> int:
+        return self.upsert_many([(source_id, title, chunks)])
+
+    def update_metadata(self, source_id: int, title: str) -> None:
+        with self._lock:
+            if source_id in self._rows:
+                self._titles[source_id] = title
+                self._dirty = True
+
+    def create_document(self, text: str, title: str, source_id: int) -> list[str]:
+        self.upsert_chunks(source_id, title, chunk_document(text))
+        return [str(source_id)]
+
+    def update_document(self, text: str, text_type: str, title: str, source_id: int) -> list[str]:
+        return self.create_document(text=text, title=title, source_id=source_id)
+
+    def delete_document_by_source_id(self, source_id: int) -> None:
+        with self._lock:
+            # 削除で行が入れ替わるため、1 行ごとに位置を引き直す
+            while source_id in self._rows:
+                self._remove(next(iter(self._rows[source_id].values())))
+            self._titles.pop(source_id, None)
+            self._deletions += 1
+            self._deleted_at[source_id] = self._deletions
+            self._dirty = True
+
+    def source_hashes(self, source_id: int) -> set[str]:
+        with self._lock:
+            return set(self._rows.get(source_id, {}))
+
+    def source_ids(self) -> set[int]:
+        with self._lock:
+            return set(self._rows)
+
+    # 検索
+
+    def search_many(self, queries: list[str], k: int) -> list[list[SearchHit]]:
+        """
+        複数のクエリをまとめて検索する。全チャンクとのコサイン類似度を 1 回の行列積で求める。
+        学校情報ごとに最も近いチャンクのみを残し、類似度の高い順に最大 k 件返す。
+        """
+        query_vectors = _normalize(np.asarray(self.embedder.embed_documents(queries), dtype=np.float32))
+        with self._lock:
+            self.searches += len(queries)
+            if self._count == 0 or self._vectors is None:
+                return [[] for _ in queries]
+            scores = self._vectors[: self._count] @ query_vectors.T
+            # 同じ学校情報の複数のチャンクが上位を占めても k 件の学校情報が残るよう、多めに取り出す
+            candidates = min(self._count, k * 4)
+            results: list[list[SearchHit]] = []
+            for column in scores.T:
+                if candidates < self._count:
+                    top = np.argpartition(-column, candidates - 1)[:candidates]
+                else:
+                    top = np.arange(self._count)
+                top = top[np.argsort(-column[top], kind="stable")]
+                hits: list[SearchHit] = []
+                seen: set[int] = set()
+                for row in top:
+                    source_id, _ = self._keys[row]
+                    if source_id in seen:
+                        continue
+                    seen.add(source_id)
+                    title = self._titles.get(source_id, "")
+                    hits.append(SearchHit(source_id, title, self._texts[row], float(column[row])))
+                    if len(hits) >= k:
+                        break
+                results.append(hits)
+            return results
+
+    def search(self, query: str, k: int) -> list[SearchHit]:
+        return self.search_many([query], k)[0]
+
+    # 保存・読み込み
+
+    def save(self) -> bool:
+        """変更があれば保存する。一時ファイルに書き込んでから置き換えるため、途中で止まっても前回の内容が残る。"""
+        if self.path is None:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            vectors = self._vectors[: self._count] if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+            meta = {
+                "model": self.model,
+                "keys": self._keys,
+                "texts": self._texts,
+                "titles": {str(source_id): title for source_id, title in self._titles.items()},
+            }
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / (VECTORS_FILE + ".tmp"), "wb") as f:
+                np.save(f, vectors)
+            (self.path / (META_FILE + ".tmp")).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            os.replace(self.path / (VECTORS_FILE + ".tmp"), self.path / VECTORS_FILE)
+            os.replace(self.path / (META_FILE + ".tmp"), self.path / META_FILE)
+            self._dirty = False
+        logger.info("Local vector index saved: %d chunks", self._count)
+        return True
+
+    def load(self) -> bool:
+        """
+        保存したインデックスを読み込む。
+        埋め込みモデルが異なる場合や読み込めない場合は使わない (SchoolInfo から作り直す)。
+        """
+        if self.path is None or not (self.path / META_FILE).exists():
+            return False
+        try:
+            meta = json.loads((self.path / META_FILE).read_text(encoding="utf-8"))
+            if meta.get("model") != self.model:
+                logger.warning(
+                    "Local vector index was built with %s; rebuilding with %s", meta.get("model"), self.model
+                )
+                return False
+            vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load the local vector index: %s", e)
+            return False
+
+        keys = [(int(source_id), chunk_hash) for source_id, chunk_hash in meta["keys"]]
+        if len(keys) != len(vectors):
+            logger.warning("Local vector index is inconsistent; rebuilding")
+            return False
+        with self._lock:
+            self._vectors = vectors if len(vectors) else None
+            self._count = len(keys)
+            self._keys = keys
+            self._texts = list(meta["texts"])
+            self._rows = {}
+            for row, (source_id, chunk_hash) in enumerate(keys):
+                self._rows.setdefault(source_id, {})[chunk_hash] = row
+            self._titles = {int(source_id): title for source_id, title in meta["titles"].items()}
+            self._dirty = False
+        logger.info("Local vector index loaded: %d chunks", self._count)
+        return True
+
+    # ライフサイクル
+
+    def warm_up(self) -> None:
+        """埋め込みモデルに 1 件だけ問い合わせ、最初の検索が接続の確立を待たないようにする。"""
+        self.embedder.embed_query("warm-up")
+
+    def start(self, engine: Engine) -> None:
+        """SchoolInfo との差分の反映と、定期的な保存をバックグラウンドタスクに登録する。"""
+        task_queue.enqueue(lambda: sync_local_index(engine, self), key="local_vector_index_sync")
+        if self.path is not None:
+            task_queue.every(
+                VECTOR_INDEX_SAVE_INTERVAL, lambda: run_in_pool(AI_POOL, self.save), key="local_vector_index_save"
+            )
+
+    def close(self) -> None:
+        self.save()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.model,
+                "sources": len(self._rows),
+                "chunks": self._count,
+                "dim": self._vectors.shape[1] if self._vectors is not None else None,
+                "bytes": self._count * self._vectors.shape[1] * 4 if self._vectors is not None else 0,
+                "memory_mapped": isinstance(self._vectors, np.memmap),
+                "embedded": self.embedded,
+                "searches": self.searches,
+                "path": str(self.path) if self.path else None,
+            }
+
+
+def open_local_index() -> LocalVectorIndex:
+    """環境変数の設定からインデックスを作成し、保存したものがあれば読み込む。"""
+    index = LocalVectorIndex(create_embedder(), embedder_id(), VECTOR_INDEX_PATH)
+    index.load()
+    return index
+
+
+async def sync_local_index(engine: Engine, index: LocalVectorIndex) -> int:
+    """
+    SchoolInfo の全件とインデックスを比較し、チャンクのハッシュが異なる学校情報のみ反映する。
+    インデックスにあって SchoolInfo にない学校情報は削除する。停止中の変更や、保存していない場合の初回の作成に使う。
+
+    Returns:
+        int: 埋め込みを作成したチャンクの数。
+    """
+    seen: set[int] = set()
+    embedded = 0
+    last_id = 0
+    while True:
+        # 読み込んだ後に outbox が削除した学校情報を追加し直さないよう、読み込む前の削除の通し番号を渡す
+        mark = index.deletion_mark()
+        records = await fetch_all(
+            engine,
+            select(SchoolInfo)
+            .where(SchoolInfo.id > last_id)
+            .order_by(SchoolInfo.id)
+            .limit(VECTOR_INDEX_SYNC_PAGE_SIZE),
+        )
+        if not records:
+            break
+        last_id = records[-1].id
+        documents: list[Document] = []
+        for record in records:
+            seen.add(record.id)
+            # 保存済みのハッシュで比較し、一致する場合はチャンクへの分割も行わない
+            stored = set(record.chunk_hashes.split(",")) if record.chunk_hashes else None
+            if stored is not None and stored == index.source_hashes(record.id):
+                continue
+            documents.append((record.id, record.title, chunk_document(record.contents)))
+        if documents:
+            embedded += await run_in_pool(AI_POOL, index.upsert_many, documents, mark)
+
+    for source_id in index.source_ids() - seen:
+        index.delete_document_by_source_id(source_id)
+    logger.info("Local vector index synchronized with SchoolInfo: %d sources, %d chunks embedded", len(seen), embedded)
+    return embedded
@@ -0,0 +1,265 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Engine, case, delete, func, update
+from sqlmodel import select
+
+from api.app.database.database import add_db_record, execute_statement, fetch_all
+from api.app.database.unit_of_work import current_unit_of_work
+from api.app.executor import AI_POOL, run_in_pool
+from api.app.metrics import track, vector_store_duration, vector_store_errors
+from api.app.models import SchoolInfo, VectorStoreOutbox
+from api.app.tasks import task_queue
+from api.app.vector_store.chunking import chunk_document
+from api.app.vector_store.client import ChunkedVectorStore, get_vector_store
+from api.logger import getLogger
+
+logger = getLogger(__name__)
+
+# ベクターストアへの同期 (outbox) の設定
+# OUTBOX_BATCH_SIZE: 1 回の読み込みで処理する件数
+# OUTBOX_MAX_ATTEMPTS: この回数失敗したレコードは再試行せずに残す (GET /metrics/outbox で確認する)
+# OUTBOX_RETRY_BASE / OUTBOX_RETRY_MAX: 再試行までの待ち時間 (秒)。失敗するたびに 2 倍にする
+# OUTBOX_POLL_INTERVAL: 再試行や他のインスタンスが残したレコードを確認する間隔 (秒)
+# OUTBOX_CONCURRENCY: 同時に同期する学校情報の数 (埋め込みの作成を並列に行う)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE") or 50)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS") or 8)
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE") or 5)
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX") or 600)
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL") or 30)
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY") or 4)
+
+# 同期のタスクは 1 つだけ待ち行列に入れる (変更のたびに登録しても重複しない)
+OUTBOX_TASK_KEY = "vector_store_outbox"
+
+
+class OutboxStats:
+    """このプロセスでの同期の成功・失敗件数 (abandoned: 試行回数の上限に達して中止した件数)。"""
+
+    def __init__(self) -> None:
+        self.synced = 0
+        self.failed = 0
+        self.abandoned = 0
+
+    def snapshot(self) -> dict[str, int]:
+        return {"synced": self.synced, "failed": self.failed, "abandoned": self.abandoned}
+
+
+outbox_stats = OutboxStats()
+
+
+def retry_delay(attempts: int) -> float:
+    """attempts 回失敗した後、次に試行するまでの秒数。"""
+    return min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** max(attempts - 1, 0))
+
+
+async def enqueue_vector_sync(engine: Engine, source_id: int, metadata_only: bool = False) -> None:
+    """
+    学校情報のベクターストアへの同期を outbox に追加する。
+    Unit of Work の中で呼び出すと SchoolInfo の変更と同じトランザクションで書き込まれ、
+    コミット後に dispatcher を起動する。
+
+    Args:
+        metadata_only (bool): 内容が変わらずタイトルのみ変更された場合は True
+            (ChunkedVectorStore のみ埋め込みを作り直さない。Cosmos DB ではドキュメント全体を置き換える)。
+    """
+    await add_db_record(engine, outbox_record(source_id, metadata_only))
+
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.after_commit(lambda: schedule_outbox_dispatch(engine))
+    else:
+        schedule_outbox_dispatch(engine)
+
+
+def outbox_record(source_id: int, metadata_only: bool = False, delay: float = 0) -> VectorStoreOutbox:
+    """
+    outbox のレコードを作成する。
+
+    Args:
+        delay (float): dispatcher が処理を始めるまでの秒数。
+            呼び出し側で同期する場合に、その間 dispatcher が重複して処理しないようにする。
+    """
+    now = datetime.now()
+    return VectorStoreOutbox(
+        source_id=source_id,
+        created_at=now,
+        available_at=now + timedelta(seconds=delay),
+        metadata_only=metadata_only,
+    )
+
+
+def schedule_outbox_dispatch(engine: Engine) -> bool:
+    """dispatcher をバックグラウンドタスクに登録する。すでに待ち行列にある場合は登録しない。"""
+    return task_queue.enqueue(lambda: dispatch_outbox(engine), key=OUTBOX_TASK_KEY)
+
+
+def _sync_document(source_id: int, record: SchoolInfo | None, metadata_only: bool) -> None:
+    vector_store = get_vector_store()
+    if record is None:
+        vector_store.delete_document_by_source_id(source_id=source_id)
+        return
+    if isinstance(vector_store, ChunkedVectorStore):
+        if metadata_only:
+            vector_store.update_metadata(source_id=record.id, title=record.title)
+        else:
+            # ストアが保持しているハッシュと異なるチャンクのみ埋め込みを作り直す
+            vector_store.upsert_chunks(source_id=record.id, title=record.title, chunks=chunk_document(record.contents))
+        return
+    # Cosmos DB (CosmosDBManager) はチャンク単位・メタデータのみの更新に対応していないため、ドキュメント全体を置き換える
+    # (タイトルのみの変更でも全チャンクの埋め込みを作り直す。内容・タイトルが変わらない更新は outbox に追加されない)
+    # update_document は同じ source_id のドキュメントを置き換えるため、作成・再試行のいずれでも重複しない
+    vector_store.update_document(
+        text=record.contents,
+        text_type="markdown",
+        title=record.title,
+        source_id=record.id,
+    )
+
+
+async def sync_school_info(source_id: int, record: SchoolInfo | None, metadata_only: bool = False) -> None:
+    """学校情報の現在の状態をベクターストアに反映する。record が None の場合は削除する。"""
+    operation = "delete" if record is None else "metadata" if metadata_only else "upsert"
+    with track(vector_store_duration, vector_store_errors, operation):
+        await run_in_pool(AI_POOL, _sync_document, source_id, record, metadata_only)
+
+
+async def _record_failure(engine: Engine, rows: list[VectorStoreOutbox], error: Exception) -> None:
+    attempts = max(row.attempts for row in rows) + 1
+    ids = [row.id for row in rows]
+    outbox_stats.failed += 1
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        outbox_stats.abandoned += 1
+        logger.error(
+            "ベクターストアへの同期を中止しました。学校情報ID: %s, 試行回数: %d, エラー: %s",
+            rows[0].source_id,
+            attempts,
+            error,
+        )
+    else:
+        logger.warning(
+            "ベクターストアへの同期に失敗しました。学校情報ID: %s, 試行回数: %d, エラー: %s",
+            rows[0].source_id,
+            attempts,
+            error,
+        )
+    await execute_statement(
+        engine,
+        update(VectorStoreOutbox)
+        .where(VectorStoreOutbox.id.in_(ids))
+        .values(
+            attempts=attempts,
+            available_at=datetime.now() + timedelta(seconds=retry_delay(attempts)),
+            last_error=str(error)[:1000],
+        ),
+    )
+
+
+async def _sync_rows(
+    engine: Engine,
+    source_id: int,
+    rows: list[VectorStoreOutbox],
+    record: SchoolInfo | None,
+    semaphore: asyncio.Semaphore,
+) -> tuple[int, Exception | None]:
+    async with semaphore:
+        try:
+            # 内容の変更を含むレコードが 1 つでもあれば、チャンクの同期を行う
+            await sync_school_info(source_id, record, all(row.metadata_only for row in rows))
+        except Exception as e:
+            await _record_failure(engine, rows, e)
+            return source_id, e
+        # 同期中に追加されたレコード (読み込んだ後の変更) は残し、次の読み込みで処理する
+        await execute_statement(
+            engine,
+            delete(VectorStoreOutbox).where(VectorStoreOutbox.id.in_([row.id for row in rows])),
+        )
+        outbox_stats.synced += 1
+        return source_id, None
+
+
+async def process_outbox_rows(
+    engine: Engine,
+    rows: list[VectorStoreOutbox],
+    concurrency: int = OUTBOX_CONCURRENCY,
+) -> AsyncIterator[tuple[int, Exception | None]]:
+    """
+    outbox のレコードを学校情報ごとにまとめ、最大 concurrency 件ずつ並列にベクターストアへ同期する。
+    成功したレコードは削除し、失敗したレコードは待ち時間を延ばして再試行する。
+    Unit of Work の外で呼び出すこと (並列の同期はそれぞれ別のセッションで記録する)。
+
+    Yields:
+        tuple[int, Exception | None]: 完了した順に、学校情報のIDと失敗した場合の例外。
+    """
+    by_source: dict[int, list[VectorStoreOutbox]] = {}
+    for row in rows:
+        by_source.setdefault(row.source_id, []).append(row)
+    records = {
+        record.id: record
+        for record in await fetch_all(engine, select(SchoolInfo).where(SchoolInfo.id.in_(list(by_source))))
+    }
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.create_task(_sync_rows(engine, source_id, source_rows, records.get(source_id), semaphore))
+        for source_id, source_rows in by_source.items()
+    ]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # 呼び出し側が途中で止めた場合 (クライアントの切断など)、残りは dispatcher の再試行に任せる
+        for task in tasks:
+            task.cancel()
+
+
+async def dispatch_outbox(engine: Engine, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    処理可能な outbox のレコードを batch_size 件ずつ読み込み、学校情報ごとにベクターストアへ同期する。
+    同じ学校情報のレコードが複数ある場合は 1 回の同期にまとめる。
+
+    Returns:
+        int: 同期した学校情報の件数。
+    """
+    synced = 0
+    while True:
+        rows = await fetch_all(
+            engine,
+            select(VectorStoreOutbox)
+            .where(
+                VectorStoreOutbox.available_at <= datetime.now(),
+                VectorStoreOutbox.attempts < OUTBOX_MAX_ATTEMPTS,
+            )
+            .order_by(VectorStoreOutbox.id)
+            .limit(batch_size),
+        )
+        if not rows:
+            return synced
+
+        async for _, error in process_outbox_rows(engine, list(rows)):
+            if error is None:
+                synced += 1
+
+        if len(rows) < batch_size:
+            if synced:
+                logger.info("ベクターストアに同期しました: %d件", synced)
+            return synced
+
+
+async def outbox_backlog(engine: Engine) -> dict[str, Any]:
+    """同期待ち・同期を中止したレコードの件数を返す。"""
+    # SQL Server は FILTER 句に対応していないため CASE で数える
+    dead_case = case((VectorStoreOutbox.attempts >= OUTBOX_MAX_ATTEMPTS, 1), else_=0)
+    stmt = select(func.count(), func.sum(dead_case), func.min(VectorStoreOutbox.created_at)).select_from(
+        VectorStoreOutbox
+    )
+    total, dead, oldest = (await fetch_all(engine, stmt))[0]
+    return {
+        "pending": total - (dead or 0),
+        "dead": dead or 0,
+        "oldest_created_at": oldest,
+        **outbox_stats.snapshot(),
+    }
@@ -1,4 +1,3 @@
-import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
@@ -8,32 +7,64 @@ import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import SQLModel
 
-from api.app.database.engine import get_engine
+from api.app.database.engine import engine_registry
+from api.app.database.pagination import NEXT_CURSOR_HEADER
+from api.app.database.schema import migrate_schema
+from api.app.executor import executors
+from api.app.middleware.metrics import MetricsMiddleware
+from api.app.middleware.rate_limit import RateLimitMiddleware
+from api.app.middleware.request_context import RequestContextMiddleware
+from api.app.middleware.timing import SERVER_TIMING_ENABLED, ServerTimingMiddleware
 from api.app.routers.auth import router as auth_router
 from api.app.routers.chats import router as chatlog_router
 from api.app.routers.group import router as group_router
+from api.app.routers.monitoring import router as monitoring_router
 from api.app.routers.school_info import router as school_info_router
 from api.app.routers.sessions import router as session_router
 from api.app.routers.users import router as user_router
+from api.app.security.password import password_hasher
+from api.app.security.refresh_token import REFRESH_TOKEN_PURGE_INTERVAL, purge_expired_refresh_tokens
+from api.app.tasks import task_queue
+from api.app.vector_store.client import close_vector_store, init_vector_store
+from api.app.vector_store.outbox import OUTBOX_POLL_INTERVAL, OUTBOX_TASK_KEY, dispatch_outbox, schedule_outbox_dispatch
 from api.logger import getLogger
 
-logger = getLogger("azure_functions.fastapi")
-logger.setLevel(logging.DEBUG)
+logger = getLogger("azure_functions.fastapi", "DEBUG")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     try:
-        # データベースエンジンの作成
-        engine = get_engine()
+        # 共有データベースエンジン (接続プール) の作成
+        engine = engine_registry.init()
 
         # 既存のテーブルを削除して再作成する処理 (必要に応じてコメント解除)
         # SQLModel.metadata.drop_all(engine)
 
         # データベーステーブルの作成
         SQLModel.metadata.create_all(engine)
+        # 既存のテーブルに後から追加した列・インデックスを反映する (create_all は既存のテーブルを変更しない)
+        migrate_schema(engine)
         logger.info("Database connected and tables created.")
 
+        # 応答後に行う処理 (セッション名の生成など) のバックグラウンドタスクキューを起動
+        task_queue.start()
+        # 期限切れのリフレッシュトークンを定期的に削除する
+        task_queue.every(
+            REFRESH_TOKEN_PURGE_INTERVAL,
+            lambda: purge_expired_refresh_tokens(engine),
+            key="purge_refresh_tokens",
+        )
+        # ベクターストアのクライアントを作成し、コンテナの確認と接続を済ませておく
+        # (ローカルのインデックスの場合は SchoolInfo との差分の反映と定期的な保存を登録する)
+        await init_vector_store(engine)
+        # ベクターストアへの同期待ち (outbox) を起動時と定期的に処理する (再試行や他のインスタンスが残した分)
+        schedule_outbox_dispatch(engine)
+        task_queue.every(OUTBOX_POLL_INTERVAL, lambda: dispatch_outbox(engine), key=OUTBOX_TASK_KEY)
+
+        # パスワードハッシュ化サービスの起動と bcrypt のコストの調整
+        await password_hasher.start()
+
         # アプリケーションのライフスパン中にリソースを使用可能
         yield
     except Exception as e:
@@ -41,8 +72,15 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         logger.error("Error during database setup: %s", e)
         raise
     finally:
-        # アプリケーション終了時にエンジンを解放
-        engine.dispose()
+        # 残っているバックグラウンドタスクを処理してから停止する
+        await task_queue.stop()
+        # ローカルのベクターインデックスを保存する
+        close_vector_store()
+        # アプリケーション終了時にエンジン (接続プール) を解放
+        await engine_registry.dispose_async()
+        engine_registry.dispose()
+        executors.shutdown()
+        password_hasher.shutdown()
         logger.info("Database connection closed.")
 
 
@@ -150,6 +188,17 @@ origins: list[str] = [
     "https://sc-test-api.azurewebsites.net",  # 本番環境
 ]
 
+# レート制限ミドルウェアの追加 (ログイン・サインアップ・チャット)
+# 429 の応答にも CORS ヘッダーが付くよう、CORS ミドルウェアより先に追加する (内側になる)
+app.add_middleware(RateLimitMiddleware)
+# 処理中のリクエストのルートを記録する (遅いクエリのログなどで使用)
+app.add_middleware(RequestContextMiddleware)
+# 処理時間の内訳を Server-Timing ヘッダーとログに出力する (無効の場合は登録しない)
+if SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+# ルートごとのリクエスト数・処理時間を GET /metrics 用に記録する (429 も含めて数えるため外側に置く)
+app.add_middleware(MetricsMiddleware)
+
 # CORS ミドルウェアの追加
 # リクエスト元やメソッド、ヘッダーの制限を設定
 app.add_middleware(
@@ -158,6 +207,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],  # 許可する HTTP メソッド
     allow_headers=["Content-Type", "Authorization"],  # 許可するヘッダー
+    # フロントエンドから参照できるレスポンスヘッダー
+    expose_headers=[NEXT_CURSOR_HEADER, "Retry-After", "Server-Timing"],
 )
 
 # ルーターの登録
@@ -169,6 +220,7 @@ routers = [
     (chatlog_router, "/api"),  # チャットログ関連のエンドポイント
     (group_router, "/api"),  # グループ関連のエンドポイント
     (school_info_router, "/api"),  # 学校情報関連のエンドポイント
+    (monitoring_router, ""),  # 監視・メトリクス関連のエンドポイント
 ]
 
 # ルーターをアプリケーションに登録
@@ -1,19 +1,223 @@
-from logging import INFO, Formatter, Logger, StreamHandler
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from logging import INFO, Formatter, Handler, Logger, LogRecord, StreamHandler
 from logging import getLogger as _getLogger
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+
+def _parse_level(level: str | int, setting: str) -> int:
+    """ログレベルの名前を数値に変換する。不正な名前の場合は警告を出力して INFO を使う。"""
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(level.strip().upper())
+    if isinstance(value, int):
+        return value
+    # ハンドラーの設定前でも出力されるよう、標準の logging (最後の手段のハンドラー) で警告する
+    _getLogger(__name__).warning("Invalid log level %r in %s; falling back to INFO", level, setting)
+    return INFO
+
+
+# ログの設定
+# LOG_LEVEL: 全ロガーの最低レベル。getLogger で DEBUG を指定していても、これより詳細なログは出力しない
+# LOG_LEVELS: ロガーごとのレベル ("chatlog_router=DEBUG,database.queries=WARNING" の形式)
+# LOG_SAMPLING: ロガーごとに INFO 以下のログを出力する割合 ("chatlog_router=0.1" の形式)
+# LOG_FORMAT: text または json (構造化ログ)
+# LOG_MAX_MESSAGE: 1 行のメッセージの最大文字数 (超えた分は切り詰める)
+# LOG_ASYNC: ログの書き込みを別スレッドで行う (リクエストの処理スレッドで I/O を待たない)
+# LOG_QUEUE_SIZE: 書き込み待ちのログの上限 (超えた場合は破棄して件数を数える)
+LOG_LEVEL = _parse_level(os.getenv("LOG_LEVEL") or "INFO", "LOG_LEVEL")
+LOG_FORMAT = (os.getenv("LOG_FORMAT") or "text").lower()
+LOG_MAX_MESSAGE = int(os.getenv("LOG_MAX_MESSAGE") or 2000)
+LOG_ASYNC = (os.getenv("LOG_ASYNC") or "true").lower() in ("1", "true", "yes", "on")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE") or 10000)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord の標準の属性 (これ以外は extra で渡された構造化フィールドとして扱う)
+_RECORD_ATTRS = set(vars(LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def _parse_mapping(value: str | None) -> dict[str, str]:
+    mapping: dict[str, str] = {}
+    for item in (value or "").split(","):
+        name, sep, setting = item.partition("=")
+        if sep:
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+LOG_LEVELS = {
+    name: _parse_level(level, f"LOG_LEVELS ({name})") for name, level in _parse_mapping(os.getenv("LOG_LEVELS")).items()
+}
+LOG_SAMPLING = {name: float(rate) for name, rate in _parse_mapping(os.getenv("LOG_SAMPLING")).items()}
+
+
+class capped:
+    """
+    ログの引数を出力時にだけ文字列にし、limit 文字で切り詰める。
+    ログが出力されないレベルでは repr を計算しないため、会話履歴などの大きな値をそのまま渡せる。
+
+    Example:
+        logger.debug("AIモデルに渡すデータ: %s", capped(tagged_conversations))
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = 200) -> None:
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[: self.limit]}...(+{len(text) - self.limit} chars)"
+
+    __repr__ = __str__
+
+
+def _truncate(message: str) -> str:
+    if len(message) <= LOG_MAX_MESSAGE:
+        return message
+    return f"{message[:LOG_MAX_MESSAGE]}...(+{len(message) - LOG_MAX_MESSAGE} chars)"
+
+
+class SamplingFilter(logging.Filter):
+    """INFO 以下のログを rate の割合だけ通す。WARNING 以上は常に通す。"""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class TextFormatter(Formatter):
+    def __init__(self) -> None:
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record: LogRecord) -> str:
+        record.message = _truncate(record.message)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(Formatter):
+    """1 行 1 件の JSON で出力する。extra で渡したフィールドはそのまま含める。"""
+
+    def format(self, record: LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _truncate(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_exception_formatter = Formatter()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    書き込み待ちの上限を超えたログを破棄する QueueHandler。
+    標準の QueueHandler は満杯の場合にエラーを出力するため、ログの洪水で処理が止まらないよう破棄して数える。
+    """
+
+    def __init__(self, log_queue: "queue.Queue[LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # 引数を埋め込んだメッセージと例外のトレースバックだけをここで確定させる
+        # (書き込みスレッドで参照する時点で引数の値が変わっていないように)
+        # 日時の整形や JSON への変換、出力先への書き込みは書き込みスレッドで行う
+        record = copy.copy(record)
+        record.msg = record.message = _truncate(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Handler | None = None
+_listener: QueueListener | None = None
+_handler_lock = threading.Lock()
+
+
+def _create_output_handler() -> Handler:
+    # 標準出力用のハンドラーを作成
+    handler = StreamHandler()
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    return handler
+
+
+def get_handler() -> Handler:
+    """全ロガーで共有するハンドラーを返す。LOG_ASYNC が有効な場合は書き込みスレッドへのキューになる。"""
+    global _handler, _listener  # noqa: PLW0603
+    with _handler_lock:
+        if _handler is None:
+            output = _create_output_handler()
+            if LOG_ASYNC:
+                log_queue: queue.Queue[LogRecord] = queue.Queue(LOG_QUEUE_SIZE)
+                _handler = DroppingQueueHandler(log_queue)
+                _listener = QueueListener(log_queue, output, respect_handler_level=False)
+                _listener.start()
+                atexit.register(shutdown_logging)
+            else:
+                _handler = output
+        return _handler
+
+
+def shutdown_logging() -> None:
+    """書き込み待ちのログを出力してから書き込みスレッドを止める。"""
+    global _listener  # noqa: PLW0603
+    with _handler_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def logging_stats() -> dict[str, Any]:
+    handler = _handler
+    return {
+        "async": isinstance(handler, DroppingQueueHandler),
+        "queue_depth": handler.queue.qsize() if isinstance(handler, DroppingQueueHandler) else 0,
+        "dropped": handler.dropped if isinstance(handler, DroppingQueueHandler) else 0,
+    }
 
 
 def getLogger(name: str, level: str | int = INFO) -> Logger:
     logger = _getLogger(name)
     if not logger.handlers:
-        # 標準出力用のハンドラーを作成
-        handler = StreamHandler()
-        handler.setLevel(level)
-
-        # 一般的なフォーマットを設定
-        formatter = Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-        handler.setFormatter(formatter)
-
-        # ロガーにハンドラーを追加
-        logger.setLevel(level)
-        logger.addHandler(handler)
+        # LOG_LEVELS での指定を優先し、なければ呼び出し側の指定と LOG_LEVEL の詳細でない方を使う
+        if name in LOG_LEVELS:
+            effective = LOG_LEVELS[name]
+        else:
+            effective = max(_parse_level(level, f"getLogger ({name})"), LOG_LEVEL)
+        logger.setLevel(effective)
+        logger.addHandler(get_handler())
+        if name in LOG_SAMPLING:
+            logger.addFilter(SamplingFilter(LOG_SAMPLING[name]))
     return logger
@@ -0,0 +1,28 @@
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Engine
+from sqlmodel import SQLModel, create_engine
+
+# JWT のモジュールは読み込み時に設定を確認するため、テスト用の値を先に入れておく
+os.environ["SECRET_KEY"] = os.getenv("SECRET_KEY") or "test-secret-key"
+os.environ["ALGORITHM"] = os.getenv("ALGORITHM") or "HS256"
+
+from api.app import models  # noqa: E402, F401 (テーブル定義の登録)
+
+# 起動中のサーバーにリクエストを送る手動確認用のスクリプト (読み込むと通信が始まるため pytest では集めない)
+collect_ignore = ["test_app_endpoints.py", "test_streaming.py"]
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Iterator[Engine]:
+    """
+    テストごとの SQLite のエンジン。
+    DB 用のワーカースレッドからも同じデータベースを使えるよう、メモリではなくファイルに作成する。
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
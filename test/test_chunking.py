@@ -0,0 +1,53 @@
+from api.app.vector_store.chunking import chunk_document, document_hashes, hash_text, split_chunks
+
+CHUNK_SIZE = 40
+
+DOCUMENT = """# 入学
+入学式は4月に行います。
+
+# 授業
+授業は9時に始まります。
+昼休みは12時からです。
+
+# 部活動
+部活動は放課後に行います。
+"""
+
+
+def test_split_chunks_by_heading() -> None:
+    chunks = split_chunks(DOCUMENT, CHUNK_SIZE)
+    assert chunks == [
+        "# 入学\n入学式は4月に行います。",
+        "# 授業\n授業は9時に始まります。\n昼休みは12時からです。",
+        "# 部活動\n部活動は放課後に行います。",
+    ]
+
+
+def test_split_chunks_respects_size() -> None:
+    text = "# 長い節\n" + "あ" * (CHUNK_SIZE * 2 + 5) + "\n" + "い" * 10
+    chunks = split_chunks(text, CHUNK_SIZE)
+    assert all(len(chunk) <= CHUNK_SIZE for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+
+
+def test_hashes_ignore_line_endings_and_outer_whitespace() -> None:
+    assert hash_text(DOCUMENT) == hash_text("\n  " + DOCUMENT.replace("\n", "\r\n") + "  \n")
+    assert document_hashes(DOCUMENT) == document_hashes(DOCUMENT.replace("\n", "\r\n"))
+
+
+def test_editing_one_section_keeps_other_chunk_hashes() -> None:
+    edited = DOCUMENT.replace("授業は9時に始まります。", "授業は8時50分に始まります。")
+    before = [chunk.hash for chunk in chunk_document(DOCUMENT, CHUNK_SIZE)]
+    after = [chunk.hash for chunk in chunk_document(edited, CHUNK_SIZE)]
+    assert before[0] == after[0]
+    assert before[1] != after[1]
+    assert before[2] == after[2]
+
+
+def test_document_hashes_change_only_for_edited_section() -> None:
+    edited = DOCUMENT.replace("部活動は放課後に行います。", "部活動は休日にも行います。")
+    document_hash, chunk_hashes = document_hashes(DOCUMENT)
+    edited_hash, edited_chunk_hashes = document_hashes(edited)
+    assert document_hash != edited_hash
+    unchanged = set(chunk_hashes.split(",")) & set(edited_chunk_hashes.split(","))
+    assert len(unchanged) == len(chunk_hashes.split(",")) - 1
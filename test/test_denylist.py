@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from fastapi import status
+
+from api.app.security.denylist import BloomFilter, DenylistFullError, TokenDenylist
+
+NOW = 1_700_000_000.0
+TTL = 60.0
+CAPACITY = 3
+
+
+class Clock:
+    def __init__(self, now: float) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock(NOW)
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter(100, 0.01)
+    items = [f"jti-{i}" for i in range(100)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    bloom.clear()
+    assert not any(item in bloom for item in items)
+
+
+def test_added_jti_is_denied_until_expiry(clock: Clock) -> None:
+    denylist = TokenDenylist(capacity=CAPACITY)
+    denylist.add("a", NOW + TTL)
+    assert "a" in denylist
+    assert "b" not in denylist
+    clock.now = NOW + TTL
+    assert "a" not in denylist
+
+
+def test_already_expired_jti_is_ignored(clock: Clock) -> None:
+    denylist = TokenDenylist(capacity=CAPACITY)
+    denylist.add("a", NOW)
+    assert "a" not in denylist
+    assert denylist.stats()["revoked"] == 0
+
+
+def test_evicts_only_expired_jti_when_full(clock: Clock) -> None:
+    denylist = TokenDenylist(capacity=CAPACITY)
+    for i in range(CAPACITY):
+        denylist.add(f"jti-{i}", NOW + TTL + i)
+    clock.now = NOW + TTL
+    denylist.add("new", NOW + TTL * 2)
+    assert "jti-0" not in denylist
+    assert "jti-1" in denylist
+    assert "new" in denylist
+    stats = denylist.stats()
+    assert stats["size"] == CAPACITY
+    assert stats["evictions"] == 1
+
+
+def test_rejects_new_jti_when_full_of_live_entries(clock: Clock) -> None:
+    denylist = TokenDenylist(capacity=CAPACITY)
+    for i in range(CAPACITY):
+        denylist.add(f"jti-{i}", NOW + TTL + i)
+    with pytest.raises(DenylistFullError) as e:
+        denylist.add("new", NOW + TTL * 2)
+    assert e.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert e.value.headers == {"Retry-After": str(int(TTL))}
+    # 失効させたトークンは有効なまま捨てられない
+    assert all(f"jti-{i}" in denylist for i in range(CAPACITY))
+    assert "new" not in denylist
+    assert denylist.stats()["overflows"] == 1
+    # 既にある jti の有効期限の更新は拒否しない
+    denylist.add("jti-0", NOW + TTL * 2)
+    clock.now = NOW + TTL + 1
+    assert "jti-0" in denylist
+
+
+def test_purge_drops_expired_jti(clock: Clock) -> None:
+    denylist = TokenDenylist(capacity=CAPACITY)
+    denylist.add("short", NOW + TTL)
+    denylist.add("long", NOW + TTL * 2)
+    clock.now = NOW + TTL
+    denylist.purge()
+    assert denylist.stats()["size"] == 1
+    assert "long" in denylist
+    assert "short" not in denylist
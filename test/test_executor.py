@@ -0,0 +1,79 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+from fastapi import status
+
+from api.app.executor import BoundedExecutor, PoolSaturatedError
+
+WORKERS = 1
+QUEUE = 1
+
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+
+
+def make_executor() -> BoundedExecutor:
+    return BoundedExecutor("test", WORKERS, QUEUE, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def test_run_returns_result() -> None:
+    executor = make_executor()
+    try:
+        assert asyncio.run(executor.run(sum, [1, 2, 3])) == sum([1, 2, 3])
+    finally:
+        executor.shutdown()
+
+
+def test_rejects_beyond_workers_plus_queue() -> None:
+    executor = make_executor()
+    release = threading.Event()
+
+    async def run() -> None:
+        running = [executor.submit(release.wait) for _ in range(executor.capacity)]
+        with pytest.raises(PoolSaturatedError) as e:
+            executor.submit(release.wait)
+        assert e.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert e.value.headers == {"Retry-After": "1"}
+        release.set()
+        await asyncio.gather(*running)
+
+    try:
+        asyncio.run(run())
+        snapshot = executor.snapshot()
+        assert snapshot["rejected"] == 1
+        assert snapshot["completed"] == executor.capacity
+        assert snapshot["queue_depth"] == 0
+    finally:
+        executor.shutdown()
+
+
+def test_capacity_is_released_after_failure() -> None:
+    executor = make_executor()
+
+    def fail() -> None:
+        raise ValueError("boom")
+
+    async def run() -> None:
+        for _ in range(executor.capacity + 1):
+            with pytest.raises(ValueError):
+                await executor.run(fail)
+
+    try:
+        asyncio.run(run())
+        assert executor.snapshot()["rejected"] == 0
+    finally:
+        executor.shutdown()
+
+
+def test_context_variables_reach_the_worker() -> None:
+    executor = make_executor()
+
+    async def run() -> str:
+        request_id.set("req-1")
+        return await executor.run(request_id.get)
+
+    try:
+        assert asyncio.run(run()) == "req-1"
+    finally:
+        executor.shutdown()
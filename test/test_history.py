@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+from api.app.chat.history import estimate_tokens, load_recent_history, trim_conversations
+from api.app.models import ChatLog
+
+SESSION_ID = 1
+OTHER_SESSION_ID = 2
+TURNS = 5
+START = datetime(2024, 6, 30, 9, 0, 0)
+
+
+def add_turns(engine: Engine, session_id: int, count: int, same_time: bool = False) -> None:
+    with Session(engine) as session:
+        for i in range(count):
+            pub_data = START if same_time else START + timedelta(minutes=i)
+            session.add(ChatLog(message=f"q{i}", bot_reply=f"a{i}", pub_data=pub_data, session_id=session_id))
+        session.commit()
+
+
+def test_loads_latest_turns_oldest_first(engine: Engine) -> None:
+    add_turns(engine, SESSION_ID, TURNS)
+    add_turns(engine, OTHER_SESSION_ID, TURNS)
+    history = asyncio.run(load_recent_history(engine, SESSION_ID, max_turns=2, max_tokens=0))
+    assert history == [("human", "q3"), ("ai", "a3"), ("human", "q4"), ("ai", "a4")]
+
+
+def test_same_timestamp_is_ordered_by_id(engine: Engine) -> None:
+    add_turns(engine, SESSION_ID, TURNS, same_time=True)
+    history = asyncio.run(load_recent_history(engine, SESSION_ID, max_turns=2, max_tokens=0))
+    assert [text for role, text in history if role == "human"] == ["q3", "q4"]
+
+
+def test_zero_turns_loads_everything(engine: Engine) -> None:
+    add_turns(engine, SESSION_ID, TURNS)
+    history = asyncio.run(load_recent_history(engine, SESSION_ID, max_turns=0, max_tokens=0))
+    assert len(history) == TURNS * 2
+    assert history[0] == ("human", "q0")
+
+
+def test_token_budget_keeps_newest_turns(engine: Engine) -> None:
+    add_turns(engine, SESSION_ID, TURNS)
+    per_turn = estimate_tokens("q0") + estimate_tokens("a0")
+    history = asyncio.run(load_recent_history(engine, SESSION_ID, max_turns=0, max_tokens=per_turn * 2))
+    assert history == [("human", "q3"), ("ai", "a3"), ("human", "q4"), ("ai", "a4")]
+
+
+def test_trim_conversations_matches_loader_window() -> None:
+    conversations = [entry for i in range(TURNS) for entry in (("human", f"q{i}"), ("ai", f"a{i}"))]
+    assert trim_conversations(conversations, max_turns=2, max_tokens=0) == conversations[-4:]
+    # 返信のない往復も 1 往復として数える
+    conversations.append(("human", "q5"))
+    assert trim_conversations(conversations, max_turns=2, max_tokens=0) == conversations[-3:]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from api.app.chat.history_cache import FakeKeyValueClient, HistoryCache, LocalHistoryCache, SharedHistoryCache
+
+SESSION_ID = 1
+TURN = [("human", "q"), ("ai", "a")]
+NEXT_TURN = [("human", "q2"), ("ai", "a2")]
+
+
+@pytest.fixture(params=["local", "shared"])
+def cache(request: pytest.FixtureRequest) -> HistoryCache:
+    if request.param == "local":
+        return LocalHistoryCache(maxsize=16, ttl=60)
+    return SharedHistoryCache(FakeKeyValueClient(), ttl=60)
+
+
+def test_append_extends_cached_history(cache: HistoryCache) -> None:
+    async def run() -> None:
+        assert await cache.set(SESSION_ID, TURN, await cache.generation(SESSION_ID))
+        await cache.append(SESSION_ID, NEXT_TURN)
+        assert await cache.get(SESSION_ID) == TURN + NEXT_TURN
+
+    asyncio.run(run())
+
+
+def test_append_on_miss_does_not_create_entry(cache: HistoryCache) -> None:
+    async def run() -> None:
+        await cache.append(SESSION_ID, TURN)
+        assert await cache.get(SESSION_ID) is None
+
+    asyncio.run(run())
+
+
+def test_stale_load_is_not_stored_after_concurrent_append(cache: HistoryCache) -> None:
+    async def run() -> None:
+        # ミス → 世代を控えて DB から読み込み中に、別のリクエストが往復を保存して追記する
+        generation = await cache.generation(SESSION_ID)
+        await cache.append(SESSION_ID, NEXT_TURN)
+        assert not await cache.set(SESSION_ID, TURN, generation)
+        assert await cache.get(SESSION_ID) is None
+        # 追記の後に読み込み直した履歴は保存できる
+        assert await cache.set(SESSION_ID, TURN + NEXT_TURN, await cache.generation(SESSION_ID))
+        assert await cache.get(SESSION_ID) == TURN + NEXT_TURN
+
+    asyncio.run(run())
+
+
+def test_stale_load_is_not_stored_after_invalidate(cache: HistoryCache) -> None:
+    async def run() -> None:
+        generation = await cache.generation(SESSION_ID)
+        await cache.invalidate(SESSION_ID)
+        assert not await cache.set(SESSION_ID, TURN, generation)
+
+    asyncio.run(run())
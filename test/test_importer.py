@@ -0,0 +1,138 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi import HTTPException, status
+from sqlalchemy import Engine
+
+from api.app.school_info import importer
+from api.app.school_info.importer import ImportItem, import_batches, import_school_infos, parse_import
+from api.app.vector_store import outbox
+
+ITEM = {"title": "本校設立年", "contents": "本校は2024年に設立されました。"}
+MAX_ITEMS = 2
+MAX_CHARS = 10
+MAX_BYTES = 200
+
+
+def make_zip(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def assert_http_error(body: bytes, content_type: str, status_code: int) -> None:
+    with pytest.raises(HTTPException) as e:
+        parse_import(body, content_type)
+    assert e.value.status_code == status_code
+
+
+def test_json_items_are_validated_one_by_one() -> None:
+    body = json.dumps([ITEM, {"title": "内容なし"}]).encode()
+
+    valid, invalid = parse_import(body, "application/json; charset=utf-8")
+
+    assert valid.data is not None
+    assert valid.data.title == ITEM["title"]
+    assert (invalid.index, invalid.data) == (1, None)
+    assert invalid.error is not None
+    assert "contents" in invalid.error
+
+
+def test_invalid_json_bodies_are_rejected() -> None:
+    assert_http_error(b"[{", "application/json", status.HTTP_400_BAD_REQUEST)
+    assert_http_error(json.dumps(ITEM).encode(), "application/json", status.HTTP_400_BAD_REQUEST)
+    assert_http_error(b"title,contents", "text/csv", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+def test_ndjson_reports_broken_lines_as_error_items() -> None:
+    body = "\n".join([json.dumps(ITEM), "", "{broken", json.dumps({"title": "x"})]).encode()
+
+    items = parse_import(body, "application/x-ndjson")
+
+    # 空行は数えず、解析できない行も 1 件として結果に含める
+    assert [item.index for item in items] == [0, 1, 2]
+    assert items[0].data is not None
+    assert items[1].error is not None
+    assert items[1].error.startswith("JSON を解析できません")
+    assert items[2].data is None
+
+
+def test_zip_of_markdown_files() -> None:
+    body = make_zip(
+        {
+            "b/no_heading.md": "見出しのない本文".encode(),
+            "a/with_heading.md": "# 学校の沿革\n本文".encode(),
+            "image.png": b"\x89PNG",
+            "c/latin1.md": "caf\xe9".encode("latin-1"),
+        }
+    )
+
+    items = parse_import(body, "application/zip")
+
+    # Markdown 以外は無視し、ファイル名の順に並べる
+    assert [item.source for item in items] == ["a/with_heading.md", "b/no_heading.md", "c/latin1.md"]
+    assert [item.data.title if item.data else None for item in items] == ["学校の沿革", "no_heading", None]
+    assert items[2].error == "UTF-8 のテキストではありません"
+
+
+def test_broken_zip_is_rejected() -> None:
+    assert_http_error(b"not a zip", "application/zip", status.HTTP_400_BAD_REQUEST)
+
+
+def test_size_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(importer, "IMPORT_MAX_BYTES", MAX_BYTES)
+    assert_http_error(b" " * (MAX_BYTES + 1), "application/json", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    # zip は展開後の合計サイズで判定する
+    compressed = make_zip({"large.md": b"a" * (MAX_BYTES * 5)})
+    assert len(compressed) <= importer.IMPORT_MAX_BYTES
+    assert_http_error(compressed, "application/zip", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+def test_item_count_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(importer, "IMPORT_MAX_ITEMS", MAX_ITEMS)
+    body = json.dumps([ITEM] * (MAX_ITEMS + 1)).encode()
+    assert_http_error(body, "application/json", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+def items_with_contents(*lengths: int) -> list[ImportItem]:
+    body = json.dumps([{"title": f"t{i}", "contents": "a" * length} for i, length in enumerate(lengths)]).encode()
+    return parse_import(body, "application/json")
+
+
+def test_import_batches_respects_item_and_char_limits() -> None:
+    def batch_indexes(*lengths: int) -> list[list[int]]:
+        batches = import_batches(items_with_contents(*lengths), max_items=MAX_ITEMS, max_chars=MAX_CHARS)
+        return [[item.index for item in batch] for batch in batches]
+
+    assert batch_indexes(1, 1, 1, 1, 1) == [[0, 1], [2, 3], [4]]
+    assert batch_indexes(6, 5, 4) == [[0], [1, 2]]
+    # 1 件で上限を超える場合も、単独のバッチにする
+    assert batch_indexes(1, MAX_CHARS + 1, 1) == [[0], [1], [2]]
+    assert batch_indexes() == []
+
+
+def test_import_streams_one_result_per_item(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    async def sync(source_id: int, record: object, metadata_only: bool = False) -> None:
+        if record is not None and getattr(record, "title", None) == "同期に失敗":
+            raise RuntimeError("vector store is unavailable")
+
+    monkeypatch.setattr(outbox, "sync_school_info", sync)
+    body = "\n".join([json.dumps(ITEM), "{broken", json.dumps({**ITEM, "title": "同期に失敗"})]).encode()
+
+    async def run() -> list[dict]:
+        items = parse_import(body, "application/x-ndjson")
+        return [json.loads(line) async for line in import_school_infos(engine, items, "user-1")]
+
+    events = asyncio.run(run())
+
+    results = sorted((event["data"] for event in events if event["type"] == "item"), key=lambda data: data["index"])
+    assert [result["status"] for result in results] == ["indexed", "invalid", "queued"]
+    assert events[-1] == {
+        "type": "done",
+        "data": {"total": 3, "invalid": 1, "error": 0, "indexed": 1, "queued": 1},
+    }
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import status
+
+from api.app.chat.limiter import AIQueueFullError, AIQueueTimeoutError, FairLimiter
+
+TIMEOUT = 5.0
+SHORT_TIMEOUT = 0.05
+MAX_QUEUED = 2
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_grants_round_robin_across_users() -> None:
+    limiter = FairLimiter(1, TIMEOUT, max_queued_per_user=10)
+    order: list[str] = []
+
+    async def request(user_id: str) -> None:
+        async with limiter.slot(user_id):
+            order.append(user_id)
+            await asyncio.sleep(0)
+
+    async def run() -> None:
+        await limiter.acquire("holder")
+        # a が先に 3 件並んでも、b と c は a の 2 件目より先に実行される
+        tasks = [asyncio.create_task(request(user_id)) for user_id in ["a", "a", "a", "b", "c"]]
+        await settle()
+        assert limiter.waiting == len(tasks)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["a", "b", "c", "a", "a"]
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_rejects_when_user_queue_is_full() -> None:
+    limiter = FairLimiter(1, TIMEOUT, MAX_QUEUED)
+
+    async def run() -> None:
+        await limiter.acquire("holder")
+        waiters = [asyncio.create_task(limiter.acquire("a")) for _ in range(MAX_QUEUED)]
+        await settle()
+        with pytest.raises(AIQueueFullError) as e:
+            await limiter.acquire("a")
+        assert e.value.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        # 他のユーザーは並べる
+        other = asyncio.create_task(limiter.acquire("b"))
+        await settle()
+        assert limiter.waiting == MAX_QUEUED + 1
+        for task in [*waiters, other]:
+            task.cancel()
+        await asyncio.gather(*waiters, other, return_exceptions=True)
+
+    asyncio.run(run())
+    assert limiter.stats()["rejected"] == 1
+    assert limiter.waiting == 0
+
+
+def test_times_out_with_retry_after() -> None:
+    limiter = FairLimiter(1, SHORT_TIMEOUT, MAX_QUEUED)
+
+    async def run() -> None:
+        await limiter.acquire("holder")
+        with pytest.raises(AIQueueTimeoutError) as e:
+            await limiter.acquire("a")
+        assert e.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert "Retry-After" in e.value.headers
+
+    asyncio.run(run())
+    assert limiter.stats()["timeouts"] == 1
+    assert limiter.waiting == 0
+
+
+def test_cancelled_waiter_does_not_leak_slot() -> None:
+    limiter = FairLimiter(1, TIMEOUT, MAX_QUEUED)
+
+    async def run() -> None:
+        await limiter.acquire("holder")
+        waiter = asyncio.create_task(limiter.acquire("a"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        # 枠は空いているため、次の呼び出しはすぐに通る
+        await asyncio.wait_for(limiter.acquire("b"), SHORT_TIMEOUT)
+        limiter.release()
+
+    asyncio.run(run())
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import pytest
+
+from api.app.vector_store.chunking import chunk_document
+from api.app.vector_store.embeddings import HashingEmbedder
+from api.app.vector_store.local_index import LocalVectorIndex
+
+MODEL = "hashing-64"
+DIM = 64
+CHUNK_SIZE = 40
+EVENT_ID = 3
+
+ENTRANCE = "# 入学\n入学式は4月に行います。\n\n# 授業\n授業は9時に始まります。"
+CLUB = "# 部活動\n部活動は放課後に行います。"
+
+
+def make_index(path: Path | None = None) -> LocalVectorIndex:
+    return LocalVectorIndex(HashingEmbedder(DIM), MODEL, str(path) if path else None)
+
+
+def upsert(index: LocalVectorIndex, source_id: int, title: str, text: str) -> int:
+    return index.upsert_chunks(source_id, title, chunk_document(text, CHUNK_SIZE))
+
+
+@pytest.fixture
+def index() -> LocalVectorIndex:
+    index = make_index()
+    upsert(index, 1, "入学", ENTRANCE)
+    upsert(index, 2, "部活動", CLUB)
+    return index
+
+
+def test_upsert_embeds_only_new_chunks(index: LocalVectorIndex) -> None:
+    assert index.stats()["chunks"] == len(chunk_document(ENTRANCE, CHUNK_SIZE)) + 1
+    assert upsert(index, 1, "入学", ENTRANCE) == 0
+    edited = ENTRANCE.replace("9時", "8時50分")
+    assert upsert(index, 1, "入学", edited) == 1
+    assert index.source_hashes(1) == {chunk.hash for chunk in chunk_document(edited, CHUNK_SIZE)}
+
+
+def test_search_returns_best_chunk_per_source(index: LocalVectorIndex) -> None:
+    hits = index.search("部活動は放課後", 2)
+    assert [hit.source_id for hit in hits] == [2, 1]
+    assert hits[0].title == "部活動"
+    assert hits[0].score > hits[1].score
+
+
+def test_delete_removes_source(index: LocalVectorIndex) -> None:
+    index.delete_document_by_source_id(1)
+    assert index.source_ids() == {2}
+    assert [hit.source_id for hit in index.search("入学式", 2)] == [2]
+
+
+def test_upsert_skips_sources_deleted_after_mark(index: LocalVectorIndex) -> None:
+    mark = index.deletion_mark()
+    index.delete_document_by_source_id(2)
+    index.upsert_many([(2, "部活動", chunk_document(CLUB, CHUNK_SIZE))], mark)
+    assert index.source_ids() == {1}
+    # 削除の後に取得した通し番号であれば追加できる
+    index.upsert_many([(2, "部活動", chunk_document(CLUB, CHUNK_SIZE))], index.deletion_mark())
+    assert index.source_ids() == {1, 2}
+
+
+def test_source_deleted_while_embedding_is_not_re_added(index: LocalVectorIndex) -> None:
+    embed = index.embedder.embed_documents
+
+    def embed_and_delete(texts: list[str]) -> list[list[float]]:
+        index.delete_document_by_source_id(EVENT_ID)
+        return embed(texts)
+
+    index.embedder.embed_documents = embed_and_delete  # type: ignore[method-assign]
+    upsert(index, EVENT_ID, "行事", "# 行事\n文化祭は10月です。")
+    assert EVENT_ID not in index.source_ids()
+
+
+def test_save_and_load(tmp_path: Path, index: LocalVectorIndex) -> None:
+    index.path = tmp_path
+    assert index.save()
+    assert not index.save()
+
+    loaded = make_index(tmp_path)
+    assert loaded.load()
+    assert loaded.source_ids() == {1, 2}
+    assert loaded.stats()["memory_mapped"]
+    assert loaded.search("部活動は放課後", 1) == index.search("部活動は放課後", 1)
+
+    # 読み込んだ行列はメモリマップのまま変更せず、最初の変更でコピーする
+    loaded.delete_document_by_source_id(2)
+    assert not loaded.stats()["memory_mapped"]
+    assert loaded.source_ids() == {1}
+
+
+def test_load_ignores_other_model(tmp_path: Path, index: LocalVectorIndex) -> None:
+    index.path = tmp_path
+    index.save()
+    other = LocalVectorIndex(HashingEmbedder(DIM), "other-model", str(tmp_path))
+    assert not other.load()
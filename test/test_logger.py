@@ -0,0 +1,20 @@
+import logging
+
+import pytest
+
+from api.logger import _parse_level, getLogger
+
+
+def test_parse_level_accepts_names_and_numbers() -> None:
+    assert _parse_level(" debug ", "LOG_LEVEL") == logging.DEBUG
+    assert _parse_level(logging.WARNING, "LOG_LEVEL") == logging.WARNING
+
+
+def test_invalid_level_falls_back_to_info(caplog: pytest.LogCaptureFixture) -> None:
+    with caplog.at_level(logging.WARNING, logger="api.logger"):
+        assert _parse_level("verbose", "LOG_LEVEL") == logging.INFO
+    assert "Invalid log level 'verbose' in LOG_LEVEL" in caplog.text
+
+
+def test_get_logger_with_invalid_level_does_not_raise() -> None:
+    assert getLogger("test_logger.invalid", "verbose").level >= logging.INFO
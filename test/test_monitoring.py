@@ -0,0 +1,62 @@
+from collections.abc import Iterator
+
+import pytest
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine
+from sqlmodel import Session as DBSession
+
+from api.app.database.engine import get_engine
+from api.app.models import User
+from api.app.routers import monitoring
+from api.app.security.jwt_token import create_access_token
+from api.app.security.principal import build_token_claims, principal_cache
+from api.app.security.role import Role
+
+METRICS_TOKEN = "metrics-token"
+
+
+@pytest.fixture
+def client(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    # 出力内容ではなく認証を確認するため、共有エンジンなどを読み取る集計は行わない
+    monkeypatch.setattr(monitoring.registry, "render", lambda: "# metrics\n")
+    app = FastAPI()
+    app.include_router(monitoring.router)
+    app.dependency_overrides[get_engine] = lambda: engine
+    principal_cache.clear()
+    with TestClient(app) as client:
+        yield client
+    principal_cache.clear()
+
+
+def bearer(engine: Engine, authority: Role) -> dict[str, str]:
+    user = User(email=f"{authority.value}@example.com", password="hashed-password", authority=authority)
+    with DBSession(engine, expire_on_commit=False) as db:
+        db.add(user)
+        db.commit()
+    return {"Authorization": f"Bearer {create_access_token(build_token_claims(user))}"}
+
+
+def test_metrics_require_admin_by_default(client: TestClient, engine: Engine) -> None:
+    assert client.get("/metrics").status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.get("/metrics", headers=bearer(engine, Role.STUDENT)).status_code == status.HTTP_403_FORBIDDEN
+
+    response = client.get("/metrics", headers=bearer(engine, Role.ADMIN))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.text == "# metrics\n"
+
+
+def test_metrics_token_replaces_user_auth(
+    client: TestClient, engine: Engine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(monitoring, "METRICS_TOKEN", METRICS_TOKEN)
+
+    headers = {"Authorization": f"Bearer {METRICS_TOKEN}"}
+    assert client.get("/metrics", headers=headers).status_code == status.HTTP_200_OK
+    assert client.get("/metrics", headers=bearer(engine, Role.ADMIN)).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_anonymous_access_needs_explicit_opt_in(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(monitoring, "METRICS_ALLOW_ANONYMOUS", True)
+
+    assert client.get("/metrics").status_code == status.HTTP_200_OK
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Engine
+from sqlmodel import Session as DBSession
+from sqlmodel import select
+
+from api.app.models import VectorStoreOutbox
+from api.app.vector_store import outbox
+from api.app.vector_store.outbox import (
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE,
+    OUTBOX_RETRY_MAX,
+    dispatch_outbox,
+    outbox_backlog,
+    outbox_record,
+    retry_delay,
+)
+
+SOURCE_ID = 1
+OTHER_SOURCE_ID = 2
+
+
+class FakeSync:
+    """sync_school_info の代わりに呼び出しを記録し、fail に含まれる学校情報では失敗する。"""
+
+    def __init__(self, fail: set[int] | None = None) -> None:
+        self.fail = fail or set()
+        self.calls: list[tuple[int, bool]] = []
+
+    async def __call__(self, source_id: int, record: object, metadata_only: bool = False) -> None:
+        self.calls.append((source_id, metadata_only))
+        if source_id in self.fail:
+            raise RuntimeError("vector store is unavailable")
+
+
+@pytest.fixture
+def fake_sync(monkeypatch: pytest.MonkeyPatch) -> FakeSync:
+    fake = FakeSync()
+    monkeypatch.setattr(outbox, "sync_school_info", fake)
+    return fake
+
+
+def add_rows(engine: Engine, *rows: VectorStoreOutbox) -> None:
+    with DBSession(engine) as db:
+        db.add_all(rows)
+        db.commit()
+
+
+def outbox_rows(engine: Engine) -> list[VectorStoreOutbox]:
+    with DBSession(engine) as db:
+        return list(db.exec(select(VectorStoreOutbox).order_by(VectorStoreOutbox.id)).all())
+
+
+def make_due(engine: Engine) -> None:
+    # 再試行の待ち時間を経過させる
+    with DBSession(engine) as db:
+        for row in db.exec(select(VectorStoreOutbox)).all():
+            row.available_at = datetime.now()
+            db.add(row)
+        db.commit()
+
+
+def test_retry_delay_doubles_up_to_the_maximum() -> None:
+    assert retry_delay(1) == OUTBOX_RETRY_BASE
+    assert retry_delay(2) == OUTBOX_RETRY_BASE * 2
+    assert retry_delay(3) == OUTBOX_RETRY_BASE * 4
+    assert retry_delay(100) == OUTBOX_RETRY_MAX
+
+
+def test_rows_of_a_source_are_synced_once_and_deleted(engine: Engine, fake_sync: FakeSync) -> None:
+    add_rows(
+        engine,
+        outbox_record(SOURCE_ID, metadata_only=True),
+        outbox_record(SOURCE_ID),
+        outbox_record(OTHER_SOURCE_ID, metadata_only=True),
+    )
+
+    assert asyncio.run(dispatch_outbox(engine)) == len({SOURCE_ID, OTHER_SOURCE_ID})
+
+    # 内容の変更を含む場合はチャンクの同期、タイトルのみの場合はメタデータの更新にまとめる
+    assert sorted(fake_sync.calls) == [(SOURCE_ID, False), (OTHER_SOURCE_ID, True)]
+    assert outbox_rows(engine) == []
+
+
+def test_failure_is_retried_with_backoff(engine: Engine, fake_sync: FakeSync) -> None:
+    fake_sync.fail = {SOURCE_ID}
+    add_rows(engine, outbox_record(SOURCE_ID), outbox_record(OTHER_SOURCE_ID))
+    started = datetime.now()
+
+    assert asyncio.run(dispatch_outbox(engine)) == 1
+
+    (row,) = outbox_rows(engine)
+    assert row.source_id == SOURCE_ID
+    assert row.attempts == 1
+    assert row.last_error == "vector store is unavailable"
+    assert (row.available_at - started).total_seconds() >= retry_delay(1)
+    # 待ち時間が経過するまでは再試行しない
+    calls = len(fake_sync.calls)
+    assert asyncio.run(dispatch_outbox(engine)) == 0
+    assert len(fake_sync.calls) == calls
+
+    fake_sync.fail = set()
+    make_due(engine)
+    assert asyncio.run(dispatch_outbox(engine)) == 1
+    assert outbox_rows(engine) == []
+
+
+def test_row_is_abandoned_after_max_attempts(engine: Engine, fake_sync: FakeSync) -> None:
+    fake_sync.fail = {SOURCE_ID}
+    add_rows(engine, outbox_record(SOURCE_ID))
+
+    for _ in range(OUTBOX_MAX_ATTEMPTS):
+        asyncio.run(dispatch_outbox(engine))
+        make_due(engine)
+    assert len(fake_sync.calls) == OUTBOX_MAX_ATTEMPTS
+
+    # 上限に達したレコードは残したまま再試行しない
+    asyncio.run(dispatch_outbox(engine))
+    assert len(fake_sync.calls) == OUTBOX_MAX_ATTEMPTS
+    backlog = asyncio.run(outbox_backlog(engine))
+    assert backlog["pending"] == 0
+    assert backlog["dead"] == 1
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, status
+from sqlmodel import select
+
+from api.app.database.pagination import apply_keyset, decode_cursor, encode_cursor
+from api.app.models import SchoolInfo
+
+RECORD_ID = 42
+
+
+def make_record(**fields: object) -> SchoolInfo:
+    values = {"id": RECORD_ID, "title": "本校設立年", "contents": "本文", "created_by": "user"}
+    values.update(fields)
+    return SchoolInfo(**values)
+
+
+def test_cursor_round_trip_without_order_by() -> None:
+    cursor = encode_cursor(None, make_record())
+    assert decode_cursor(cursor, None) == (None, RECORD_ID)
+
+
+def test_cursor_round_trip_with_string() -> None:
+    cursor = encode_cursor("title", make_record())
+    assert decode_cursor(cursor, "title") == ("本校設立年", RECORD_ID)
+
+
+def test_cursor_round_trip_with_datetime() -> None:
+    pub_date = datetime(2024, 6, 30, 8, 0, 0, 123456)
+    cursor = encode_cursor("pub_date", make_record(pub_date=pub_date))
+    value, last_id = decode_cursor(cursor, "pub_date")
+    assert value == pub_date
+    assert isinstance(value, datetime)
+    assert last_id == RECORD_ID
+
+
+def test_cursor_is_url_safe() -> None:
+    cursor = encode_cursor("title", make_record(title="?&/+=" * 10))
+    assert all(c.isalnum() or c in "-_" for c in cursor)
+
+
+def test_cursor_rejects_different_order_by() -> None:
+    cursor = encode_cursor("title", make_record())
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, "pub_date")
+    assert e.value.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90IGpzb24", "eyJvIjpudWxsfQ"])
+def test_cursor_rejects_garbage(cursor: str) -> None:
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, None)
+    assert e.value.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_apply_keyset_orders_by_column_then_id() -> None:
+    stmt = apply_keyset(select(SchoolInfo), SchoolInfo, "title", None, "sqlite")
+    sql = str(stmt.compile())
+    assert "ORDER BY schoolinfo.title ASC, schoolinfo.id" in sql
+    assert "WHERE" not in sql
+
+
+def test_apply_keyset_continues_after_cursor() -> None:
+    cursor = encode_cursor("title", make_record())
+    stmt = apply_keyset(select(SchoolInfo), SchoolInfo, "title", cursor, "sqlite")
+    params = stmt.compile().params
+    assert "本校設立年" in params.values()
+    assert RECORD_ID in params.values()
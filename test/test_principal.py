@@ -0,0 +1,155 @@
+import asyncio
+from collections.abc import Iterator
+
+import pytest
+from fastapi import HTTPException, status
+from sqlalchemy import Engine
+from sqlmodel import Session as DBSession
+
+from api.app.models import User
+from api.app.security.jwt_token import create_access_token, get_current_user
+from api.app.security.principal import (
+    UserPrincipal,
+    build_token_claims,
+    invalidate_principal,
+    principal_cache,
+    token_version_cache,
+)
+from api.app.security.role import Role
+
+EMAIL = "user@example.com"
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> Iterator[None]:
+    principal_cache.clear()
+    token_version_cache.clear()
+    yield
+    principal_cache.clear()
+    token_version_cache.clear()
+
+
+@pytest.fixture
+def user(engine: Engine) -> User:
+    user = User(name="before", email=EMAIL, password="hashed-password", authority=Role.STUDENT)
+    with DBSession(engine, expire_on_commit=False) as db:
+        db.add(user)
+        db.commit()
+    return user
+
+
+def update_user(engine: Engine, user_id: str, **values: object) -> None:
+    with DBSession(engine) as db:
+        record = db.get(User, user_id)
+        assert record is not None
+        for key, value in values.items():
+            setattr(record, key, value)
+        db.add(record)
+        db.commit()
+
+
+def current_user(engine: Engine, token: str) -> UserPrincipal:
+    return asyncio.run(get_current_user(token, engine))
+
+
+def test_cached_principal_is_reused_until_invalidated(engine: Engine, user: User) -> None:
+    token = create_access_token({"sub": EMAIL, "user_id": user.id})
+    assert current_user(engine, token).name == "before"
+
+    # キャッシュにある間はデータベースの変更を参照しない
+    update_user(engine, user.id, name="after")
+    assert current_user(engine, token).name == "before"
+
+    invalidate_principal(user.id)
+    assert current_user(engine, token).name == "after"
+
+
+def test_token_version_bump_revokes_issued_tokens(engine: Engine, user: User) -> None:
+    token = create_access_token(build_token_claims(user))
+    assert current_user(engine, token).authority == Role.STUDENT
+
+    # 権限の変更時は token_version を増やし、キャッシュを破棄する
+    update_user(engine, user.id, authority=Role.ADMIN, token_version=user.token_version + 1)
+    invalidate_principal(user.id)
+
+    with pytest.raises(HTTPException) as e:
+        current_user(engine, token)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+    user.token_version += 1
+    user.authority = Role.ADMIN
+    assert current_user(engine, create_access_token(build_token_claims(user))).authority == Role.ADMIN
+
+
+def test_cached_principal_is_not_used_for_another_email(engine: Engine, user: User) -> None:
+    current_user(engine, create_access_token({"sub": EMAIL, "user_id": user.id}))
+
+    with pytest.raises(HTTPException) as e:
+        current_user(engine, create_access_token({"sub": "other@example.com", "user_id": user.id}))
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_deleted_user_is_rejected_after_invalidation(engine: Engine, user: User) -> None:
+    token = create_access_token({"sub": EMAIL, "user_id": user.id})
+    current_user(engine, token)
+
+    with DBSession(engine) as db:
+        db.delete(db.get(User, user.id))
+        db.commit()
+    invalidate_principal(user.id)
+
+    with pytest.raises(HTTPException) as e:
+        current_user(engine, token)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.fixture
+def stateless(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("api.app.security.jwt_token.AUTH_STATELESS", True)
+
+
+@pytest.mark.usefixtures("stateless")
+def test_stateless_claims_are_used_without_loading_the_user(engine: Engine, user: User) -> None:
+    token = create_access_token(build_token_claims(user))
+    # クレームの内容で認可するため、データベースの変更 (token_version 以外) は反映されない
+    update_user(engine, user.id, name="after")
+
+    principal = current_user(engine, token)
+    assert principal == UserPrincipal.from_user(user)
+    assert principal_cache.get(user.id) is None
+
+
+@pytest.mark.usefixtures("stateless")
+def test_stateless_token_is_revoked_by_token_version(engine: Engine, user: User) -> None:
+    token = create_access_token(build_token_claims(user))
+    current_user(engine, token)
+
+    update_user(engine, user.id, token_version=user.token_version + 1)
+    # token_version はキャッシュされるため、破棄されるまでは古い値で確認する
+    assert current_user(engine, token).id == user.id
+    invalidate_principal(user.id)
+
+    with pytest.raises(HTTPException) as e:
+        current_user(engine, token)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.usefixtures("stateless")
+def test_stateless_token_of_deleted_user_is_rejected(engine: Engine, user: User) -> None:
+    token = create_access_token(build_token_claims(user))
+    with DBSession(engine) as db:
+        db.delete(db.get(User, user.id))
+        db.commit()
+
+    with pytest.raises(HTTPException) as e:
+        current_user(engine, token)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.usefixtures("stateless")
+def test_stateless_token_with_invalid_role_is_rejected(engine: Engine, user: User) -> None:
+    token = create_access_token({**build_token_claims(user), "role": "superuser"})
+
+    with pytest.raises(HTTPException) as e:
+        current_user(engine, token)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
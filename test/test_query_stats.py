@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import OperationalError
+
+from api.app.database.instrumentation import QueryStats, instrument_engine, query_stats, statement_shape
+
+# 実行時間 (秒) と、p95 として返るヒストグラムの境界 (ミリ秒)
+FAST, FAST_BOUND_MS = 0.002, 5.0
+SLOW, SLOW_BOUND_MS = 0.3, 500.0
+FAST_RUNS = 3
+MAXSIZE = 2
+
+
+def test_statement_shape_collapses_literals_and_parameter_lists() -> None:
+    assert statement_shape("SELECT *\n  FROM user WHERE name = 'a''b' AND id = 42") == (
+        "SELECT * FROM user WHERE name = ? AND id = ?"
+    )
+    assert statement_shape("SELECT * FROM user WHERE id IN (?, ?, ?)") == statement_shape(
+        "SELECT * FROM user WHERE id IN (?, ?)"
+    )
+    assert statement_shape("INSERT INTO t (a) VALUES (?), (?), (?)") == "INSERT INTO t (a) VALUES (?)"
+
+
+def test_snapshot_ranks_shapes_by_total_time() -> None:
+    stats = QueryStats()
+    for _ in range(FAST_RUNS):
+        stats.record("fast", FAST, 1, "/a")
+    stats.record("slow", SLOW, -1, "/b", error=True)
+
+    snapshot = stats.snapshot()
+    assert snapshot["executions"] == FAST_RUNS + 1
+    slow, fast = snapshot["queries"]
+    assert slow["statement"] == "slow"
+    assert slow["errors"] == 1
+    assert slow["rows"] == 0
+    assert slow["p95_ms"] == SLOW_BOUND_MS
+    assert fast["count"] == FAST_RUNS
+    assert fast["rows"] == FAST_RUNS
+    assert fast["p95_ms"] == FAST_BOUND_MS
+    assert fast["routes"] == {"/a": FAST_RUNS}
+
+
+def test_evicts_least_recently_executed_shape() -> None:
+    stats = QueryStats(maxsize=MAXSIZE)
+    stats.record("a", FAST, 0, None)
+    stats.record("b", FAST, 0, None)
+    stats.record("a", FAST, 0, None)
+    stats.record("c", FAST, 0, None)
+
+    snapshot = stats.snapshot()
+    assert {query["statement"] for query in snapshot["queries"]} == {"a", "c"}
+    assert snapshot["evictions"] == 1
+
+
+@pytest.fixture
+def recorded() -> QueryStats:
+    query_stats.reset()
+    return query_stats
+
+
+def test_instrumented_engine_records_executions_and_errors(engine: Engine, recorded: QueryStats) -> None:
+    instrument_engine(engine)
+    instrument_engine(engine)  # 2 回登録しても重複して記録しない
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+
+    queries = {query["statement"]: query for query in recorded.snapshot()["queries"]}
+    assert queries["SELECT ?"]["count"] == 1
+    assert queries["SELECT * FROM missing_table"]["errors"] == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from api.app.middleware import rate_limit
+from api.app.middleware.rate_limit import LocalRateLimitStore, RateLimitRule, _next_tat, client_ip
+
+NOW = 1000.0
+LIMIT = 5
+PERIOD = 10.0
+RULE = RateLimitRule("test", LIMIT, PERIOD)
+MAX_KEYS = 2
+
+
+def test_first_request_is_allowed() -> None:
+    tat, retry_after = _next_tat(None, NOW, RULE)
+    assert retry_after == 0
+    assert tat == NOW + RULE.interval
+
+
+def test_burst_up_to_limit_then_deny() -> None:
+    tat = None
+    for _ in range(LIMIT):
+        tat, retry_after = _next_tat(tat, NOW, RULE)
+        assert retry_after == 0
+    denied_tat, retry_after = _next_tat(tat, NOW, RULE)
+    assert denied_tat == tat
+    assert retry_after == pytest.approx(RULE.interval)
+
+
+def test_retry_after_elapsed_is_allowed() -> None:
+    tat = None
+    for _ in range(LIMIT):
+        tat, _ = _next_tat(tat, NOW, RULE)
+    _, retry_after = _next_tat(tat, NOW, RULE)
+    _, retry_after_later = _next_tat(tat, NOW + retry_after, RULE)
+    assert retry_after_later == 0
+
+
+def test_past_tat_is_treated_as_full_bucket() -> None:
+    tat, retry_after = _next_tat(NOW - PERIOD * 2, NOW, RULE)
+    assert retry_after == 0
+    assert tat == NOW + RULE.interval
+
+
+def test_local_store_limits_per_key() -> None:
+    store = LocalRateLimitStore()
+
+    async def run() -> list[float]:
+        results = [await store.take("a", RULE) for _ in range(LIMIT + 1)]
+        results.append(await store.take("b", RULE))
+        return results
+
+    results = asyncio.run(run())
+    assert results[:LIMIT] == [0.0] * LIMIT
+    assert results[LIMIT] > 0
+    assert results[-1] == 0
+    assert store.stats()["limited"] == 1
+
+
+def test_local_store_evicts_oldest_key() -> None:
+    store = LocalRateLimitStore(max_keys=MAX_KEYS)
+
+    async def run() -> None:
+        for key in ("a", "b", "c"):
+            await store.take(key, RULE)
+
+    asyncio.run(run())
+    stats = store.stats()
+    assert stats["keys"] == MAX_KEYS
+    assert stats["evictions"] == 1
+
+
+def test_client_ip_uses_forwarded_only_when_trusted(monkeypatch: pytest.MonkeyPatch) -> None:
+    scope = {"client": ("203.0.113.1", 1234)}
+    headers = {b"x-forwarded-for": b"192.0.2.9, 198.51.100.7"}
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_TRUST_FORWARDED", False)
+    assert client_ip(scope, headers) == "203.0.113.1"
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_TRUST_FORWARDED", True)
+    assert client_ip(scope, headers) == "198.51.100.7"
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, status
+from sqlalchemy import Engine, update
+from sqlmodel import Session as DBSession
+from sqlmodel import select
+
+from api.app.models import RefreshToken, User
+from api.app.security.refresh_token import (
+    hash_refresh_token,
+    issue_refresh_token,
+    new_family_id,
+    purge_expired_refresh_tokens,
+    revoke_user_refresh_tokens,
+    rotate_refresh_token,
+)
+
+
+@pytest.fixture
+def user(engine: Engine) -> User:
+    user = User(email="user@example.com", password="hashed-password")
+    with DBSession(engine, expire_on_commit=False) as db:
+        db.add(user)
+        db.commit()
+    return user
+
+
+def issue(engine: Engine, user: User, family_id: str | None = None) -> str:
+    return asyncio.run(issue_refresh_token(engine, user.id, family_id or new_family_id()))
+
+
+def rotate(engine: Engine, token: str) -> tuple[User, str, str]:
+    return asyncio.run(rotate_refresh_token(engine, token))
+
+
+def assert_rejected(engine: Engine, token: str) -> None:
+    with pytest.raises(HTTPException) as e:
+        rotate(engine, token)
+    assert e.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def revoked_flags(engine: Engine, family_id: str) -> list[bool]:
+    with DBSession(engine) as db:
+        return list(db.exec(select(RefreshToken.revoked).where(RefreshToken.family_id == family_id)).all())
+
+
+def test_rotation_replaces_token_in_the_same_family(engine: Engine, user: User) -> None:
+    family_id = new_family_id()
+    token = issue(engine, user, family_id)
+
+    owner, new_token, new_family = rotate(engine, token)
+
+    assert owner.id == user.id
+    assert new_token != token
+    assert new_family == family_id
+    # 新しいトークンでもう一度ローテーションできる
+    rotate(engine, new_token)
+
+
+def test_reuse_revokes_the_whole_family(engine: Engine, user: User) -> None:
+    family_id = new_family_id()
+    token = issue(engine, user, family_id)
+    _, new_token, _ = rotate(engine, token)
+    other_family = new_family_id()
+    other_token = issue(engine, user, other_family)
+
+    # 使用済みのトークンが再び使われた場合は盗用とみなす
+    assert_rejected(engine, token)
+
+    assert all(revoked_flags(engine, family_id))
+    assert_rejected(engine, new_token)
+    # 別の系列 (別の端末でのログイン) は失効しない
+    assert not any(revoked_flags(engine, other_family))
+    rotate(engine, other_token)
+
+
+def test_unknown_and_expired_tokens_are_rejected(engine: Engine, user: User) -> None:
+    assert_rejected(engine, "unknown-token")
+
+    token = issue(engine, user)
+    with DBSession(engine) as db:
+        db.exec(
+            update(RefreshToken)
+            .where(RefreshToken.token_hash == hash_refresh_token(token))
+            .values(expires_at=datetime.now() - timedelta(seconds=1))
+        )
+        db.commit()
+    assert_rejected(engine, token)
+
+
+def test_revoke_user_refresh_tokens(engine: Engine, user: User) -> None:
+    tokens = [issue(engine, user), issue(engine, user)]
+
+    assert asyncio.run(revoke_user_refresh_tokens(engine, user.id)) == len(tokens)
+    for token in tokens:
+        assert_rejected(engine, token)
+
+
+def test_purge_deletes_only_expired_tokens(engine: Engine, user: User) -> None:
+    expired = issue(engine, user)
+    issue(engine, user)
+    with DBSession(engine) as db:
+        db.exec(
+            update(RefreshToken)
+            .where(RefreshToken.token_hash == hash_refresh_token(expired))
+            .values(expires_at=datetime.now() - timedelta(seconds=1))
+        )
+        db.commit()
+
+    assert asyncio.run(purge_expired_refresh_tokens(engine)) == 1
+    with DBSession(engine) as db:
+        assert len(db.exec(select(RefreshToken)).all()) == 1
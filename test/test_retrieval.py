@@ -0,0 +1,63 @@
+import asyncio
+from collections.abc import Iterator
+
+import pytest
+
+from api.app.chat.retrieval import GROUNDING_HEADER, retrieve_grounding
+from api.app.vector_store.chunking import chunk_document
+from api.app.vector_store.client import InMemoryVectorStore, SearchHit, set_vector_store
+from api.app.vector_store.embeddings import HashingEmbedder
+from api.app.vector_store.local_index import LocalVectorIndex
+
+DIM = 64
+CHUNK_SIZE = 40
+ENTRANCE_ID = 1
+CLUB_ID = 2
+
+
+class FailingIndex(LocalVectorIndex):
+    def search(self, query: str, k: int) -> list[SearchHit]:
+        raise RuntimeError("embedding service unavailable")
+
+
+@pytest.fixture(autouse=True)
+def reset_store() -> Iterator[None]:
+    yield
+    set_vector_store(None)
+
+
+def make_index(cls: type[LocalVectorIndex] = LocalVectorIndex) -> LocalVectorIndex:
+    index = cls(HashingEmbedder(DIM), f"hashing-{DIM}", None)
+    index.upsert_chunks(ENTRANCE_ID, "入学", chunk_document("# 入学\n入学式は4月に行います。", CHUNK_SIZE))
+    index.upsert_chunks(CLUB_ID, "部活動", chunk_document("# 部活動\n部活動は放課後に行います。", CHUNK_SIZE))
+    return index
+
+
+def test_local_index_hits_are_prepended_as_context() -> None:
+    set_vector_store(make_index())
+    grounding = asyncio.run(retrieve_grounding("入学式はいつですか", k=1))
+    assert grounding.document_ids == [ENTRANCE_ID]
+    [(role, text)] = grounding.conversation
+    assert role == "system"
+    assert text.startswith(GROUNDING_HEADER)
+    assert "入学式は4月に行います。" in text
+
+
+def test_store_without_search_adds_nothing() -> None:
+    # cosmos (sc_system_ai が自身で検索する) と同じく、検索に対応していないストアでは何も追加しない
+    set_vector_store(InMemoryVectorStore())
+    grounding = asyncio.run(retrieve_grounding("入学式はいつですか"))
+    assert grounding.conversation == []
+    assert grounding.document_ids == []
+
+
+def test_search_failure_does_not_fail_chat() -> None:
+    set_vector_store(make_index(FailingIndex))
+    grounding = asyncio.run(retrieve_grounding("入学式はいつですか"))
+    assert grounding.conversation == []
+    assert grounding.document_ids == []
+
+
+def test_disabled_when_k_is_zero() -> None:
+    set_vector_store(make_index())
+    assert asyncio.run(retrieve_grounding("入学式はいつですか", k=0)).conversation == []
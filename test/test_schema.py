@@ -0,0 +1,25 @@
+from sqlalchemy import Engine, inspect, text
+
+from api.app.database.schema import ADDED_COLUMNS, migrate_schema
+
+
+def column_names(engine: Engine, table_name: str) -> set[str]:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def test_adds_missing_columns_to_existing_tables(engine: Engine) -> None:
+    # 列を追加する前に作成されたデータベースを再現する
+    with engine.begin() as conn:
+        for model, name, _ in ADDED_COLUMNS:
+            conn.execute(text(f'ALTER TABLE "{model.__tablename__}" DROP COLUMN {name}'))
+
+    added = migrate_schema(engine)
+
+    assert added == [f"{model.__tablename__}.{name}" for model, name, _ in ADDED_COLUMNS]
+    for model, name, _ in ADDED_COLUMNS:
+        assert name in column_names(engine, model.__tablename__)
+
+
+def test_is_idempotent(engine: Engine) -> None:
+    assert migrate_schema(engine) == []
+    assert migrate_schema(engine) == []
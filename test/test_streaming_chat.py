@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+from collections.abc import Iterator
+
+import pytest
+
+from api.app.chat.streaming import ThreadedStream, format_ndjson, format_sse
+from api.app.executor import AI_POOL
+
+WAIT = 5.0
+
+
+class Upstream:
+    """チャンクを出し続ける同期ジェネレータ。close されたかどうかを記録する。"""
+
+    def __init__(self) -> None:
+        self.closed = threading.Event()
+
+    def __call__(self) -> Iterator[int]:
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+                time.sleep(0.001)
+        finally:
+            self.closed.set()
+
+
+def test_yields_chunks_in_order() -> None:
+    async def run() -> list[str]:
+        return [chunk async for chunk in ThreadedStream(AI_POOL, lambda: iter(["a", "b", "c"]))]
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+
+
+def test_upstream_error_is_raised() -> None:
+    def fail() -> Iterator[str]:
+        yield "a"
+        raise ValueError("boom")
+
+    async def run() -> None:
+        async for _ in ThreadedStream(AI_POOL, fail):
+            pass
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(run())
+
+
+def test_leaving_the_loop_closes_upstream() -> None:
+    upstream = Upstream()
+
+    async def run() -> None:
+        stream = ThreadedStream(AI_POOL, upstream)
+        future = stream.start()
+        iterator = aiter(stream)
+        assert await anext(iterator) == 0
+        await iterator.aclose()
+        await asyncio.wait_for(future, WAIT)
+
+    asyncio.run(run())
+    assert upstream.closed.is_set()
+
+
+def test_cancel_before_iteration_releases_worker() -> None:
+    # クライアントが本文の送信前に切断した場合、反復は始まらず BackgroundTask の cancel のみが呼ばれる
+    upstream = Upstream()
+
+    async def run() -> None:
+        stream = ThreadedStream(AI_POOL, upstream)
+        future = stream.start()
+        stream.cancel()
+        await asyncio.wait_for(future, WAIT)
+
+    asyncio.run(run())
+    assert upstream.closed.is_set()
+
+
+def test_formats() -> None:
+    assert format_sse("delta", "a\nb") == "event: delta\ndata: a\ndata: b\n\n"
+    assert format_sse("done", {"id": 1}) == 'event: done\ndata: {"id": 1}\n\n'
+    assert format_ndjson("delta", "あ") == '{"type": "delta", "data": "あ"}\n'
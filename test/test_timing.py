@@ -0,0 +1,64 @@
+import re
+
+import pytest
+from fastapi import Depends, FastAPI, status
+from fastapi.testclient import TestClient
+
+from api.app.executor import DB_POOL, run_in_pool
+from api.app.middleware.timing import RequestTimings, ServerTimingMiddleware, record_timing, span, timed
+
+DB_SECONDS = 0.002
+
+
+@timed("auth")
+async def current_user() -> str:
+    return "user"
+
+
+def query() -> None:
+    # DB 用のワーカースレッドから記録した区間もリクエストに集計される
+    record_timing("db", DB_SECONDS)
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/chat")
+    async def chat(user: str = Depends(current_user)) -> dict:
+        await run_in_pool(DB_POOL, query)
+        await run_in_pool(DB_POOL, query)
+        with span("llm"):
+            pass
+        return {"user": user}
+
+    return app
+
+
+def parse(header: str) -> dict[str, float]:
+    return {name: float(ms) for name, ms in re.findall(r"(\w+);dur=([\d.]+)", header)}
+
+
+def test_server_timing_header_lists_spans_and_total() -> None:
+    with TestClient(make_app()) as client:
+        response = client.get("/chat")
+
+    assert response.status_code == status.HTTP_200_OK
+    metrics = parse(response.headers["server-timing"])
+    assert list(metrics) == ["auth", "db", "llm", "total"]
+    # 同じ名前の区間は合計する
+    assert metrics["db"] == pytest.approx(DB_SECONDS * 2 * 1000)
+
+
+def test_spans_are_ignored_outside_a_request() -> None:
+    with span("llm"):
+        record_timing("db", DB_SECONDS)
+
+
+def test_summary_sums_entries_in_first_seen_order() -> None:
+    timings = RequestTimings()
+    timings.add("db", DB_SECONDS)
+    timings.add("llm", DB_SECONDS)
+    timings.add("db", DB_SECONDS)
+    assert list(timings.summary()) == ["db", "llm"]
+    assert timings.summary()["db"] == pytest.approx(DB_SECONDS * 2 * 1000)
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from sqlalchemy import Engine
+from sqlmodel import Session as DBSession
+from sqlmodel import select
+
+from api.app.database.database import add_db_record
+from api.app.database.unit_of_work import current_unit_of_work, unit_of_work
+from api.app.models import Session
+
+USER_ID = "user-1"
+
+
+def session_names(engine: Engine) -> list[str]:
+    with DBSession(engine) as db:
+        return list(db.exec(select(Session.session_name).order_by(Session.id)).all())
+
+
+def test_commits_all_writes_together(engine: Engine) -> None:
+    async def run() -> None:
+        async with unit_of_work(engine) as uow:
+            first = Session(session_name="a", user_id=USER_ID)
+            await add_db_record(engine, first)
+            # flush 済みのため、コミット前でも主キーが採番されている
+            assert first.id is not None
+            await add_db_record(engine, Session(session_name="b", user_id=USER_ID))
+            assert current_unit_of_work() is uow
+        assert current_unit_of_work() is None
+
+    asyncio.run(run())
+    assert session_names(engine) == ["a", "b"]
+
+
+def test_rolls_back_on_error(engine: Engine) -> None:
+    async def run() -> None:
+        async with unit_of_work(engine):
+            await add_db_record(engine, Session(session_name="a", user_id=USER_ID))
+            raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(run())
+    assert session_names(engine) == []
+
+
+def test_after_commit_runs_outside_the_transaction(engine: Engine) -> None:
+    seen: list[str] = []
+
+    async def run() -> None:
+        async def callback() -> None:
+            # コミット後の書き込みは Unit of Work に参加せず、単独でコミットされる
+            assert current_unit_of_work() is None
+            seen.append("async")
+            await add_db_record(engine, Session(session_name="after", user_id=USER_ID))
+
+        async with unit_of_work(engine) as uow:
+            await add_db_record(engine, Session(session_name="a", user_id=USER_ID))
+            uow.after_commit(lambda: seen.append("sync"))
+            uow.after_commit(callback)
+            assert seen == []
+
+    asyncio.run(run())
+    assert seen == ["sync", "async"]
+    assert session_names(engine) == ["a", "after"]
+
+
+def test_after_commit_is_dropped_on_rollback(engine: Engine) -> None:
+    seen: list[str] = []
+
+    async def run() -> None:
+        async with unit_of_work(engine) as uow:
+            uow.after_commit(lambda: seen.append("called"))
+            raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(run())
+    assert seen == []
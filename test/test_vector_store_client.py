@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import Engine
+
+from api.app.vector_store.client import (
+    InMemoryVectorStore,
+    init_vector_store,
+    set_vector_store,
+    warm_up_vector_store,
+)
+
+
+class Container:
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.reads = 0
+
+    def read(self) -> dict:
+        self.reads += 1
+        if self.error is not None:
+            raise self.error
+        return {"id": "school_info"}
+
+
+class CosmosLikeStore(InMemoryVectorStore):
+    """コンテナのクライアントを _container に保持するストア (CosmosDBManager と同じ構造)。"""
+
+    def __init__(self, container: Container) -> None:
+        super().__init__()
+        self._container = container
+
+
+@pytest.fixture(autouse=True)
+def reset_store() -> Iterator[None]:
+    yield
+    set_vector_store(None)
+
+
+def test_warm_up_reads_the_container_once() -> None:
+    container = Container()
+    assert warm_up_vector_store(CosmosLikeStore(container))
+    assert container.reads == 1
+
+
+def test_warm_up_is_skipped_for_stores_without_a_connection() -> None:
+    assert not warm_up_vector_store(InMemoryVectorStore())
+
+
+def test_startup_logs_warm_up_failure(engine: Engine, caplog: pytest.LogCaptureFixture) -> None:
+    container = Container(ConnectionError("unreachable"))
+    set_vector_store(CosmosLikeStore(container))
+
+    with caplog.at_level(logging.WARNING, logger="api.app.vector_store.client"):
+        asyncio.run(init_vector_store(engine))
+
+    assert container.reads == 1
+    assert "Vector store warm-up failed: CosmosLikeStore: unreachable" in caplog.text